@@ -1,4 +1,4 @@
-import lldb
+from utils import get_symbol_index
 
 def jump_to_symbol(debugger, command, result, internal_dict):
     target = debugger.GetSelectedTarget()
@@ -6,19 +6,13 @@ def jump_to_symbol(debugger, command, result, internal_dict):
         result.SetError("No target selected.")
         return
 
-    # Iterate over all modules in the target to find the symbol
-    for module in target.module_iter():
-        symbol = module.FindSymbol(command)
-        if symbol.IsValid():
-            break
-    else:
+    # Look up the symbol in the persistent symbol index shared with lldbinit
+    addresses = get_symbol_index().find(command, target)
+    if not addresses:
         result.SetError("Symbol not found.")
         return
 
-    addr = symbol.GetStartAddress().GetLoadAddress(target)
-    if addr == lldb.LLDB_INVALID_ADDRESS:
-        result.SetError("Invalid address for symbol.")
-        return
+    addr = addresses[0]
 
     process = target.GetProcess()
     if not process:
@@ -10,6 +10,7 @@ import time
 import argparse
 import subprocess
 import tempfile
+import json
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 from utils import *
@@ -58,8 +59,6 @@ arm_type = "thumbv7-apple-ios"
 
 GlobalListOutput = []
 
-Int3Dictionary: Dict[int, int] = {}
-
 flag_regs = ('rflags', 'eflags', 'cpsr')
 segment_regs = ("cs", "ds", "es", "gs", "fs", "ss", "cs", "gs", "fs")
 
@@ -91,6 +90,18 @@ aarch64_registers = [
 
 MACOS_VMMAP = MacOSVMMapCache()
 XNU_ZONES = XNUZones()
+MEMORY_SNAPSHOTS: Dict[str, MemorySnapshot] = {}
+ZONE_CENSUSES: Dict[str, ZoneCensus] = {}
+USER_ADDRESS_SPACE: Optional[Tuple[ProcInfo, UserAddressSpace]] = None
+COVERAGE_SESSION: Optional[CoverageSession] = None
+TRACE_SITES: Dict[int, TraceSite] = {}
+TRACE_BUFFER = TraceBuffer()
+BREAKPOINT_CONDITIONS: Dict[int, BreakpointCondition] = {}
+RECORDING_TRACE = False
+REPLAY_TRACE: Optional[InstructionTraceReader] = None
+REPLAY_STEP = 0
+# register values shown at the previous replay step, kept apart from old_register
+REPLAY_OLD_REGISTER: Dict[str, int] = {}
 SelectedVM = ''
 
 def is_in_Xcode() -> bool:
@@ -151,6 +162,9 @@ def __lldb_init_module(debugger: SBDebugger, internal_dict: Dict):
 	ci.HandleCommand("command script add -f lldbinit.cmd_dq dq", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_DumpInstructions u", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_findmem findmem", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_memsnap memsnap", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_memimage memimage", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_gdbfast gdbfast", res)
 	#
 	# ObjectiveC commands
 	#
@@ -166,6 +180,7 @@ def __lldb_init_module(debugger: SBDebugger, internal_dict: Dict):
 	#
 	ci.HandleCommand("command script add -f lldbinit.cmd_pattern_create pattern_create", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_pattern_offset pattern_offset", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_pattern_search pattern_search", res)
 	#
 	# Settings related commands
 	#
@@ -182,10 +197,13 @@ def __lldb_init_module(debugger: SBDebugger, internal_dict: Dict):
 	#
 	ci.HandleCommand("command script add -f lldbinit.cmd_m_bp mbp", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_to_ida_addr toida", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_idaconv idaconv", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_bhb bhb", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_bht bht", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_bpt bpt", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_bpn bpn", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_bpsym bpsym", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_symfind symfind", res)
 	# disable a breakpoint or all
 	ci.HandleCommand("command script add -f lldbinit.cmd_bpd bpd", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_bpda bpda", res)
@@ -201,6 +219,7 @@ def __lldb_init_module(debugger: SBDebugger, internal_dict: Dict):
 	ci.HandleCommand("command script add -f lldbinit.cmd_listint3 listint3", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_nop nop", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_null null", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_patch patch", res)
 	# change eflags commands
 	ci.HandleCommand("command script add -f lldbinit.cmd_cfa cfa", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_cfc cfc", res)
@@ -215,9 +234,14 @@ def __lldb_init_module(debugger: SBDebugger, internal_dict: Dict):
 	ci.HandleCommand("command script add -f lldbinit.cmd_skip skip", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_stepo stepo", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_si si", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_record record", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_replay replay", res)
 	# load breakpoints from file
 	ci.HandleCommand("command script add -f lldbinit.cmd_LoadBreakPoints lb", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_LoadBreakPointsRva lbrva", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_cov cov", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_trace trace", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_bpcond bpcond", res)
 	
 	# alias for existing breakpoint commands
 	# list all breakpoints
@@ -249,6 +273,7 @@ def __lldb_init_module(debugger: SBDebugger, internal_dict: Dict):
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_read_usr_addr readuseraddr", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_set_kdp_pmap setkdp", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_reset_kdp_pmap resetkdp", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_user_address_space useras", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_kdp_reboot kdp-reboot", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_show_bootargs showbootargs", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_panic_log panic_log", res)
@@ -261,12 +286,14 @@ def __lldb_init_module(debugger: SBDebugger, internal_dict: Dict):
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_show_chunk_at zone_show_chunk_at", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_show_chunk_with_regex zone_find_chunk_with_regex", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_find_chunk zone_find_chunk", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_zone_census zone_census", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_zone_backtrace_at zone_backtrace_at", res)
 	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_zone_reload zone_reload", res)
 
 	# # xnu port commands
 	# ci.HandleCommand("command script add -f lldbinit.cmd_xnu_show_ipc_task_port showtaskipc", res)
-	# ci.HandleCommand("command script add -f lldbinit.cmd_xnu_show_ports showports", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_show_ports showports", res)
+	ci.HandleCommand("command script add -f lldbinit.cmd_xnu_port_holders portholders", res)
 
 	# xnu iokit commands
 	ci.HandleCommand("command script add -f lldbinit.cmd_iokit_print iokit_print", res)
@@ -303,6 +330,9 @@ def cmd_lldbinitcmds(debugger: SBDebugger, command: str, result: SBCommandReturn
 		[ "contextcodesize", "set number of instruction lines in code window" ],
 		[ "b", "breakpoint address" ],
 		[ "bpt", "set a temporary software breakpoint" ],
+		[ "bpsym", "set breakpoints on symbols by name, prefix or regex through the symbol index" ],
+		[ "symfind", "find symbols by name, prefix or regex through the symbol index" ],
+		[ "idaconv", "convert a file of addresses between IDA mapping and ASLR addresses" ],
 		[ "bhb", "set an hardware breakpoint" ],
 		[ "bpc", "clear breakpoint" ],
 		[ "bpca", "clear all breakpoints" ],
@@ -320,11 +350,20 @@ def cmd_lldbinitcmds(debugger: SBDebugger, command: str, result: SBCommandReturn
 		[ "listint3", "list all INT3 patched addresses" ],
 		[ "nop", "patch memory address with NOP" ],
 		[ "null", "patch memory address with NULL" ],
+		[ "patch", "write, list, revert and re-apply memory patches" ],
+		[ "record", "single step N instructions and save registers to a trace file" ],
+		[ "replay", "browse a recorded instruction trace with the context view" ],
 		[ "stepo", "step over calls and loop instructions" ],
-		[ "lb", "load breakpoints from file and apply them (currently only func names are applied)" ],
+		[ "lb", "load breakpoints from file and apply them (names, addresses, module offsets)" ],
 		[ "lbrva", "load breakpoints from file and apply to main executable, only RVA in this case" ],
+		[ "cov", "collect basic block coverage of a module and save it as drcov" ],
+		[ "trace", "tracepoints that record registers and memory without stopping" ],
+		[ "bpcond", "breakpoint conditions written in python, evaluated without the expression parser" ],
 		[ "db/dw/dd/dq", "memory hex dump in different formats" ],
 		[ "findmem", "search memory" ],
+		[ "memsnap", "save memory page snapshots and diff them between stops" ],
+		[ "memimage", "dump memory to an image file and debug it offline" ],
+		[ "gdbfast", "read memory over a pipelined gdb-remote connection" ],
 		[ "cfa/cfc/cfd/cfi/cfo/cfp/cfs/cft/cfz", "change CPU flags" ],
 		[ "u", "dump instructions" ],
 		[ "iphone", "connect to debugserver running on iPhone" ],
@@ -340,6 +379,7 @@ def cmd_lldbinitcmds(debugger: SBDebugger, command: str, result: SBCommandReturn
 		[ 'xinfo', 'find address belong to image'],
 		[ 'pattern_create', 'create cyclic string'],
 		[ 'pattern_offset', 'find offset in cyclic string'],
+		[ 'pattern_search', 'find cyclic string fragments in registers and memory around SP'],
 		
 		[ 'addkext', 'add an existed kext into kernel debug session'],
 		[ 'showallkexts', 'show all loaded kexts (only for xnu kernel debug)'],
@@ -350,6 +390,7 @@ def cmd_lldbinitcmds(debugger: SBDebugger, command: str, result: SBCommandReturn
 		[ 'readuseraddr', 'read userspace address (only for xnu kernel debug with kdp-remote)'],
 		[ 'setkdp', 'set kdp_pmap (only for xnu kernel debug with kdp-remote)'],
 		[ 'resetkdp', 'reset kdp_pmap (only for xnu kernel debug with kdp-remote)'],
+		[ 'useras', 'read/write memory of a process address space (only for xnu kernel debug with kdp-remote)'],
 		[ 'showbootargs', 'show boot-args of macOS'],
 		[ 'kdp-reboot', 'reboot the remote machine'],
 		[ 'panic_log', 'show panic log'],
@@ -360,10 +401,12 @@ def cmd_lldbinitcmds(debugger: SBDebugger, command: str, result: SBCommandReturn
 		[ 'zone_inspect', 'list all chunk in specific zone with their status'],
 		[ 'zone_show_chunk_at', 'find chunk address is freed or not'],
 		[ 'zone_find_chunk', 'find location of chunk address'],
+		[ 'zone_census', 'save allocated/free elements of zones and diff them between stops'],
 		[ 'zone_show_chunk_with_regex', 'find location of chunk address by using regex'],
 		[ 'zone_backtrace_at', 'list callstack of chunk if btlog is enabled'],
-		[ 'zone_reload', 'reload zone if network connection is failed'],
+		[ 'zone_reload', 'reload zone if network connection is failed, -f to rebuild the zone table'],
 		[ 'showports', 'Show all ports of given process name'],
+		[ 'portholders', 'Show receiver and tasks holding rights to given port'],
 		[ 'iokit_print', 'Display readable iokit object of given address'],
 		[ 'iokit_type', 'Get type of iokit object of given address'],
 
@@ -566,13 +609,7 @@ def cmd_m_bp(debugger: SBDebugger, command: str, result: SBCommandReturnObject,
 		result.PutCString('Module {0} is not found'.format(module_name))
 		return
 
-	text_section = get_text_section(target_module)
-	file_base_addr = text_section.file_addr # get default address of module in file
-	offset = ida_mapped_addr - file_base_addr
-
-	base_addr = text_section.GetLoadAddress(cur_target) # get ASLR address when module is loaded
-	target_addr = base_addr + offset
-
+	target_addr = ida_to_load_address(cur_target, target_module, ida_mapped_addr)
 	cur_target.BreakpointCreateByAddress(target_addr)
 
 	result.PutCString('Done')
@@ -593,16 +630,74 @@ def cmd_to_ida_addr(debugger: SBDebugger, command: str, result: SBCommandReturnO
 		result.PutCString('Module {0} is not found'.format(module_name))
 		return
 	
-	text_section = get_text_section(target_module)
-
-	aslr_base_addr = text_section.GetLoadAddress(cur_target) # get ASLR address when module is loaded
-	offset = aslr_mapped_addr - aslr_base_addr
-	
-	ida_base_addr = text_section.file_addr # get default address of module in file
-	ida_mapped_addr = ida_base_addr + offset
+	ida_mapped_addr = load_to_ida_address(cur_target, target_module, aslr_mapped_addr)
 
 	result.PutCString('[+] Ida mapped address of {0} : {1}'.format(module_name, hex(ida_mapped_addr)))
 
+def cmd_idaconv(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Convert a file of addresses between IDA mapping and ASLR. Use \'idaconv help\' for more information.'''
+	help = """
+Convert a list of addresses between IDA default mapping and ASLR addresses in one pass.
+
+Syntax: idaconv toload <file> [-m <module>] [-o <output file>]
+        idaconv toida <file> [-m <module>] [-o <output file>]
+
+Each line is "[<module>] <hex address>", -m sets the module of lines without one.
+toida finds the module containing the address when none is given.
+toload writes "0x<address>" lines, toida writes "<module> 0x<address>" lines,
+both can be loaded with lb.
+"""
+
+	cmd = command.split()
+	if len(cmd) < 2 or cmd[0] not in ("toload", "toida"):
+		print(help)
+		return
+
+	module_name = ""
+	output_file = ""
+	args = cmd[2:]
+	for opt in ("-m", "-o"):
+		if opt not in args:
+			continue
+		idx = args.index(opt)
+		if idx + 1 >= len(args):
+			print("[-] error: missing value of {0}.".format(opt))
+			return
+		if opt == "-m":
+			module_name = args[idx + 1]
+		else:
+			output_file = args[idx + 1]
+		del args[idx:idx + 2]
+
+	try:
+		with open(cmd[1], "r") as f:
+			lines = f.readlines()
+	except OSError:
+		print("[-] error: failed to load file: {0}".format(cmd[1]))
+		return
+
+	target = get_target()
+	translator = get_address_translator()
+	if module_name and translator.find_module(target, module_name) == None:
+		print("[-] error: module {0} is not found.".format(module_name))
+		return
+
+	translated, unresolved = translator.translate_lines(target, lines, cmd[0] == "toida", module_name)
+	if output_file:
+		try:
+			with open(output_file, "w") as f:
+				f.write("\n".join(translated) + "\n")
+		except OSError as err:
+			print("[-] error: failed to write {0}: {1}".format(output_file, err))
+			return
+	else:
+		for line in translated:
+			print(line)
+
+	print("[+] Converted {0} addresses{1}.".format(len(translated), " to " + output_file if output_file else ""))
+	for line in unresolved:
+		print("[-] Unresolved: {0}".format(line))
+
 # temporary software breakpoint
 def cmd_bpt(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	'''Set a temporary software breakpoint. Use \'bpt help\' for more information.'''
@@ -638,6 +733,95 @@ Note: expressions supported, do not use spaces between operators.
 
 	print("[+] Set temporary breakpoint at 0x{:x}".format(value))
 	
+def find_indexed_symbols(args: List[str]) -> Optional[List[Tuple[str, int]]]:
+	'''Query the symbol index with [-p|-r] <query>, None if the query is invalid'''
+	if len(args) == 0:
+		return None
+
+	symbol_index = get_symbol_index()
+	if args[0] in ("-p", "-r"):
+		if len(args) < 2:
+			return None
+		if args[0] == "-p":
+			return symbol_index.find_prefix(args[1])
+		try:
+			return symbol_index.find_regex(args[1])
+		except re.error as err:
+			print("[-] error: invalid regex: {0}".format(err))
+			return None
+
+	return [(args[0], address) for address in symbol_index.find(args[0])]
+
+def cmd_bpsym(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Set breakpoints on symbols found in the symbol index. Use \'bpsym help\' for more information.'''
+	help = """
+Set a breakpoint on every address of the symbols matching the query.
+
+Syntax: bpsym <name>
+        bpsym -p <prefix>
+        bpsym -r <regex>
+
+The symbol index is built on first use and saved by module UUID in ~/.cache/lldbinit/symbols.
+"""
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	symbols = find_indexed_symbols(cmd)
+	if symbols == None:
+		print("[-] error: invalid query.")
+		print(help)
+		return
+	if not symbols:
+		print("[-] error: no symbols found.")
+		return
+
+	target = get_target()
+	for name, address in symbols:
+		breakpoint: SBBreakpoint = target.BreakpointCreateByAddress(address)
+		if breakpoint.IsValid():
+			print("[+] Breakpoint {0} at 0x{1:x} {2}".format(breakpoint.GetID(), address, name))
+
+def cmd_symfind(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Find symbols in the symbol index. Use \'symfind help\' for more information.'''
+	help = """
+Find symbols by exact name, prefix or regex.
+
+Syntax: symfind <name>
+        symfind -p <prefix>
+        symfind -r <regex>
+        symfind -a <address>
+
+-a shows the symbol containing <address>.
+Note: expressions supported, do not use spaces between operators.
+"""
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	if cmd[0] == "-a":
+		address = evaluate(cmd[1]) if len(cmd) > 1 else 0
+		name, offset = get_symbol_index().symbolicate(address) if address else ("", 0)
+		if not name:
+			print("[-] error: no symbol found.")
+			return
+		print("0x{0:x} {1}+0x{2:x}".format(address, name, offset))
+		return
+
+	symbols = find_indexed_symbols(cmd)
+	if symbols == None:
+		print("[-] error: invalid query.")
+		print(help)
+		return
+
+	for name, address in symbols:
+		print("0x{0:x} {1}".format(address, name))
+	print("[+] Found {0} symbols.".format(len(symbols)))
+
 # hardware breakpoint
 def cmd_bhb(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	'''Set an hardware breakpoint'''
@@ -811,9 +995,9 @@ Note: control flow is not respected, it advances to next instruction in memory.
 	next_addr = start_addr + get_inst_size(start_addr)
 	
 	if is_x64():
-		get_frame().reg["rip"].value = format(next_addr, '#x')
+		write_register("rip", next_addr)
 	elif is_i386():
-		get_frame().reg["eip"].value = format(next_addr, '#x')
+		write_register("eip", next_addr)
 	# show the updated context
 	debugger.HandleCommand("context")
 
@@ -830,8 +1014,6 @@ Note: ARM not yet supported.
 Note: expressions supported, do not use spaces between operators.
 """
 
-	global Int3Dictionary
-
 	cmd = command.split()
 	# if empty insert a int3 at current PC
 	if len(cmd) == 0:
@@ -856,21 +1038,13 @@ Note: expressions supported, do not use spaces between operators.
 		print(help)
 		return
 	
-	bytes_string = read_mem(int3_addr, 1)
-	if not len(bytes_string):
-		print("[-] error: Failed to read memory at 0x{:x}.".format(int3_addr))
-		return
-
-	bytes_read = bytearray(bytes_string)
-	
-	patch_byte = b'\xCC'
-	if write_mem(int3_addr, patch_byte) == 0:
-		print("[-] error: Failed to write memory at 0x{:x}.".format(int3_addr))
+	# original byte is saved in patch journal for later restore
+	try:
+		get_patch_manager().add(int3_addr, b'\xCC', 'int3')
+	except PatchException as err:
+		print("[-] error: {0}".format(err))
 		return
 
-	# save original bytes for later restore
-	Int3Dictionary[int3_addr] = bytes_read[0]
-
 	print("[+] Patched INT3 at 0x{:x}".format(int3_addr))
 
 def cmd_rint3(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
@@ -883,8 +1057,6 @@ Syntax: rint3 [<address>]
 Note: expressions supported, do not use spaces between operators.
 """
 
-	global Int3Dictionary
-	
 	cmd = command.split()
 	# if empty insert a int3 at current PC
 	if len(cmd) == 0:
@@ -908,7 +1080,9 @@ Note: expressions supported, do not use spaces between operators.
 		print(help)
 		return
 
-	if len(Int3Dictionary) == 0:
+	patch_manager = get_patch_manager()
+	int3_patches = [patch for patch in patch_manager.patches.values() if patch.kind == 'int3']
+	if len(int3_patches) == 0:
 		print("[-] error: No INT3 patched addresses to restore available.")
 		return
 	
@@ -916,25 +1090,14 @@ Note: expressions supported, do not use spaces between operators.
 	if not len(bytes_string):
 		print("[-] error: Failed to read memory at 0x{:x}.".format(int3_addr))
 		return
-		
-	bytes_read = bytearray(bytes_string)
-
-	if bytes_read[0] == 0xCC:
-		#print("Found byte patched byte at 0x{:x}".format(int3_addr))
-		
-		try:
-			original_byte = Int3Dictionary[int3_addr]
-		except:
-			print("[-] error: Original byte for address 0x{:x} not found.".format(int3_addr))
-			return
 
-		if write_mem(int3_addr, bytearray([original_byte])) == 0:
-			print("[-] error: Failed to write memory at 0x{:x}.".format(int3_addr))
-			return
-		# remove element from original bytes list
-		del Int3Dictionary[int3_addr]
-	else:
+	patch = patch_manager.find(int3_addr, 'int3')
+	if bytes_string[0] != 0xCC or patch == None:
 		print("[-] error: No INT3 patch found at 0x{:x}.".format(int3_addr))
+		return
+
+	if patch_manager.remove([patch.patch_id]):
+		print("[-] error: Failed to write memory at 0x{:x}.".format(int3_addr))
 
 
 def cmd_listint3(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
@@ -955,13 +1118,18 @@ Syntax: listint3
 		print(help)
 		return
 
-	if len(Int3Dictionary) == 0:
+	patch_manager = get_patch_manager()
+	int3_patches = [patch for patch in patch_manager.patches.values() if patch.kind == 'int3']
+	# patches of other processes or unloaded modules don't belong to this target
+	unresolved, _ = patch_manager.sync(int3_patches)
+	int3_patches = [patch for patch in int3_patches if patch not in unresolved]
+	if len(int3_patches) == 0:
 		print("[-] No INT3 patched addresses available.")
 		return
 
 	print("Current INT3 patched addresses:")
-	for address in Int3Dictionary:
-		print("[*] {:s}".format(hex(address)))
+	for patch in int3_patches:
+		print("[*] {:s}{:s}".format(hex(patch.address), "" if patch.applied else " (reverted)"))
 
 # XXX: ARM NOPs
 def cmd_nop(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
@@ -1009,15 +1177,10 @@ Note: expressions supported, do not use spaces between operators.
 		print(help)
 		return
 
-	current_patch_addr = nop_addr
-	patch_byte = b'\x90'
-	# can we do better here? WriteMemory takes an input string... weird
-	for _ in range(patch_size):
-		if write_mem(current_patch_addr, patch_byte) == 0:
-			print("[-] error: Failed to write memory at 0x{:x}.".format(current_patch_addr))
-			return
-			
-		current_patch_addr += 1
+	try:
+		get_patch_manager().add(nop_addr, b'\x90' * patch_size, 'nop')
+	except PatchException as err:
+		print("[-] error: {0}".format(err))
 
 def cmd_null(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	'''Patch byte(s) at address to NULL (0x00). Use \'null help\' for more information.'''
@@ -1060,15 +1223,113 @@ Note: expressions supported, do not use spaces between operators.
 		print(help)
 		return
 
-	current_patch_addr = null_addr
-	# format for WriteMemory()
-	# can we do better here? WriteMemory takes an input string... weird
-	for _ in range(patch_size):
-		if write_mem(current_patch_addr, b'\x00') == 0:
-			print("[-] error: Failed to write memory at 0x{:x}.".format(current_patch_addr))
+	try:
+		get_patch_manager().add(null_addr, b'\x00' * patch_size, 'null')
+	except PatchException as err:
+		print("[-] error: {0}".format(err))
+
+def cmd_patch(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Manage memory patches. Use \'patch help\' for more information.'''
+	help = """
+Write memory patches and keep their original bytes in a journal, including
+patches made by int3, nop and null commands. The journal is saved to
+~/.cache/lldbinit/patches.json, patches inside a module are rebased to where
+the module is loaded when they are re-applied.
+
+Syntax: patch write <address> <hex bytes>
+        patch list
+        patch revert [<id>...]
+        patch reapply [<id>...]
+        patch delete [<id>...]
+
+Without ids revert/reapply/delete affect all patches.
+Bytes in memory are checked before a patch is written or reverted, patches
+holding neither the patched nor the original bytes are reported as modified.
+Patches outside a module only apply to the process they were written in.
+Note: expressions supported, do not use spaces between operators.
+"""
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	patch_manager = get_patch_manager()
+	action = cmd[0]
+
+	if action == "write":
+		if len(cmd) != 3:
+			print("[-] error: please insert an address and patch bytes.")
+			print(help)
+			return
+
+		patch_addr = evaluate(cmd[1])
+		if not patch_addr:
+			print("[-] error: invalid address value.")
+			return
+
+		try:
+			patch_bytes = bytes.fromhex(cmd[2])
+		except ValueError:
+			print("[-] error: invalid hex bytes.")
+			return
+
+		try:
+			patch = patch_manager.add(patch_addr, patch_bytes)
+		except PatchException as err:
+			print("[-] error: {0}".format(err))
+			return
+		print("[+] Patch {0} applied at 0x{1:x}.".format(patch.patch_id, patch.address))
+		return
+
+	if action == "list":
+		if len(patch_manager.patches) == 0:
+			print("[-] No patches available.")
 			return
 
-		current_patch_addr += 1
+		unresolved, mismatched = patch_manager.sync(list(patch_manager.patches.values()))
+		for patch in patch_manager.patches.values():
+			location = ""
+			if patch.module_uuid:
+				location = "{0}+0x{1:x}".format(patch.module_uuid, patch.module_offset)
+			if patch in unresolved:
+				state = "unloaded"
+			elif patch in mismatched:
+				state = "modified"
+			else:
+				state = "applied" if patch.applied else "reverted"
+			print("[{0:>4}] 0x{1:016x} {2:<5} {3:<9} {4} -> {5} {6}".format(
+				patch.patch_id, patch.address, patch.kind, state,
+				patch.original[:16].hex(), patch.data[:16].hex(), location))
+		return
+
+	if action not in ("revert", "reapply", "delete"):
+		print("[-] error: unrecognized command.")
+		print(help)
+		return
+
+	try:
+		patch_ids = [int(arg, 0) for arg in cmd[1:]]
+	except ValueError:
+		print("[-] error: invalid patch id.")
+		return
+
+	start_time = time.time()
+	try:
+		if action == "revert":
+			failed = patch_manager.revert(patch_ids)
+		elif action == "reapply":
+			failed = patch_manager.reapply(patch_ids)
+		else:
+			failed = patch_manager.remove(patch_ids)
+	except PatchException as err:
+		print("[-] error: {0}".format(err))
+		return
+
+	for patch in failed:
+		print("[-] error: patch {0} at 0x{1:x} failed.".format(patch.patch_id, patch.address))
+
+	print("[+] {0} done, {1} failed ({2:.2f}s).".format(action, len(failed), time.time() - start_time))
 
 '''
 	Implements stepover instruction.    
@@ -1134,398 +1395,585 @@ Syntax: stepo
 		selected_thread: SBThread = get_process().selected_thread
 		selected_thread.StepInstruction(False)
 
-# XXX: help
-def cmd_LoadBreakPointsRva(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
-	global  GlobalOutputList
-	GlobalOutputList = []
+def load_breakpoints_file(command: str, help: str, rva: bool):
 	'''
-	frame = get_frame();
-		target = lldb.debugger.GetSelectedTarget();
-
-		nummods = target.GetNumModules();
-		#for x in range (0, nummods):
-		#       mod = target.GetModuleAtIndex(x);
-		#       #print(dir(mod));
-		#       print(target.GetModuleAtIndex(x));              
-		#       for sec in mod.section_iter():
-		#               addr = sec.GetLoadAddress(target);
-		#               name = sec.GetName();
-		#               print(hex(addr));
-
-		#1st module is executable
-		mod = target.GetModuleAtIndex(0);
-		sec = mod.GetSectionAtIndex(0);
-		loadaddr = sec.GetLoadAddress(target);
-		if loadaddr == lldb.LLDB_INVALID_ADDRESS:
-				sec = mod.GetSectionAtIndex(1);
-				loadaddr = sec.GetLoadAddress(target);
-		print(hex(loadaddr));
+		Shared implementation of lb/lbrva
 	'''
-
-	target = get_target()
-	mod: SBModule = target.GetModuleAtIndex(0)
-	sec: SBSection = mod.GetSectionAtIndex(0)
-	loadaddr = sec.GetLoadAddress(target)
-	if loadaddr == lldb.LLDB_INVALID_ADDRESS:
-		sec = mod.GetSectionAtIndex(1)
-		loadaddr = sec.GetLoadAddress(target)
-	try:
-		f = open(command, "r")
-	except:
-		output("[-] Failed to load file : " + command)
-		result.PutCString("".join(GlobalListOutput))
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
 		return
-	while True:
-		line = f.readline()
-		if not line: 
-			break
-		line = line.rstrip()
-		if not line: 
-			break
-		debugger.HandleCommand("breakpoint set -a " + hex(loadaddr + int(line, 16)))
-	f.close()
 
-# XXX: help
-def cmd_LoadBreakPoints(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
-	global GlobalOutputList
-	GlobalOutputList = []
+	report_names = "--report" in cmd
+	if report_names:
+		cmd.remove("--report")
 
+	filename = " ".join(cmd)
 	try:
-		f = open(command, "r")
-	except:
-		output("[-] Failed to load file : " + command)
-		result.PutCString("".join(GlobalListOutput))
+		with open(filename, "r") as f:
+			lines = f.readlines()
+	except OSError:
+		print("[-] Failed to load file : " + filename)
 		return
-	while True:
-		line = f.readline()
-		if not line:
-			break
-		line = line.rstrip()
-		if not line:
-			break
-		debugger.HandleCommand("breakpoint set --name " + line)
-	f.close()
 
-# -----------------------
-# Memory related commands
-# -----------------------
+	rva_base = -1
+	if rva:
+		#1st module is executable
+		target = get_target()
+		rva_base = get_module_load_base(target, target.GetModuleAtIndex(0))
+		if rva_base == lldb.LLDB_INVALID_ADDRESS:
+			print("[-] error: main executable is not loaded.")
+			return
 
-'''
-	Output nice memory hexdumps...
-'''
-# display byte values and ASCII characters
-def cmd_db(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
-	'''Display hex dump in byte values and ASCII characters. Use \'db help\' for more information.'''
+	report = import_breakpoints(lines, rva_base, report_names)
+	for entry in report.unresolved[:20]:
+		print("[-] unresolved: {0}".format(entry))
+	if len(report.unresolved) > 20:
+		print("[-] ... and {0} more unresolved entries".format(len(report.unresolved) - 20))
+
+	print("[+] Created {0} breakpoints ({1} locations), {2} unresolved, {3} skipped lines ({4:.2f}s).".format(
+		report.created, report.locations, len(report.unresolved), report.skipped, report.elapsed))
+
+def cmd_LoadBreakPointsRva(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Load breakpoints from a file of RVAs. Use \'lbrva help\' for more information.'''
 	help = """
-Display memory hex dump in byte length and ASCII representation.
+Load breakpoints from a file, hex numbers are RVAs in the main executable.
 
-Syntax: db [<address>]
+Syntax: lbrva <file> [--report]
 
-Note: if no address specified it will dump current instruction pointer address.
-Note: expressions supported, do not use spaces between operators.
+Other entries are handled as in lb.
 """
+	load_breakpoints_file(command, help, True)
 
-	global GlobalListOutput
-	GlobalListOutput = []
+def cmd_LoadBreakPoints(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Load breakpoints from a file. Use \'lb help\' for more information.'''
+	help = """
+Load breakpoints from a file, one entry per line:
 
-	'''
-		Parse argument of db, for example, argument pass into command is
-		"struct->x + struct->length" result will be : "struct->x + struct->length"
-	'''	
-	
-	if not len(command):
-		dump_addr = get_current_pc()
-		if not dump_addr:
-			print("[-] error: invalid current address.")
-			return
-	else:
-		if command == "help":
+  <name>                 function name
+  0x<address>            absolute address
+  <module>+<offset>      offset from module load base (also <module>!<offset>)
+  <module> <address>     address in IDA default mapping of module (like mbp)
+
+Blank lines and lines starting with #, ; or // are skipped.
+Names missing from the symbol index are set as lldb name breakpoints, which also match
+base names and C++ names. --report lists them as unresolved instead.
+
+Syntax: lb <file> [--report]
+"""
+	load_breakpoints_file(command, help, False)
+
+def cov_breakpoint_callback(frame: SBFrame, bp_loc: lldb.SBBreakpointLocation, internal_dict: Dict) -> bool:
+	'''Record a covered block and let the process continue without stopping'''
+	if COVERAGE_SESSION != None:
+		COVERAGE_SESSION.on_hit(frame.GetPC())
+	# the block never traps again, the breakpoint is deleted by cov stop
+	bp_loc.SetEnabled(False)
+	return False
+
+def cmd_cov(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Collect basic block coverage with breakpoints. Use \'cov help\' for more information.'''
+	help = """
+Collect basic block coverage of a module. A breakpoint is set on every block,
+it is disabled the first time it is hit and the process continues without
+stopping. cov stop deletes all coverage breakpoints.
+Blocks come from a block list or a linear sweep of the code section.
+
+Syntax: cov start <module> [<block list file>]
+        cov save <file>
+        cov info
+        cov stop
+
+Block list lines are "<offset from module base> [<size>]" in hex.
+cov save writes hit blocks in drcov format (lighthouse, bncov...).
+"""
+
+	global COVERAGE_SESSION
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	action = cmd[0]
+	if action == "start":
+		if len(cmd) < 2:
+			print("[-] error: please insert a module name.")
 			print(help)
 			return
-		dump_addr = evaluate(command)
-		if not dump_addr:
-			print("[-] error: invalid input address value.")
-			print("")
-			print(help)
+
+		target = get_target()
+		module = find_module_by_name(target, cmd[1])
+		if not module:
+			print("[-] error: module {0} is not found.".format(cmd[1]))
 			return
 
-	membuff = read_mem(dump_addr, 0x100) # avoid overhead when trying to read unreadable address
-	if not len(membuff):
-		print('[-] error: Your {0} address is not readable'.format(hex(dump_addr)))
+		if COVERAGE_SESSION != None:
+			COVERAGE_SESSION.clear()
+
+		start_time = time.time()
+		session = CoverageSession(module)
+		if len(cmd) > 2:
+			try:
+				with open(cmd[2], "r") as f:
+					session.load_block_list(f.readlines())
+			except (OSError, ValueError) as err:
+				print("[-] error: unable to load block list: {0}".format(err))
+				return
+		elif not session.sweep():
+			print("[-] error: unable to read code section of {0}.".format(cmd[1]))
+			return
+
+		COVERAGE_SESSION = session
+		count = session.plant("lldbinit.cov_breakpoint_callback")
+		print("[+] Planted {0} breakpoints on {1} blocks ({2:.2f}s).".format(
+			count, len(session.blocks), time.time() - start_time))
 		return
-	membuff = membuff.ljust(0x100, b'\x00')
 
-	color("BLUE")
-	if POINTER_SIZE == 4:
-		output("[0x0000:0x%.08X]" % dump_addr)
-		output("------------------------------------------------------")
+	if COVERAGE_SESSION == None:
+		print("[-] error: no coverage session, use cov start first.")
+		return
+
+	if action == "save":
+		if len(cmd) < 2:
+			print("[-] error: please insert an output file.")
+			return
+		count = COVERAGE_SESSION.save_drcov(cmd[1])
+		print("[+] Saved {0} blocks to {1}.".format(count, cmd[1]))
+
+	elif action == "info":
+		blocks = len(COVERAGE_SESSION.blocks)
+		hits = len(COVERAGE_SESSION.hits)
+		print("[+] {0}: {1}/{2} blocks hit ({3:.2f}%), {4} breakpoints left.".format(
+			COVERAGE_SESSION.path, hits, blocks, hits * 100 / blocks if blocks else 0,
+			COVERAGE_SESSION.remaining))
+
+	elif action == "stop":
+		COVERAGE_SESSION.clear()
+		print("[+] Removed coverage breakpoints, {0} blocks hit.".format(len(COVERAGE_SESSION.hits)))
+
 	else:
-		output("[0x0000:0x%.016lX]" % dump_addr)
-		output("------------------------------------------------------")
-	color("BOLD")
-	output("[data]")
-	color("RESET")
-	output("\n")
-	#output(hexdump(dump_addr, membuff, " ", 16));
-	index = 0
-	while index < 0x100:
-		data = unpack(b"B"*16, membuff[index:index+0x10])
-		if POINTER_SIZE == 4:
-			szaddr = "0x%.08X" % dump_addr
-		else:
-			szaddr = "0x%.016lX" % dump_addr
-		fmtnice = "%.02X %.02X %.02X %.02X %.02X %.02X %.02X %.02X"
-		fmtnice = fmtnice + " - " + fmtnice
-		output("\033[1m%s :\033[0m %.02X %.02X %.02X %.02X %.02X %.02X %.02X %.02X - %.02X %.02X %.02X %.02X %.02X %.02X %.02X %.02X \033[1m%s\033[0m" % 
-			(szaddr, 
-			data[0], 
-			data[1], 
-			data[2], 
-			data[3], 
-			data[4], 
-			data[5], 
-			data[6], 
-			data[7], 
-			data[8], 
-			data[9], 
-			data[10], 
-			data[11], 
-			data[12], 
-			data[13], 
-			data[14], 
-			data[15], 
-			quotechars(membuff[index:index+0x10])));
-		if index + 0x10 != 0x100:
-			output("\n")
-		index += 0x10
-		dump_addr += 0x10
-	color("RESET")
-	#last element of the list has all data output...
-	#so we remove last \n
-	result.PutCString("".join(GlobalListOutput))
-	result.SetStatus(lldb.eReturnStatusSuccessFinishResult)
+		print("[-] error: unrecognized command.")
+		print(help)
 
-# display word values and ASCII characters
-def cmd_dw(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
-	''' Display hex dump in word values and ASCII characters. Use \'dw help\' for more information.'''
+def trace_breakpoint_callback(frame: SBFrame, bp_loc: lldb.SBBreakpointLocation, internal_dict: Dict) -> bool:
+	'''Record a tracepoint hit and let the process continue without stopping'''
+	site = TRACE_SITES.get(bp_loc.GetBreakpoint().GetID())
+	if site != None:
+		trace_capture(site, frame, TRACE_BUFFER)
+	return False
+
+def cmd_trace(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Tracepoints that record registers and memory without stopping. Use \'trace help\' for more information.'''
 	help = """
-Display memory hex dump in word length and ASCII representation.
+Set tracepoints that save registers and memory snippets into a ring buffer and
+continue the process without stopping or drawing the context.
 
-Syntax: dw [<address>]
+Syntax: trace add <address> [-r <reg>,<reg>...] [-m <reg>:<size>,...]
+        trace dump [<id>] [-n <count>]
+        trace clear [<id>]
+        trace buffer <capacity>
 
-Note: if no address specified it will dump current instruction pointer address.
+-r saves register values, -m saves <size> bytes at the address held by <reg>.
+trace dump shows hits and rate per tracepoint and the last <count> records (default 20).
+trace clear without id removes all tracepoints and the recorded hits.
 Note: expressions supported, do not use spaces between operators.
 """
 
-	global GlobalListOutput
-	GlobalListOutput = []
+	global TRACE_BUFFER
 
-	'''
-		Parse argument of db, for example, argument pass into command is
-		"struct->x + struct->length" result will be : "struct->x + struct->length"
-	'''	
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
 
-	if not len(command):
-		dump_addr = get_current_pc()
-		if not dump_addr:
-			print("[-] error: invalid current address.")
-			return
-	else:
-		if command == "help":
+	target = get_target()
+	action = cmd[0]
+
+	if action == "add":
+		if len(cmd) < 2:
+			print("[-] error: please insert a tracepoint address.")
 			print(help)
 			return
-		dump_addr = evaluate(command)
-		if not dump_addr:
-			print("[-] error: invalid input address value.")
-			print("")
-			print(help)
+
+		address = evaluate(cmd[1])
+		if not address:
+			print("[-] error: invalid address value.")
 			return
 
-	membuff = read_mem(dump_addr, 0x100) # avoid overhead when trying to read unreadable address
-	if not len(membuff): # confuse with membuff contains all NULL byte and length of membuff
-		print('[-] error: Your {0} address is not readable'.format(hex(dump_addr)))
-		return
-	membuff = membuff.ljust(0x100, b'\x00')
+		registers = []
+		memory = []
+		try:
+			for i in range(2, len(cmd) - 1, 2):
+				if cmd[i] == "-r":
+					registers = cmd[i + 1].split(",")
+				elif cmd[i] == "-m":
+					memory = [(spec.split(":")[0], evaluate(spec.split(":")[1])) for spec in cmd[i + 1].split(",")]
+		except IndexError:
+			print("[-] error: memory snippets must be <reg>:<size>.")
+			return
 
-	color("BLUE")
-	if POINTER_SIZE == 4: #is_i386() or is_arm():
-		output("[0x0000:0x%.08X]" % dump_addr)
-		output("--------------------------------------------")
-	else: #is_x64():
-		output("[0x0000:0x%.016lX]" % dump_addr)
-		output("--------------------------------------------")
-	color("BOLD")
-	output("[data]")
-	color("RESET")
-	output("\n")
-	index = 0
-	while index < 0x100:
-		data = unpack("HHHHHHHH", membuff[index:index+0x10])
-		if POINTER_SIZE == 4:
-			szaddr = "0x%.08X" % dump_addr
-		else:
-			szaddr = "0x%.016lX" % dump_addr
-		output("\033[1m%s :\033[0m %.04X %.04X %.04X %.04X %.04X %.04X %.04X %.04X \033[1m%s\033[0m" % (szaddr, 
-			data[0],
-			data[1],
-			data[2],
-			data[3],
-			data[4],
-			data[5],
-			data[6],
-			data[7],
-			quotechars(membuff[index:index+0x10])));
-		if index + 0x10 != 0x100:
-			output("\n")
-		index += 0x10
-		dump_addr += 0x10
-	color("RESET")
-	result.PutCString("".join(GlobalListOutput))
-	result.SetStatus(lldb.eReturnStatusSuccessFinishResult)
+		# the callback reads these sizes on every hit, reject bad ones now
+		for reg_name, size in memory:
+			if not size or size < 0:
+				print("[-] error: invalid size of memory snippet {0}.".format(reg_name))
+				return
 
-# display dword values and ASCII characters
-def cmd_dd(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
-	''' Display hex dump in double word values and ASCII characters. Use \'dd help\' for more information.'''
+		breakpoint: SBBreakpoint = target.BreakpointCreateByAddress(address)
+		if not breakpoint.IsValid():
+			print("[-] error: unable to set tracepoint at 0x{:x}.".format(address))
+			return
+
+		breakpoint.SetScriptCallbackFunction("lldbinit.trace_breakpoint_callback")
+		site_id = breakpoint.GetID()
+		TRACE_SITES[site_id] = TraceSite(site_id, address, registers, memory)
+		print("[+] Tracepoint {0} at 0x{1:x}.".format(site_id, address))
+
+	elif action == "dump":
+		site_ids = set(TRACE_SITES)
+		count = 20
+		args = cmd[1:]
+		if "-n" in args:
+			idx = args.index("-n")
+			count = evaluate(args[idx + 1]) if idx + 1 < len(args) else count
+			del args[idx:idx + 2]
+		if args:
+			try:
+				site_ids = {int(arg, 0) for arg in args}
+			except ValueError:
+				print("[-] error: invalid tracepoint id.")
+				return
+
+		for site_id in sorted(site_ids):
+			site = TRACE_SITES.get(site_id)
+			if site == None:
+				continue
+			print("[{0:>4}] 0x{1:x} {2:<40} hits {3:<8} {4:.1f} hits/s".format(
+				site.site_id, site.address, resolve_symbol_name(site.address), site.hits, site.rate))
+
+		records = [record for record in TRACE_BUFFER if record[1] in site_ids]
+		print("[+] {0} hits recorded, showing last {1}:".format(TRACE_BUFFER.total, min(count, len(records))))
+		for timestamp, site_id, thread_id, values, snippets in records[-count:] if count else []:
+			site = TRACE_SITES.get(site_id)
+			# the tracepoint was removed, its register names are gone with it
+			reg_names = site.registers if site != None else ["?"] * len(values)
+			mem_names = [name for name, _ in site.memory] if site != None else ["?"] * len(snippets)
+			regs = " ".join("{0}={1:#x}".format(name, value) for name, value in zip(reg_names, values))
+			mems = " ".join("[{0}]={1}".format(name, snippet.hex()) for name, snippet in zip(mem_names, snippets))
+			print("    {0:.6f} [{1}] tid {2:#x} {3} {4}".format(timestamp, site_id, thread_id, regs, mems))
+
+	elif action == "clear":
+		try:
+			site_ids = [int(arg, 0) for arg in cmd[1:]] if len(cmd) > 1 else list(TRACE_SITES)
+		except ValueError:
+			print("[-] error: invalid tracepoint id.")
+			return
+		for site_id in site_ids:
+			if TRACE_SITES.pop(site_id, None) != None:
+				target.BreakpointDelete(site_id)
+		if len(cmd) == 1:
+			TRACE_BUFFER.clear()
+		print("[+] Removed {0} tracepoints.".format(len(site_ids)))
+
+	elif action == "buffer":
+		if len(cmd) < 2 or not evaluate(cmd[1]):
+			print("[-] error: please insert buffer capacity.")
+			return
+		TRACE_BUFFER = TraceBuffer(evaluate(cmd[1]))
+		print("[+] Trace buffer holds {0} records.".format(TRACE_BUFFER.capacity))
+
+	else:
+		print("[-] error: unrecognized command.")
+		print(help)
+
+def bpcond_breakpoint_callback(frame: SBFrame, bp_loc: lldb.SBBreakpointLocation, internal_dict: Dict) -> bool:
+	'''Stop only when the compiled python condition of the breakpoint is true'''
+	condition = BREAKPOINT_CONDITIONS.get(bp_loc.GetBreakpoint().GetID())
+	if condition == None:
+		return True
+	return evaluate_condition(condition, frame)
+
+def cmd_bpcond(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Python breakpoint conditions. Use \'bpcond help\' for more information.'''
 	help = """
-Display memory hex dump in double word length and ASCII representation.
+Set a python expression as breakpoint condition. The expression is compiled once
+and evaluated on every hit without the lldb expression parser, the process
+continues when it is false.
 
-Syntax: dd [<address>]
+Syntax: bpcond <breakpoint id> <python expression>
+        bpcond list
+        bpcond del [<breakpoint id>]
 
-Note: if no address specified it will dump current instruction pointer address.
-Note: expressions supported, do not use spaces between operators.
+Registers are available by name, memory through u8/u16/u32/u64/ptr(addr),
+mem(addr, size) and cstr(addr).
+A condition raising an error stops the process, see bpcond list for the error.
+
+Example: bpcond 1 rdi == 0x10 and cstr(rsi).startswith("GET")
 """
 
+	cmd = command.split(None, 1)
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	target = get_target()
+	action = cmd[0]
+
+	if action == "list":
+		if not BREAKPOINT_CONDITIONS:
+			print("[-] No breakpoint conditions set.")
+			return
+		for bp_id, condition in sorted(BREAKPOINT_CONDITIONS.items()):
+			print("[{0:>4}] evaluations {1:<10} hits {2:<10} errors {3:<6} {4}".format(
+				bp_id, condition.evaluations, condition.hits, condition.errors, condition.source))
+			if condition.last_error:
+				print("       last error: {0}".format(condition.last_error))
+
+	elif action == "del":
+		try:
+			bp_ids = [parse_number(arg) for arg in cmd[1].split()] if len(cmd) > 1 else list(BREAKPOINT_CONDITIONS)
+		except ParseValueError:
+			print("[-] error: invalid breakpoint id.")
+			return
+		for bp_id in bp_ids:
+			if BREAKPOINT_CONDITIONS.pop(bp_id, None) == None:
+				continue
+			breakpoint: SBBreakpoint = target.FindBreakpointByID(bp_id)
+			if breakpoint.IsValid():
+				breakpoint.SetScriptCallbackBody("")
+		print("[+] Removed {0} breakpoint conditions.".format(len(bp_ids)))
+
+	else:
+		try:
+			bp_id = parse_number(action)
+		except ParseValueError:
+			print("[-] error: invalid breakpoint id.")
+			return
+		breakpoint: SBBreakpoint = target.FindBreakpointByID(bp_id) if bp_id != -1 else SBBreakpoint()
+		if not breakpoint.IsValid():
+			print("[-] error: invalid breakpoint id.")
+			return
+		if len(cmd) < 2:
+			print("[-] error: please insert a condition.")
+			return
+
+		try:
+			BREAKPOINT_CONDITIONS[bp_id] = compile_condition(bp_id, cmd[1])
+		except SyntaxError as err:
+			print("[-] error: invalid condition: {0}".format(err))
+			return
+
+		breakpoint.SetScriptCallbackFunction("lldbinit.bpcond_breakpoint_callback")
+		print("[+] Breakpoint {0} stops when: {1}".format(bp_id, cmd[1]))
+
+# -----------------------
+# Memory related commands
+# -----------------------
+
+HEXDUMP_FORMATS = {
+	# unit: (bytes per line, dashes in header, show ascii, split line in halves)
+	1: (16, 54, True, True),
+	2: (16, 44, True, False),
+	4: (16, 40, True, False),
+	8: (32, 55, False, False),
+}
+
+'''
+	Output nice memory hexdumps...
+'''
+def dump_memory(command: str, result: SBCommandReturnObject, unit: int, help: str):
+	'''
+		Shared implementation of db/dw/dd/dq
+	'''
+
 	global GlobalListOutput
 	GlobalListOutput = []
 
-	'''
-		Parse argument of db, for example, argument pass into command is
-		"struct->x + struct->length" result will be : "struct->x + struct->length"
-	'''	
+	cmd = command.split()
+	if len(cmd) and cmd[0] == "help":
+		print(help)
+		return
 
-	if not len(command):
+	output_file = None
+	use_pager = False
+	if "--pager" in cmd:
+		use_pager = True
+		cmd.remove("--pager")
+	if "-o" in cmd:
+		idx = cmd.index("-o")
+		if idx + 1 >= len(cmd):
+			print("[-] error: please insert an output file.")
+			return
+		output_file = cmd[idx + 1]
+		del cmd[idx:idx + 2]
+
+	if len(cmd) > 2:
+		print("[-] error: too many arguments.")
+		print("")
+		print(help)
+		return
+
+	if not len(cmd):
 		dump_addr = get_current_pc()
 		if not dump_addr:
 			print("[-] error: invalid current address.")
 			return
 	else:
-		if command == "help":
-			print(help)
-			return
-		dump_addr = evaluate(command)
+		dump_addr = evaluate(cmd[0])
 		if not dump_addr:
 			print("[-] error: invalid input address value.")
 			print("")
 			print(help)
 			return
 
-	membuff = read_mem(dump_addr, 0x100) # avoid overhead when trying to read unreadable address
+	length = 0x100
+	if len(cmd) == 2:
+		length = evaluate(cmd[1])
+		if not length:
+			print("[-] error: invalid length value.")
+			print("")
+			print(help)
+			return
+
+	width, dashes, show_ascii, split = HEXDUMP_FORMATS[unit]
+
+	if output_file != None or use_pager:
+		try:
+			if use_pager:
+				pager = subprocess.Popen(os.environ.get("PAGER", "less -R").split(), stdin=subprocess.PIPE, text=True)
+				out = pager.stdin
+			else:
+				out = open(output_file, "w")
+		except OSError as err:
+			print("[-] error: {0}".format(err))
+			return
+
+		try:
+			dumped = hexdump_stream(dump_addr, length, out.write, unit, width, show_ascii, split, use_pager)
+		except BrokenPipeError:
+			# pager closed before the end of the dump
+			dumped = length
+		finally:
+			try:
+				out.close()
+			except BrokenPipeError:
+				pass
+			if use_pager:
+				pager.wait()
+
+		if dumped < length:
+			print("[-] warning: stopped at unreadable address 0x{:x}.".format(dump_addr + dumped))
+		if output_file != None:
+			print("[+] Dumped 0x{:x} bytes to {}.".format(dumped, output_file))
+		return
+
+	membuff = read_mem(dump_addr, length) # avoid overhead when trying to read unreadable address
 	if not len(membuff):
 		print('[-] error: Your {0} address is not readable'.format(hex(dump_addr)))
 		return
-	membuff = membuff.ljust(0x100, b'\x00')
+	membuff = membuff.ljust(length, b'\x00')
 
 	color("BLUE")
 	if POINTER_SIZE == 4:
 		output("[0x0000:0x%.08X]" % dump_addr)
-		output("----------------------------------------")
-	else: #is_x64():
+	else:
 		output("[0x0000:0x%.016lX]" % dump_addr)
-		output("----------------------------------------")
+	output("-" * dashes)
 	color("BOLD")
 	output("[data]")
 	color("RESET")
 	output("\n")
-	index = 0
-	while index < 0x100:
-		(mem0, mem1, mem2, mem3) = unpack("IIII", membuff[index:index+0x10])
-		if POINTER_SIZE == 4:
-			szaddr = "0x%.08X" % dump_addr
-		else:
-			szaddr = "0x%.016lX" % dump_addr
-		output("\033[1m%s :\033[0m %.08X %.08X %.08X %.08X \033[1m%s\033[0m" % (szaddr, 
-											mem0, 
-											mem1, 
-											mem2, 
-											mem3, 
-											quotechars(membuff[index:index+0x10])));
-		if index + 0x10 != 0x100:
-			output("\n")
-		index += 0x10
-		dump_addr += 0x10
+	output("\n".join(hexdump_lines(dump_addr, membuff, unit, width, show_ascii, split, POINTER_SIZE)))
 	color("RESET")
 	result.PutCString("".join(GlobalListOutput))
 	result.SetStatus(lldb.eReturnStatusSuccessFinishResult)
 
-# display quad values
-def cmd_dq(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
-	''' Display hex dump in quad values. Use \'dq help\' for more information.'''
+# display byte values and ASCII characters
+def cmd_db(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Display hex dump in byte values and ASCII characters. Use \'db help\' for more information.'''
 	help = """
-Display memory hex dump in quad word length.
+Display memory hex dump in byte length and ASCII representation.
 
-Syntax: dq [<address>]
+Syntax: db [<address>] [<length>] [-o <file> | --pager]
 
 Note: if no address specified it will dump current instruction pointer address.
+Note: default length is 0x100 bytes, -o writes the dump to a file and --pager streams it to $PAGER.
 Note: expressions supported, do not use spaces between operators.
 """
+	dump_memory(command, result, 1, help)
 
-	global GlobalListOutput
-	GlobalListOutput = []
+# display word values and ASCII characters
+def cmd_dw(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	''' Display hex dump in word values and ASCII characters. Use \'dw help\' for more information.'''
+	help = """
+Display memory hex dump in word length and ASCII representation.
 
-	'''
-		Parse argument of db, for example, argument pass into command is
-		"struct->x + struct->length" result will be : "struct->x + struct->length"
-	'''	
+Syntax: dw [<address>] [<length>] [-o <file> | --pager]
 
-	if not len(command):
-		dump_addr = get_current_pc()
-		if not dump_addr:
-			print("[-] error: invalid current address.")
-			return
-	else:
-		if command == "help":
-			print(help)
-			return
-		dump_addr = evaluate(command)
-		if not dump_addr:
-			print("[-] error: invalid input address value.")
-			print("")
-			print(help)
-			return
+Note: if no address specified it will dump current instruction pointer address.
+Note: default length is 0x100 bytes, -o writes the dump to a file and --pager streams it to $PAGER.
+Note: expressions supported, do not use spaces between operators.
+"""
+	dump_memory(command, result, 2, help)
 
-	membuff = read_mem(dump_addr, 0x100) # avoid overhead when trying to read unreadable address
-	if not len(membuff):
-		print('[-] error: Your {0} address is not readable'.format(hex(dump_addr)))
-		return
+# display dword values and ASCII characters
+def cmd_dd(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	''' Display hex dump in double word values and ASCII characters. Use \'dd help\' for more information.'''
+	help = """
+Display memory hex dump in double word length and ASCII representation.
 
-	membuff = membuff.ljust(0x100, b'\x00')
+Syntax: dd [<address>] [<length>] [-o <file> | --pager]
 
-	color("BLUE")
-	if POINTER_SIZE == 4:
-		output("[0x0000:0x%.08X]" % dump_addr)
-		output("-------------------------------------------------------")
-	else:
-		output("[0x0000:0x%.016lX]" % dump_addr)
-		output("-------------------------------------------------------")
-	color("BOLD")
-	output("[data]")
-	color("RESET")
-	output("\n")   
-	index = 0
-	while index < 0x100:
-		(mem0, mem1, mem2, mem3) = unpack("QQQQ", membuff[index:index+0x20])
-		if POINTER_SIZE == 4:
-			szaddr = "0x%.08X" % dump_addr
-		else:
-			szaddr = "0x%.016lX" % dump_addr
-		output("\033[1m%s :\033[0m %.016lX %.016lX %.016lX %.016lX" % (szaddr, mem0, mem1, mem2, mem3))
-		if index + 0x20 != 0x100:
-			output("\n")
-		index += 0x20
-		dump_addr += 0x20
-	color("RESET")
-	result.PutCString("".join(GlobalListOutput))
-	result.SetStatus(lldb.eReturnStatusSuccessFinishResult)
+Note: if no address specified it will dump current instruction pointer address.
+Note: default length is 0x100 bytes, -o writes the dump to a file and --pager streams it to $PAGER.
+Note: expressions supported, do not use spaces between operators.
+"""
+	dump_memory(command, result, 4, help)
+
+# display quad values
+def cmd_dq(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	''' Display hex dump in quad values. Use \'dq help\' for more information.'''
+	help = """
+Display memory hex dump in quad word length.
+
+Syntax: dq [<address>] [<length>] [-o <file> | --pager]
+
+Note: if no address specified it will dump current instruction pointer address.
+Note: default length is 0x100 bytes, -o writes the dump to a file and --pager streams it to $PAGER.
+Note: expressions supported, do not use spaces between operators.
+"""
+	dump_memory(command, result, 8, help)
+
+def find_vmmap_regions() -> List[List]:
+	process = get_process()
+	pid = process.GetProcessID()
+	output_data = subprocess.check_output(["/usr/bin/vmmap", "%d" % pid])
+	output_data = output_data.decode('utf-8')
+	lines = output_data.split("\n")
+	#print(lines);
+	#this relies on output from /usr/bin/vmmap so code is dependant on that 
+	#only reason why it's used is for better description of regions, which is
+	#nice to have. If they change vmmap in the future, I'll use my version 
+	#and that output is much easier to parse...
+	newlines = []
+	for x in lines:
+		p = re.compile(r"([\S\s]+)\s([\da-fA-F]{16}-[\da-fA-F]{16}|[\da-fA-F]{8}-[\da-fA-F]{8})")
+		m = p.search(x)
+		if not m: continue
+		tmp = []
+		mem_name  = m.group(1)
+		mem_range = m.group(2)
+		#0x000000-0x000000
+		mem_start = int(mem_range.split("-")[0], 16)
+		mem_end   = int(mem_range.split("-")[1], 16)
+		tmp.append(mem_name)
+		tmp.append(mem_start)
+		tmp.append(mem_end)
+		newlines.append(tmp)
+
+	#move line extraction a bit up, thus we can latter sort it, as vmmap gives
+	#readable pages only, and then writable pages, so it looks ugly a bit :)
+	return sorted(newlines, key=lambda sortnewlines: sortnewlines[1])
 
 # XXX: help
 def cmd_findmem(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
@@ -1584,36 +2032,12 @@ def cmd_findmem(debugger: SBDebugger, command: str, result: SBCommandReturnObjec
 			print("[-] Error evaluating count : " + parser.count)
 			return
 	
-	process = get_process()
-	pid = process.GetProcessID()
-	output_data = subprocess.check_output(["/usr/bin/vmmap", "%d" % pid])
-	output_data = output_data.decode('utf-8')
-	lines = output_data.split("\n")
-	#print(lines);
-	#this relies on output from /usr/bin/vmmap so code is dependant on that 
-	#only reason why it's used is for better description of regions, which is
-	#nice to have. If they change vmmap in the future, I'll use my version 
-	#and that output is much easier to parse...
-	newlines = []
-	for x in lines:
-		p = re.compile(r"([\S\s]+)\s([\da-fA-F]{16}-[\da-fA-F]{16}|[\da-fA-F]{8}-[\da-fA-F]{8})")
-		m = p.search(x)
-		if not m: continue
-		tmp = []
-		mem_name  = m.group(1)
-		mem_range = m.group(2)
-		#0x000000-0x000000
-		mem_start = int(mem_range.split("-")[0], 16)
-		mem_end   = int(mem_range.split("-")[1], 16)
-		tmp.append(mem_name)
-		tmp.append(mem_start)
-		tmp.append(mem_end)
-		newlines.append(tmp)
-	
-	lines = sorted(newlines, key=lambda sortnewlines: sortnewlines[1])
-	#move line extraction a bit up, thus we can latter sort it, as vmmap gives
-	#readable pages only, and then writable pages, so it looks ugly a bit :)
-	newlines = []
+	if is_offline():
+		regions = get_memory_regions()
+		lines = [[region.name, region.start, region.end] for region in regions]
+	else:
+		lines = find_vmmap_regions()
+
 	for x in lines:
 		mem_name = x[0]
 		mem_start= x[1]
@@ -1669,6 +2093,276 @@ def cmd_findmem(debugger: SBDebugger, command: str, result: SBCommandReturnObjec
 			off += len(search_string)
 	return
 
+def cmd_memsnap(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Save memory snapshots and diff them between stops. Use \'memsnap help\' for more information.'''
+	help = """
+Hash memory pages and report what changed between two stops.
+
+Syntax: memsnap save <name> [--hash-only] [<address> <size>]...
+        memsnap diff <old> [<new>]
+        memsnap list
+        memsnap delete <name>
+
+Without <address> <size> pairs all writable regions are snapshotted.
+--hash-only keeps only page hashes, diff then reports changed pages without byte diffs.
+If <new> is omitted, <old> is compared against current memory.
+Note: expressions supported, do not use spaces between operators.
+"""
+
+	global MEMORY_SNAPSHOTS
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	action = cmd[0]
+	if action == "save":
+		if len(cmd) < 2:
+			print("[-] error: please insert a snapshot name.")
+			print(help)
+			return
+
+		name = cmd[1]
+		keep_data = "--hash-only" not in cmd
+		range_args = [arg for arg in cmd[2:] if arg != "--hash-only"]
+		if len(range_args) % 2 != 0:
+			print("[-] error: memory ranges must be <address> <size> pairs.")
+			return
+
+		if range_args:
+			regions = []
+			for i in range(0, len(range_args), 2):
+				start = evaluate(range_args[i])
+				size = evaluate(range_args[i + 1])
+				if not start or not size:
+					print("[-] error: invalid range {0} {1}.".format(range_args[i], range_args[i + 1]))
+					return
+				regions.append(MemoryRegion(start, start + size))
+		else:
+			regions = get_memory_regions(writable_only=True)
+
+		snapshot = take_memory_snapshot(name, regions, keep_data)
+		MEMORY_SNAPSHOTS[name] = snapshot
+		print("[+] Snapshot \"{0}\": {1} pages in {2} regions ({3:.2f}s).".format(
+			name, len(snapshot.hashes), len(regions), snapshot.elapsed))
+
+	elif action == "diff":
+		if len(cmd) < 2:
+			print("[-] error: please insert snapshot names.")
+			print(help)
+			return
+
+		try:
+			old = MEMORY_SNAPSHOTS[cmd[1]]
+			if len(cmd) > 2:
+				new = MEMORY_SNAPSHOTS[cmd[2]]
+			else:
+				new = take_memory_snapshot('<current>', old.regions, old.has_data)
+		except KeyError as err:
+			print("[-] error: snapshot {0} not found.".format(err))
+			return
+
+		changes = diff_memory_snapshots(old, new)
+		for change in changes:
+			print(COLORS["YELLOW"] + "[*] page 0x{:016x}".format(change.page_addr) + COLORS["RESET"], end='')
+			if not change.runs:
+				print(" changed")
+				continue
+
+			print(" {0} bytes changed".format(sum(len(run[1]) for run in change.runs)))
+			for address, old_bytes, new_bytes in change.runs:
+				print("    0x{:016x}: {} {}->{} {}".format(
+					address, old_bytes[:32].hex(' '), COLORS["RED"], COLORS["RESET"], new_bytes[:32].hex(' ')))
+
+		missing = len(old.hashes.keys() ^ new.hashes.keys())
+		print("[+] {0} pages changed, {1} pages only present in one snapshot.".format(len(changes), missing))
+
+	elif action == "list":
+		for name, snapshot in MEMORY_SNAPSHOTS.items():
+			print("- {0:<20} stop {1:<6} {2} pages {3}".format(
+				name, snapshot.stop_id, len(snapshot.hashes), "" if snapshot.has_data else "(hash only)"))
+
+	elif action == "delete":
+		if len(cmd) < 2 or MEMORY_SNAPSHOTS.pop(cmd[1], None) == None:
+			print("[-] error: snapshot not found.")
+			return
+		print("[+] Deleted snapshot {0}.".format(cmd[1]))
+
+	else:
+		print("[-] error: unrecognized command.")
+		print(help)
+
+def cmd_memimage(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Dump memory to an image file and read memory from it offline. Use \'memimage help\' for more information.'''
+	help = """
+Dump memory of the target into a sparse image file, load it later to inspect
+memory and kernel structures without a live process.
+
+Syntax: memimage dump <file> [--kernel-map | <address> <size>...]
+        memimage load <file>
+        memimage unload
+        memimage info
+
+Without ranges all readable regions of the process are dumped.
+--kernel-map dumps regions mapped in XNU kernel_map.
+Note: expressions supported, do not use spaces between operators.
+"""
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	action = cmd[0]
+	if action == "dump":
+		if len(cmd) < 2:
+			print("[-] error: please insert an image file path.")
+			print(help)
+			return
+
+		if is_offline():
+			print("[-] error: unload memory image before dumping a new one.")
+			return
+
+		range_args = cmd[2:]
+		if range_args == ["--kernel-map"]:
+			regions = xnu_kernel_map_regions()
+		elif range_args:
+			if len(range_args) % 2 != 0:
+				print("[-] error: memory ranges must be <address> <size> pairs.")
+				return
+
+			regions = []
+			for i in range(0, len(range_args), 2):
+				start = evaluate(range_args[i])
+				size = evaluate(range_args[i + 1])
+				if not start or not size:
+					print("[-] error: invalid range {0} {1}.".format(range_args[i], range_args[i + 1]))
+					return
+				regions.append(MemoryRegion(start, start + size))
+		else:
+			regions = get_memory_regions()
+
+		start_time = time.time()
+		writer = dump_memory_image(cmd[1], regions)
+		print("[+] Dumped {0:#x} bytes in {1} runs to {2} ({3:.2f}s).".format(
+			writer.total_size, len(writer.records), cmd[1], time.time() - start_time))
+
+	elif action == "load":
+		if len(cmd) < 2:
+			print("[-] error: please insert an image file path.")
+			print(help)
+			return
+
+		try:
+			reader = load_memory_image(cmd[1])
+		except (OSError, ValueError, LLDBMemoryException) as err:
+			print("[-] error: unable to load memory image: {0}".format(err))
+			return
+
+		print("[+] Loaded memory image {0}, {1} regions.".format(reader.name, len(reader.records)))
+
+	elif action == "unload":
+		if not unload_memory_image():
+			print("[-] error: no memory image loaded.")
+			return
+		print("[+] Memory reads go to the process again.")
+
+	elif action == "info":
+		reader = get_memory_reader()
+		if not reader.is_offline:
+			print("[+] Reading memory from the live process.")
+			return
+
+		print("[+] Reading memory from image {0}:".format(reader.name))
+		for region in reader.regions():
+			print("    0x{:016x}-0x{:016x} {:<4} {}".format(region.start, region.end, region.perm, region.name))
+
+	else:
+		print("[-] error: unrecognized command.")
+		print(help)
+
+def cmd_gdbfast(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Read memory over a pipelined gdb-remote connection. Use \'gdbfast help\' for more information.'''
+	help = """
+Open a second connection to the gdb-remote stub the target is attached to and
+use it for memory reads, several packets are kept in flight and pages are cached
+until the process resumes. Writes still go through lldb.
+
+Syntax: gdbfast connect [<host>:<port>] [<window>]
+        gdbfast off
+        gdbfast info
+
+Default stub address is 127.0.0.1:4242, default window is 16 packets.
+"""
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	action = cmd[0]
+	if action == "connect":
+		if is_offline():
+			print("[-] error: unload memory image first.")
+			return
+
+		host, port = "127.0.0.1", 4242
+		if len(cmd) > 1:
+			host, _, port_str = cmd[1].rpartition(":")
+			try:
+				port = int(port_str)
+			except ValueError:
+				print("[-] error: invalid stub address {0}.".format(cmd[1]))
+				return
+
+		window = 16
+		if len(cmd) > 2:
+			window = evaluate(cmd[2])
+			if not window:
+				print("[-] error: invalid window size.")
+				return
+
+		try:
+			reader = GdbRemoteMemoryReader(host or "127.0.0.1", port, window)
+		except (OSError, GdbRemoteException) as err:
+			print("[-] error: unable to connect to {0}:{1}: {2}".format(host, port, err))
+			return
+
+		prev_reader = set_memory_reader(reader)
+		if isinstance(prev_reader, GdbRemoteMemoryReader):
+			prev_reader.close()
+
+		print("[+] Connected to {0}:{1}, PacketSize {2:#x}, {3} reads, no-ack mode {4}.".format(
+			reader.host, reader.port, reader.packet_size, "binary" if reader.binary_upload else "hex",
+			"on" if reader.no_ack else "off"))
+
+	elif action == "off":
+		reader = get_memory_reader()
+		if not isinstance(reader, GdbRemoteMemoryReader):
+			print("[-] error: gdbfast is not connected.")
+			return
+
+		set_memory_reader(ProcessMemoryReader())
+		reader.close()
+		print("[+] Memory reads go through lldb again.")
+
+	elif action == "info":
+		reader = get_memory_reader()
+		if not isinstance(reader, GdbRemoteMemoryReader):
+			print("[+] gdbfast is not connected.")
+			return
+
+		print("[+] {0}:{1} PacketSize {2:#x} window {3}, {4} packets sent".format(
+			reader.host, reader.port, reader.packet_size, reader.window, reader.packets))
+		print("[+] page cache: {0} pages, {1} hits, {2} misses".format(
+			len(reader.cache.pages), reader.cache.hits, reader.cache.misses))
+
+	else:
+		print("[-] error: unrecognized command.")
+		print(help)
+
 def cmd_datawin(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	'''Configure address to display in data window. Use \'datawin help\' for more information.'''
 	help = """
@@ -1891,19 +2585,28 @@ def cmd_objc(debugger: SBDebugger, command: str, result: SBCommandReturnObject,
 		print(res.GetOutput())
 
 def cmd_pattern_create(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
-	pattern_length = parse_number(command) 
+	args = command.split()
+	if len(args) not in (1, 2):
+		print('pattern_create <length> [<n>] (n is the length of unique subsequences, default 3, up to 8)')
+		return
 
+	pattern_length = parse_number(args[0])
 	if pattern_length <= 0:
 		print('Invalid pattern_length')
 		return
 
-	print(cyclic(pattern_length).decode('utf-8'))
+	n = parse_number(args[1]) if len(args) == 2 else 3
+	if not 1 <= n <= 8:
+		print('Invalid n, must be between 1 and 8')
+		return
+
+	print(cyclic(pattern_length, n).decode('utf-8'))
 
 def cmd_pattern_offset(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
-	args = command.split(' ')
+	args = command.split()
 
-	if len(args) != 2:
-		print('pattern_offset <value / $register> <length (multiply by 8 for x64 and 4 for x86)>')
+	if len(args) not in (2, 3):
+		print('pattern_offset <value / $register> <length (multiply by 8 for x64 and 4 for x86)> [<n>]')
 		return
 
 	value = evaluate(args[0])
@@ -1912,12 +2615,106 @@ def cmd_pattern_offset(debugger: SBDebugger, command: str, result: SBCommandRetu
 		return
 
 	length = parse_number(args[1])
+	n = parse_number(args[2]) if len(args) == 3 else 3
+	if not 1 <= n <= 8:
+		print('Invalid n, must be between 1 and 8')
+		return
 
-	pos = cyclic_find(value, length)
+	pos = cyclic_find(value, length, n)
 	print('Value {0}{1}{2} locate at offset {3}{4}{5}'.format(
 		COLORS['YELLOW'], hex(value), COLORS['RESET'], COLORS['YELLOW'], hex(pos), COLORS['RESET'])
 	)
 
+def cmd_pattern_search(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Find cyclic pattern fragments in registers and memory around SP. Use \'pattern_search help\' for more information.'''
+	help = """
+Find registers and memory around the stack pointer that hold parts of the cyclic
+pattern generated by pattern_create, and report their offsets in the pattern.
+
+Syntax: pattern_search [<length>] [<n>] [-w <window>] [-r <address> <size>]...
+
+<length> and <n> must be at least the values given to pattern_create (default 0x10000 and 3).
+-w reads <window> bytes below and above SP, default 0x2000.
+-r adds more memory ranges to scan, e.g. a heap buffer.
+Note: expressions supported, do not use spaces between operators.
+"""
+
+	cmd = command.split()
+	if len(cmd) and cmd[0] == "help":
+		print(help)
+		return
+
+	window = 0x2000
+	ranges = []
+	args = []
+	i = 0
+	while i < len(cmd):
+		if cmd[i] == "-w" and i + 1 < len(cmd):
+			window = evaluate(cmd[i + 1])
+			i += 2
+		elif cmd[i] == "-r" and i + 2 < len(cmd):
+			start = evaluate(cmd[i + 1])
+			size = evaluate(cmd[i + 2])
+			if not start or not size:
+				print("[-] error: invalid range {0} {1}.".format(cmd[i + 1], cmd[i + 2]))
+				return
+			ranges.append((start, size))
+			i += 3
+		else:
+			args.append(cmd[i])
+			i += 1
+
+	if len(args) > 2 or not window:
+		print(help)
+		return
+
+	length = parse_number(args[0]) if len(args) > 0 else 0x10000
+	n = parse_number(args[1]) if len(args) > 1 else 3
+	if not 1 <= n <= 8:
+		print("[-] error: invalid n, must be between 1 and 8.")
+		return
+
+	# one register snapshot
+	pointer_size = get_pointer_size()
+	registers = get_gp_registers()
+
+	# one bulk read around SP, fall back to what is readable from SP up
+	stack_addr = get_current_sp()
+	if stack_addr:
+		stack_start = max(stack_addr - window, 0)
+		membuff = read_mem(stack_start, stack_addr + window - stack_start)
+		if not membuff:
+			stack_start = stack_addr
+			membuff = read_mem(stack_addr, window)
+		ranges.insert(0, (stack_start, len(membuff), membuff))
+
+	start_time = time.time()
+	print(COLORS["BOLD"] + "[registers]" + COLORS["RESET"])
+	for reg_name, value in registers.items():
+		if not value:
+			continue
+
+		reg_bytes = (value & ((1 << (pointer_size * 8)) - 1)).to_bytes(pointer_size, "little")
+		for match in cyclic_search(reg_bytes, 0, length, n, min(4, pointer_size)):
+			print("    {0:<6} = 0x{1:x} : byte {2} matches offset {3}{4:#x}{5} ({6} bytes)".format(
+				reg_name, value, match.address, COLORS["YELLOW"], match.offset, COLORS["RESET"], match.span))
+
+	print(COLORS["BOLD"] + "[memory]" + COLORS["RESET"])
+	total = 0
+	for mem_range in ranges:
+		start, size = mem_range[0], mem_range[1]
+		membuff = mem_range[2] if len(mem_range) == 3 else read_mem(start, size)
+		total += len(membuff)
+		for match in cyclic_search(membuff, start, length, n):
+			pointed_by = [reg_name for reg_name, value in registers.items()
+							if match.address <= value < match.address + match.span]
+			print("    0x{0:x} : offset {1}{2:#x}{3}, span {4:#x}{5}".format(
+				match.address, COLORS["YELLOW"], match.offset, COLORS["RESET"], match.span,
+				" <- " + ", ".join(pointed_by) if pointed_by else ""))
+
+	print("[+] Scanned {0} registers and {1:#x} bytes of memory ({2:.2f}s).".format(
+		len(registers), total, time.time() - start_time))
+
 # -----------------------------
 # modify eflags/rflags commands
 # -----------------------------
@@ -1944,9 +2741,9 @@ def modify_eflags(flag: str):
 
 	# finally update the value
 	if is_x64():
-		get_frame().reg["rflags"].value = format(eflags, '#x')
+		write_register("rflags", eflags)
 	elif is_i386():
-		get_frame().reg["eflags"].value = format(eflags, '#x')
+		write_register("eflags", eflags)
 
 def cmd_cfa(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	'''Change adjust flag. Use \'cfa help\' for more information.'''
@@ -2124,6 +2921,174 @@ def cmd_si(debugger: SBDebugger, command: str, result: SBCommandReturnObject, di
 	selected_target.process.selected_thread.StepInstruction(False)
 	result.SetStatus(lldb.eReturnStatusSuccessFinishNoResult)
 
+def cmd_record(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Single step and record registers into a trace file. Use \'record help\' for more information.'''
+	help = """
+Single step up to <count> instructions without drawing the context and save PC
+and changed registers of every step into a binary trace file, browse it
+later with replay.
+
+Syntax: record <count> [<stop address>] [-o <file>]
+
+Default trace file is /tmp/lldbinit_trace.bin.
+Note: expressions supported, do not use spaces between operators.
+"""
+
+	global RECORDING_TRACE
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	trace_file = "/tmp/lldbinit_trace.bin"
+	if "-o" in cmd:
+		idx = cmd.index("-o")
+		if idx + 1 >= len(cmd):
+			print("[-] error: please insert an output file.")
+			return
+		trace_file = cmd[idx + 1]
+		del cmd[idx:idx + 2]
+
+	count = evaluate(cmd[0])
+	if not count:
+		print("[-] error: invalid instruction count.")
+		return
+
+	stop_addr = evaluate(cmd[1]) if len(cmd) > 1 else 0
+
+	thread: SBThread = get_process().selected_thread
+	register_names = [reg.GetName() for reg in get_registers("general")]
+	writer = InstructionTraceWriter(trace_file, register_names)
+
+	start_time = time.time()
+	async_mode = debugger.GetAsync()
+	debugger.SetAsync(False)
+	RECORDING_TRACE = True
+	try:
+		writer.add(get_gp_registers())
+		for _ in range(count):
+			thread.StepInstruction(False)
+			if get_process().GetState() != lldb.eStateStopped:
+				break
+
+			registers = get_gp_registers()
+			writer.add(registers)
+			if stop_addr and get_current_pc() == stop_addr:
+				break
+	finally:
+		RECORDING_TRACE = False
+		debugger.SetAsync(async_mode)
+		writer.close()
+
+	print("[+] Recorded {0} steps to {1} ({2:.2f}s).".format(writer.steps, trace_file, time.time() - start_time))
+	debugger.HandleCommand("context")
+
+def display_replay_context():
+	'''Draw registers and code of the current replay step'''
+	global GlobalListOutput
+	GlobalListOutput = []
+
+	registers = REPLAY_TRACE.state_at(REPLAY_STEP)
+	pc = registers.get("rip", registers.get("eip", registers.get("pc", 0)))
+
+	color(COLOR_SEPARATOR)
+	output("-" * 100)
+	color("BOLD")
+	output("[replay {0}/{1}]\n".format(REPLAY_STEP, len(REPLAY_TRACE) - 1))
+	color("RESET")
+	# replayed values must not become the baseline of the live context
+	print_registers(registers, REPLAY_OLD_REGISTER)
+
+	color(COLOR_SEPARATOR)
+	output("-" * 100)
+	color("BOLD")
+	output("[code]\n")
+	color("RESET")
+	disassemble(pc, CONFIG_DISASSEMBLY_LINE_COUNT)
+	color(COLOR_SEPARATOR)
+	output("-" * 109)
+	color("RESET")
+	print("".join(GlobalListOutput))
+
+def cmd_replay(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Browse a trace recorded by record. Use \'replay help\' for more information.'''
+	help = """
+Browse an instruction trace recorded with record, the context view shows the
+recorded registers instead of the live process.
+
+Syntax: replay load [<file>]
+        replay next [<count>]
+        replay prev [<count>]
+        replay goto <step>
+        replay find <address>
+        replay info
+
+replay find moves to the next step where PC equals <address>.
+Note: expressions supported, do not use spaces between operators.
+"""
+
+	global REPLAY_TRACE
+	global REPLAY_STEP
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	action = cmd[0]
+	if action == "load":
+		trace_file = cmd[1] if len(cmd) > 1 else "/tmp/lldbinit_trace.bin"
+		try:
+			REPLAY_TRACE = InstructionTraceReader(trace_file)
+		except (OSError, ValueError) as err:
+			print("[-] error: unable to load trace: {0}".format(err))
+			return
+		REPLAY_STEP = 0
+		REPLAY_OLD_REGISTER.clear()
+		print("[+] Loaded {0} steps from {1}.".format(len(REPLAY_TRACE), trace_file))
+		if len(REPLAY_TRACE):
+			display_replay_context()
+		return
+
+	if REPLAY_TRACE == None or len(REPLAY_TRACE) == 0:
+		print("[-] error: no trace loaded, use replay load first.")
+		return
+
+	last_step = len(REPLAY_TRACE) - 1
+	if action in ("next", "prev"):
+		count = evaluate(cmd[1]) if len(cmd) > 1 else 1
+		if action == "prev":
+			count = -count
+		REPLAY_STEP = min(max(REPLAY_STEP + count, 0), last_step)
+
+	elif action == "goto":
+		step = parse_number(cmd[1]) if len(cmd) > 1 else -1
+		if not 0 <= step <= last_step:
+			print("[-] error: step must be between 0 and {0}.".format(last_step))
+			return
+		REPLAY_STEP = step
+
+	elif action == "find":
+		address = evaluate(cmd[1]) if len(cmd) > 1 else 0
+		pc_name = next((name for name in ("rip", "eip", "pc") if name in REPLAY_TRACE.register_names), "")
+		step = REPLAY_TRACE.find_pc(pc_name, address, REPLAY_STEP + 1) if address and pc_name else -1
+		if step == -1:
+			print("[-] error: address not found after step {0}.".format(REPLAY_STEP))
+			return
+		REPLAY_STEP = step
+
+	elif action == "info":
+		print("[+] {0}: step {1}/{2}.".format(REPLAY_TRACE.path, REPLAY_STEP, last_step))
+		return
+
+	else:
+		print("[-] error: unrecognized command.")
+		print(help)
+		return
+
+	display_replay_context()
+
 def c(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	debugger.SetAsync(True)
 	selected_target: SBTarget = debugger.GetSelectedTarget()
@@ -2706,6 +3671,10 @@ def cmd_xnu_kdp_reboot(debugger: SBDebugger, command: str, result: SBCommandRetu
 		print('Target is not connect over kdp')
 		return False
 	
+	# kdp_pmap must point to the kernel pmap again before the machine goes down
+	if not leave_user_address_space():
+		return False
+
 	print('[+] Reboot the remote machine')
 	debugger.HandleCommand('process plugin packet send --command 0x13')
 	debugger.HandleCommand('detach')
@@ -2839,12 +3808,21 @@ def cmd_xnu_show_chunk_with_regex(debugger: SBDebugger, command: str, result: SB
 		print('[!] Unable to find any zone')
 		return False
 
+	# resolve the owning zone once from the page metadata, walk zones only if that fails
+	chunk = XNU_ZONES.lookup_chunk(chunk_addr)
+	if chunk != None:
+		zone_idxs = {zone.get_attribute('zone_idx') for zone in zones}
+		if chunk[0].get_attribute('zone_idx') not in zone_idxs:
+			print(f'[+] Your chunk address belongs to zone {chunk[0].get_attribute("zone_name")}.')
+			return True
+		zones = [chunk[0]]
+
 	for zone in zones:
 		zone_name = zone.get_attribute('zone_name')
 		zone_idx = zone.get_attribute('zone_idx')
 		print(f'[+] zone_array[{zone_idx}]({zone_name}) : ', end='')
 
-		status = XNU_ZONES.get_chunk_info_at_zone(zone, chunk_addr)
+		status = chunk[2] if chunk != None else XNU_ZONES.get_chunk_info_at_zone(zone, chunk_addr)
 		if status != 'None':
 			color = COLORS["GREEN"]
 			if status == 'Freed':
@@ -2896,14 +3874,116 @@ def cmd_xnu_find_chunk(debugger: SBDebugger, command: str, result: SBCommandRetu
 		zone_idx = info['zone_idx']
 		status = info['status']
 		print(f'[+] zone_array[{zone_idx}] ({zone_name}) - 0x{chunk_addr:X}({status})')
+		if info['element'] != chunk_addr:
+			print(f'[+] Inside element 0x{info["element"]:X} (+0x{chunk_addr - info["element"]:X})')
 	else:
 		print('[+] Your chunk address is not found in any zones.')
 	
 	return True
 
+def cmd_xnu_zone_census(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Zone allocation census and diff between stops. Use \'zone_census help\' for more information.'''
+	help = """
+Record allocated and free elements of zones and report what changed between two stops.
+
+Syntax: zone_census save <name> [<zone_name_regex>]...
+        zone_census diff <old> [<new>] [-v]
+        zone_census list
+        zone_census delete <name>
+
+Without regex all zones are recorded.
+If <new> is omitted, <old> is compared against the current zones.
+-v prints every allocated/freed element instead of counts only.
+"""
+
+	global XNU_ZONES
+	global ZONE_CENSUSES
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	if not XNU_ZONES.is_loaded and not XNU_ZONES.load_from_kernel(debugger.GetSelectedTarget()):
+		return
+
+	action = cmd[0]
+	if action == "save":
+		if len(cmd) < 2:
+			print("[-] error: please insert a census name.")
+			print(help)
+			return
+
+		if len(cmd) > 2:
+			zone_idxs = sorted({zone.get_attribute('zone_idx') for regex in cmd[2:] for zone in XNU_ZONES.get_zones_by_regex(regex)})
+		else:
+			zone_idxs = list(range(len(XNU_ZONES)))
+		if not zone_idxs:
+			print("[-] error: no zone matches.")
+			return
+
+		census = take_zone_census(XNU_ZONES, cmd[1], zone_idxs)
+		ZONE_CENSUSES[cmd[1]] = census
+		allocated = sum(census.counts(idx)[0] for idx in zone_idxs)
+		print("[+] Census \"{0}\": {1} zones, {2} allocated elements ({3:.2f}s).".format(
+			cmd[1], len(zone_idxs), allocated, census.elapsed))
+
+	elif action == "diff":
+		if len(cmd) < 2:
+			print("[-] error: please insert census names.")
+			print(help)
+			return
+
+		verbose = "-v" in cmd
+		names = [arg for arg in cmd[1:] if arg != "-v"]
+		try:
+			old = ZONE_CENSUSES[names[0]]
+			new = ZONE_CENSUSES[names[1]] if len(names) > 1 else take_zone_census(XNU_ZONES, "current", list(old.chunks))
+		except KeyError as err:
+			print("[-] error: census {0} not found.".format(err))
+			return
+
+		diffs = diff_zone_census(old, new)
+		if not diffs:
+			print("[+] No allocation changes.")
+			return
+
+		for zone_idx, (allocated, freed) in sorted(diffs.items()):
+			zone_name = XNU_ZONES.zone_table[zone_idx].name
+			print("[+] zone_array[{0}]({1}): {2}+{3} allocated, {4}-{5} freed".format(
+				zone_idx, zone_name, COLORS["GREEN"], len(allocated), COLORS["RED"], len(freed)) + COLORS["RESET"])
+			if verbose:
+				for elem in allocated:
+					print("    {0}+ 0x{1:x}{2}".format(COLORS["GREEN"], elem, COLORS["RESET"]))
+				for elem in freed:
+					print("    {0}- 0x{1:x}{2}".format(COLORS["RED"], elem, COLORS["RESET"]))
+
+	elif action == "list":
+		for name, census in ZONE_CENSUSES.items():
+			print("[+] {0}: stop {1}, {2} zones".format(name, census.stop_id, len(census.chunks)))
+
+	elif action == "delete":
+		if len(cmd) < 2 or ZONE_CENSUSES.pop(cmd[1], None) == None:
+			print("[-] error: census not found.")
+			return
+		print("[+] Deleted census {0}.".format(cmd[1]))
+
+	else:
+		print("[-] error: unrecognized command.")
+		print(help)
+
 def cmd_xnu_zone_reload(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	global XNU_ZONES
-	if XNU_ZONES.is_loaded:
+	args = command.split()
+	if args and args[0] != '-f':
+		print('zone_reload [-f]')
+		return
+
+	# -f rebuilds the whole zone table, e.g after a reboot or a re-attach
+	if XNU_ZONES.is_loaded and not args:
+		# names and element sizes don't change, only refresh page queues and logging
+		XNU_ZONES.refresh()
+		print('[+] Refreshed XNU_ZONES')
 		return
 	
 	print('[+] Reload XNU_ZONES')
@@ -2973,7 +4053,13 @@ def cmd_xnu_to_offset(debugger: SBDebugger, command: str, result: SBCommandRetur
 		return
 
 	kext_name = args[0]
-	address = evaluate(args[1])
+	symbol_index = get_symbol_index()
+	try:
+		address = parse_number(args[1])
+	except ParseValueError:
+		# only names go through the symbol index, finding one builds it
+		symbol_addresses = symbol_index.find(args[1]) if re.match(r'^[A-Za-z_]', args[1]) else []
+		address = symbol_addresses[0] if symbol_addresses else evaluate(args[1])
 
 	try:
 		kext_info = KEXT_INFO_DICTIONARY[kext_name]
@@ -2983,28 +4069,27 @@ def cmd_xnu_to_offset(debugger: SBDebugger, command: str, result: SBCommandRetur
 
 	offset = address - kext_info.address
 	print(f'Offsset from Kext {kext_name} base address : 0x{offset:X}')
+	symbol_name, symbol_offset = symbol_index.symbolicate(address)
+	if symbol_name:
+		print(f'Symbol : {symbol_name}+0x{symbol_offset:X}')
 
 def cmd_xnu_list_all_process(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	xnu_list_all_process()
 
 def cmd_xnu_find_process_by_name(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
-	args = command.split(' ')
+	args = command.split()
 	if len(args) < 1:
-		print('showproc <process name>')
+		print('showproc <process name | pid>')
 		return
 
 	proc_name = args[0]
-	proc = xnu_find_process_by_name(proc_name)
+	proc = xnu_find_proc_info(proc_name)
 	if proc == None:
 		print(f'[!] Couldn\'t found your process {proc_name}')
 		return
 
-	p_name = proc.get('p_name').str_value
-	p_pid = proc.get('p_pid').int_value
-	task = get_ipc_task(proc)
-
 	print(f'+ {"PID":<5} | {"Proc Name":<40} | {"Proc Address":<20} | {"Task Address":<20}')
-	print(f'+ {p_pid:<5} | {p_name:<40} | {proc.int_value:#20x} | {task.int_value:#20x}')
+	print(f'+ {proc.pid:<5} | {proc.name:<40} | {proc.address:#20x} | {proc.task:#20x}')
 
 def cmd_xnu_read_usr_addr(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	args = command.split(' ')
@@ -3013,7 +4098,7 @@ def cmd_xnu_read_usr_addr(debugger: SBDebugger, command: str, result: SBCommandR
 		return
 
 	process_name = args[0]
-	proc = xnu_find_process_by_name(process_name)
+	proc = xnu_find_proc_info(process_name)
 	if proc == None:
 		print('[!] Process does not found.')
 		return
@@ -3024,7 +4109,7 @@ def cmd_xnu_read_usr_addr(debugger: SBDebugger, command: str, result: SBCommandR
 	except (TypeError, ValueError):
 		size = 0x20
 
-	raw_data = xnu_read_user_address(proc.get('task'), user_space_addr, size)
+	raw_data = xnu_read_user_address(ESBValue.init_with_address(proc.task, 'task *'), user_space_addr, size)
 	print(hexdump(user_space_addr, raw_data, " ", 16))
 
 def cmd_xnu_set_kdp_pmap(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
@@ -3032,17 +4117,22 @@ def cmd_xnu_set_kdp_pmap(debugger: SBDebugger, command: str, result: SBCommandRe
 		print('[!] cmd_xnu_set_kdp_pmap() only works on kdp-remote')
 		return
 
+	if get_user_address_space() != None:
+		# the session page cache belongs to the pmap it switched to
+		print('[!] A useras session is active, leave it with "useras exit" first.')
+		return
+
 	args = command.split(' ')
 	if len(args) < 1:
 		print('setkdp <process name>')
 		return
 	
-	target_proc = xnu_find_process_by_name(args[0])
+	target_proc = xnu_find_proc_info(args[0])
 	if target_proc == None:
 		print(f'[!] Process {args[0]} does not found')
 		return
 	
-	if xnu_write_task_kdp_pmap(target_proc.get('task')):
+	if xnu_write_task_kdp_pmap(ESBValue.init_with_address(target_proc.task, 'task *')):
 		print('[+] Set kdp_pmap ok.')
 	else:
 		print('[!] Set kdp_pmap failed.')
@@ -3052,17 +4142,176 @@ def cmd_xnu_reset_kdp_pmap(ddebugger: SBDebugger, command: str, result: SBComman
 		print('[!] cmd_xnu_set_kdp_pmap() only works on kdp-remote')
 		return
 
+	if get_user_address_space() != None:
+		print('[!] A useras session is active, leave it with "useras exit" first.')
+		return
+
 	if not xnu_reset_kdp_pmap():
 		print(f'[!] Reset kdp_pmap failed.')
 		return
 
 	print('[+] Reset kdp_pmap ok.')
 
+def cmd_xnu_show_ports(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	args = command.split()
+	if len(args) < 1:
+		print('showports <process name | pid> [<rights>]')
+		return
+
+	proc = xnu_find_proc_info(args[0])
+	if proc == None:
+		print(f'[!] Couldn\'t found your process {args[0]}')
+		return
+
+	print_ipc_information(proc, args[1] if len(args) > 1 else '')
+
+def cmd_xnu_port_holders(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Show who holds rights to a port. Use \'portholders help\' for more information.'''
+	help = """
+Show the receiver of a port and every task naming it in its ipc space.
+
+Syntax: portholders <ipc_port address> [S|R|O]
+
+S, R and O only list tasks holding send, receive or send-once rights.
+"""
+
+	args = command.split()
+	if len(args) < 1 or args[0] == "help":
+		print(help)
+		return
+
+	right_types = {
+		'S': MACH_PORT_TYPE_SEND,
+		'R': MACH_PORT_TYPE_RECEIVE,
+		'O': MACH_PORT_TYPE_SEND_ONCE
+	}
+	right_type = IE_BITS_TYPE_MASK
+	if len(args) > 1:
+		if args[1] not in right_types:
+			print(help)
+			return
+		right_type = right_types[args[1]]
+
+	port = evaluate(args[0])
+	if not port:
+		print(f"[-] error: invalid port address {args[0]}.")
+		return
+
+	ipc_index = get_ipc_index()
+	if ipc_index == None:
+		return
+
+	if port not in ipc_index.holders:
+		print(f"[-] error: no task names port {port:#x}.")
+		return
+
+	destname, destination = ipc_index.destination(port)
+	print(f"[+] port {port:#x}: {destname.strip()} {destination}")
+	print(f'+ {"PID":<5} | {"Proc Name":<40} | {"Name":<12} | {"Rights":<8} | {"Urefs":<8}')
+	for proc, entry in ipc_index.holders_of(port, right_type):
+		print(f'+ {proc.pid:<5} | {proc.name:<40} | {hex(entry.name):<12} | {ipc_index.entry_rights(entry):<8} | {entry.urefs:<8}')
+
+def get_user_address_space() -> Optional[Tuple[ProcInfo, UserAddressSpace]]:
+	'''
+		Active useras session, a session the process resumed from is ended here
+	'''
+	global USER_ADDRESS_SPACE
+
+	if USER_ADDRESS_SPACE != None:
+		_, session = USER_ADDRESS_SPACE
+		session.stop_if_stale()
+		if not session.is_active:
+			USER_ADDRESS_SPACE = None
+	return USER_ADDRESS_SPACE
+
+def leave_user_address_space() -> bool:
+	'''
+		End the useras session and restore kdp_pmap, return False if that failed
+	'''
+	global USER_ADDRESS_SPACE
+
+	if get_user_address_space() == None:
+		return True
+
+	proc, session = USER_ADDRESS_SPACE
+	USER_ADDRESS_SPACE = None
+	if not session.stop():
+		print("[-] error: reset kdp_pmap failed.")
+		return False
+
+	print(f"[+] Left address space of {proc.name} (pid {proc.pid}).")
+	return True
+
+def cmd_xnu_user_address_space(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Serve memory reads from a process address space. Use \'useras help\' for more information.'''
+	help = """
+Switch kdp_pmap to the pmap of a process once and serve every following memory read/write
+(db/dd/dq, hexdump, context...) from that address space until the session ends.
+Pages read in the session are cached per pmap, the original kdp_pmap is restored on exit.
+The session ends by itself once the process resumes, detaches or is re-attached,
+and before kdp-reboot.
+
+Syntax: useras <proc_name|pid>
+        useras exit
+        useras status
+
+Only works on kdp-remote.
+"""
+
+	global USER_ADDRESS_SPACE
+
+	cmd = command.split()
+	if len(cmd) == 0 or cmd[0] == "help":
+		print(help)
+		return
+
+	if cmd[0] == "status":
+		if get_user_address_space() == None:
+			print("[+] Reading kernel address space.")
+			return
+
+		proc, session = USER_ADDRESS_SPACE
+		print(f"[+] Reading address space of {proc.name} (pid {proc.pid}), pmap = {session.pmap:#x}")
+		print(f"[+] Page cache: {len(session.cache.pages)} pages, {session.cache.hits} hits, {session.cache.misses} misses")
+		return
+
+	if not leave_user_address_space():
+		return
+
+	if cmd[0] == "exit":
+		return
+
+	proc = xnu_find_proc_info(cmd[0])
+	if proc == None:
+		print(f"[-] error: process {cmd[0]} not found.")
+		return
+
+	session = UserAddressSpace(ESBValue.init_with_address(proc.task, 'task *'))
+	try:
+		session.start()
+	except LLDBMemoryException as err:
+		print(f"[-] error: {err}")
+		return
+
+	USER_ADDRESS_SPACE = (proc, session)
+	print(f"[+] Reading address space of {proc.name} (pid {proc.pid}), use 'useras exit' to leave.")
+
 ## ----- IOKit commands ----- ##
 def cmd_iokit_print(ddebugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
-	args = command.split(' ')
-	if len(args) < 1:
-		print('cmd_iokit_print <address>')
+	'''Display readable iokit object. Use \'iokit_print help\' for more information.'''
+	help = """
+Decode an OSDictionary/OSArray/OSSet/OSOrderedSet/OSString/OSSymbol/OSData/OSNumber/OSBoolean
+object and everything it references.
+
+Syntax: iokit_print <address> [-j [<file>]]
+
+-j prints the object as JSON, or writes it to <file>.
+OSData is exported as a hex string, a reference back to an enclosing container as {"$ref": "<address>"}.
+"""
+
+	args = command.split()
+	if len(args) < 1 or args[0] == "help":
+		print(help)
 		return
 	
 	address = evaluate(args[0])
@@ -3070,8 +4319,32 @@ def cmd_iokit_print(ddebugger: SBDebugger, command: str, result: SBCommandReturn
 		print(f'[!] Unable to detect iokit object at {address}')
 		return
 	
-	iokit_print(address)
-	return
+	if len(args) < 2:
+		iokit_print(address)
+		return
+
+	if args[1] != '-j':
+		print(help)
+		return
+
+	iokit_object = iokit_decode(address)
+	if iokit_object.class_name not in IOKIT_OBJECTS:
+		print(f'[!] Unable to detect iokit object at {hex(address)}')
+		return
+
+	json_str = json.dumps(iokit_object.to_json(), indent=2)
+	if len(args) < 3:
+		print(json_str)
+		return
+
+	try:
+		with open(args[2], 'w') as f:
+			f.write(json_str)
+	except OSError as err:
+		print(f'[-] error: {err}')
+		return
+
+	print(f'[+] Exported {iokit_object.class_name} at {hex(address)} to {args[2]}')
 
 def cmd_iokit_type(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	args = command.split(' ')
@@ -3208,12 +4481,12 @@ def display_stack():
 	if stack_addr == 0:
 		return
 
-	membuff = read_mem(stack_addr, 0x100)
+	membuff = read_mem(stack_addr, 0x40)
 	if len(membuff) == 0:
 		print("[-] error: not enough bytes read.")
 		return
 
-	output(hexdump(stack_addr, membuff, " ", 16, 4))
+	output("\n".join(hexdump_lines(stack_addr, membuff, pointer_size=POINTER_SIZE)))
 
 def display_data():
 	'''Hex dump current data window pointer'''
@@ -3221,12 +4494,12 @@ def display_data():
 	if data_addr == 0:
 		return
 
-	membuff = read_mem(data_addr, 0x100)
+	membuff = read_mem(data_addr, 0x40)
 	if len(membuff) == 0:
 		print("[-] error: not enough bytes read.")
 		return
 
-	output(hexdump(data_addr, membuff, " ", 16, 4))
+	output("\n".join(hexdump_lines(data_addr, membuff, pointer_size=POINTER_SIZE)))
 
 # workaround for lldb bug regarding RIP addressing outside main executable
 def get_rip_relative_addr(source_address: int) -> int:
@@ -3251,6 +4524,13 @@ def get_rip_relative_addr(source_address: int) -> int:
 	rip_call_addr = source_address + inst_size + data
 	return rip_call_addr
 
+def evaluate_operand(operand: str) -> int:
+	'''Evaluate a register based operand like "rax + 0x10", lldb is only used as fallback'''
+	try:
+		return evaluate_native(operand)
+	except NativeExpressionException:
+		return ESBValue.init_with_expression(f'${operand}').int_value
+
 # XXX: instead of reading memory we can dereference right away in the evaluation
 def get_indirect_flow_target(source_address: int) -> int:
 	operand = get_operands(source_address).lower()
@@ -3268,8 +4548,7 @@ def get_indirect_flow_target(source_address: int) -> int:
 			if x == None:
 				return 0
 
-			value = ESBValue.init_with_expression(f'${x.group(1)}')
-			deref_addr = value.int_value
+			deref_addr = evaluate_operand(x.group(1))
 			if "rip" in operand:
 				deref_addr = deref_addr + get_inst_size(source_address)
 		else:
@@ -3277,8 +4556,7 @@ def get_indirect_flow_target(source_address: int) -> int:
 			if x == None:
 				return 0
 				
-			value = ESBValue.init_with_expression(f'${x.group(1)}')
-			deref_addr = value.int_value
+			deref_addr = evaluate_operand(x.group(1))
 		
 		# now we can dereference and find the call target
 		return read_pointer_from(deref_addr, POINTER_SIZE)
@@ -3299,8 +4577,7 @@ def get_indirect_flow_target(source_address: int) -> int:
 			# handle branch with link register with pointer authentication
 			operand = operand.split(',')[0].strip(' ')
 
-		operand_value = ESBValue.init_with_expression(f'${operand}')
-		return operand_value.int_value
+		return evaluate_operand(operand)
 
 	# RIP relative calls
 	elif operand.startswith('0x'):
@@ -3496,8 +4773,16 @@ def get_objectivec_selector(src_addr: int) -> str:
 # The heart of lldbinit - when lldb stop this is where we land 
 # ------------------------------------------------------------
 
-def print_cpu_registers(register_names: List[str]):
-	registers = get_gp_registers()
+def print_cpu_registers(register_names: List[str], registers: Optional[Dict[str, int]] = None,
+						previous: Optional[Dict[str, int]] = None):
+	'''
+		previous holds the values shown last time to highlight modified registers,
+		old_register of the live process by default
+	'''
+	if registers == None:
+		registers = get_gp_registers()
+	if previous == None:
+		previous = old_register
 	break_flag = False
 	reg_flag_val = -1
 	reg_val = -1
@@ -3541,7 +4826,7 @@ def print_cpu_registers(register_names: List[str]):
 					color("RED")
 
 				else:
-					if reg_val == old_register[register_name]:
+					if reg_val == previous[register_name]:
 						color(get_color_status(reg_val))
 					else:
 						color(COLOR_REGVAL_MODIFIED)
@@ -3556,15 +4841,15 @@ def print_cpu_registers(register_names: List[str]):
 				else:
 					output("0x%.08X" % (reg_val))
 
-			old_register[register_name] = reg_val
+			previous[register_name] = reg_val
 
 		if (not break_flag) and (i % 4 == 0) and i != 0:
 			output('\n')
 
 	if is_x64() or is_i386():
-		dump_jumpx86(reg_flag_val)
+		dump_jumpx86(reg_flag_val, registers.get('rip', registers.get('eip', 0)))
 	elif is_aarch64():
-		dump_jump_arm64(reg_flag_val)
+		dump_jump_arm64(reg_flag_val, registers.get('pc', 0))
 	
 	output("\n")
 		
@@ -3582,18 +4867,16 @@ def dump_eflags(eflags: int):
 			output(flag[0].lower() + " ")
 
 # function to dump the conditional jumps results
-def dump_jumpx86(eflags: int):
+def dump_jumpx86(eflags: int, pc_addr: int = 0):
 	# masks and flags from https://github.com/ant4g0nist/lisa.py
 	masks = { "CF":0, "PF":2, "AF":4, "ZF":6, "SF":7, "TF":8, "IF":9, "DF":10, "OF":11 }
 	flags = { key: bool(eflags & (1 << value)) for key, value in masks.items() }
 
-	if is_i386():
-		pc_addr = get_gp_register("eip")
-	elif is_x64():
-		pc_addr = get_gp_register("rip")
-	else:
+	if not is_i386() and not is_x64():
 		print("[-] dump_jumpx86() error: wrong architecture.")
 		return
+	if not pc_addr:
+		pc_addr = get_gp_register("eip" if is_i386() else "rip")
 
 	mnemonic = get_mnemonic(pc_addr)
 	color("RED")
@@ -3742,15 +5025,15 @@ def dump_cpsr(cpsr: int):
 		else:
 			output(flag.lower() + " ")
 
-def dump_jump_arm64(cpsr: int):
+def dump_jump_arm64(cpsr: int, pc_addr: int = 0):
 	masks = { 'N': 31, 'Z':30, 'C':29, 'V': 28, 'Q':27, 'J':24, 'E':9, 'A':8, 'I':7, 'F':6, 'T':5}
 	flags = { key: bool(cpsr & (1 << value)) for key, value in masks.items() }
 
-	if is_aarch64():
-		pc_addr = get_gp_register("pc")
-	else:
+	if not is_aarch64():
 		print("[-] dump_jump_arm64() error: wrong architecture.")
 		return
+	if not pc_addr:
+		pc_addr = get_gp_register("pc")
 
 	mnemonic = get_mnemonic(pc_addr)
 	color("RED")
@@ -3819,27 +5102,38 @@ def dump_jump_arm64(cpsr: int):
 	
 	color("RESET")
 
-def print_registers():
+def get_register_format() -> List[str]:
 	if is_i386(): 
-		register_format = x86_registers
+		return x86_registers
 	elif is_x64():
-		register_format = x86_64_registers
+		return x86_64_registers
 	elif is_arm():
-		register_format = arm_32_registers
+		return arm_32_registers
 	elif is_aarch64():
-		register_format = aarch64_registers
+		return aarch64_registers
 	else:
 		raise OSError('Unsupported Architecture')
 
-	print_cpu_registers(register_format)
+def print_registers(registers: Optional[Dict[str, int]] = None, previous: Optional[Dict[str, int]] = None):
+	print_cpu_registers(get_register_format(), registers, previous)
 
 prev_disas_addr = 0
 PREV_INSTRUCTION_NUM = CONFIG_DISASSEMBLY_LINE_COUNT // 2 # number of previous execution instruction to be displayed
 
 def HandleHookStopOnTarget(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
 	'''Display current code context.'''
-	# Don't display anything if we're inside Xcode
-	if is_in_Xcode():
+	# a useras session doesn't outlive the stop it was started in
+	get_user_address_space()
+
+	# evaluate() results are reused while one context is drawn, not across
+	# commands: "register write" or "memory write" may run in between
+	with evaluate_batch():
+		return display_context(debugger, command, result, dict)
+
+def display_context(debugger: SBDebugger, command: str, result: SBCommandReturnObject, dict: Dict):
+	'''Draw the register, stack, data, flow and code windows'''
+	# Don't display anything if we're inside Xcode or while recording a trace
+	if is_in_Xcode() or RECORDING_TRACE:
 		return
 	
 	global GlobalListOutput
@@ -2,7 +2,7 @@
 	lldbinit core functions
 	Author : peternguyen
 '''
-from typing import List, Dict, Union, Optional, Type, Set, Any, Generic, TypeVar, Tuple, Iterator
+from typing import List, Dict, Union, Optional, Type, Set, Any, Generic, TypeVar, Tuple, Iterator, Callable
 import typing
 from typing_extensions import Self
 from lldb import SBDebugger, SBFrame, SBProcess, SBThread, SBTarget, SBAddress, \
@@ -15,10 +15,29 @@ import re
 from subprocess import Popen, PIPE, check_call, CalledProcessError
 from pathlib import Path
 from struct import pack, unpack
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from types import CodeType
 import struct
 import platform
 import time
+import hashlib
+import zlib
+import mmap
+import json
+import bisect
+import array
+import functools
+import contextlib
+import socket
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import deque
+from abc import ABC, abstractmethod
+
+try:
+	import xxhash
+	CONFIG_XXHASH_AVAILABLE = 1
+except ImportError:
+	CONFIG_XXHASH_AVAILABLE = 0
 
 # default colors - modify as you wish
 COLOR_REGVAL           = "WHITE"
@@ -119,6 +138,32 @@ def get_process() -> SBProcess:
 	'''
 	return get_target().process
 
+def get_stop_id() -> int:
+	'''
+		Return the stop generation of the current process, it changes every
+		time the process resumes so caches keyed by it are dropped automatically
+	'''
+	process = get_process()
+	if not process:
+		return 0
+
+	return process.GetStopID()
+
+def get_frame_key() -> Tuple[int, int, int]:
+	'''
+		Return (stop id, selected thread id, selected frame index), register
+		values depend on all three
+	'''
+	process = get_process()
+	if not process:
+		return 0, 0, 0
+
+	thread: SBThread = process.GetSelectedThread()
+	if not thread.IsValid():
+		return process.GetStopID(), 0, 0
+
+	return process.GetStopID(), thread.GetThreadID(), thread.GetSelectedFrame().GetFrameID()
+
 def get_frame() -> SBFrame:
 	frame = None
 
@@ -188,6 +233,48 @@ def get_c_array_addr(value: SBValue) -> int:
 
 	return 0
 
+class EvaluateCache(object):
+	'''
+		Bounded memo of evaluate() results, only kept inside evaluate_batch():
+		lldb's own register write and memory write can't be seen from here.
+		Also dropped whenever the process stop id, the selected thread/frame or
+		the memory source changes, and on register or memory writes
+	'''
+
+	def __init__(self: Self, max_size: int = 0x200):
+		self.max_size = max_size
+		self.values: Dict[str, int] = {}
+		self.generation: Tuple[Tuple[int, int, int], int] = ((-1, -1, -1), -1)
+		# nesting level of evaluate_batch()
+		self.depth = 0
+
+	def sync(self: Self):
+		generation = (get_frame_key(), id(MEMORY_READER))
+		if generation != self.generation:
+			self.values.clear()
+			self.generation = generation
+
+	def get(self: Self, command: str) -> Optional[int]:
+		if not self.depth:
+			return None
+
+		self.sync()
+		return self.values.get(command)
+
+	def put(self: Self, command: str, value: int):
+		if not self.depth:
+			return
+
+		if len(self.values) >= self.max_size:
+			# drop the oldest entry
+			del self.values[next(iter(self.values))]
+		self.values[command] = value
+
+	def invalidate(self: Self):
+		self.values.clear()
+
+EVALUATE_CACHE = EvaluateCache()
+
 def evaluate(command: str) -> int:
 	'''
 		Trying to parse command in str format into address
@@ -197,33 +284,197 @@ def evaluate(command: str) -> int:
 		                -> if not get address of this variable (&var)
 		- hex string -> convert to int
 		- int string -> convert to int
+		Results other than numbers are memoized inside evaluate_batch().
 	'''
 	# assume command is number
 	try:
 		return parse_number(command)
 	
 	except ParseValueError:
-		# assume command is variable
-		try:
-			some_var = ESBValue(command)
-			if not some_var.is_valid:
-				# this command is not variable name, assum command is lldb command
-				raise ESBValueException
-			
-			if some_var.value == None:
-				# this variable name doesn't hold address, get address of this some_var instead
-				return some_var.addr_of()
+		value = EVALUATE_CACHE.get(command)
+		if value == None:
+			value = evaluate_symbol(command)
+			EVALUATE_CACHE.put(command, value)
+		return value
+
+def evaluate_symbol(command: str) -> int:
+	# simple address expressions don't need lldb
+	try:
+		return evaluate_native(command)
+	except NativeExpressionException:
+		pass
 
-			return some_var.int_value
+	# assume command is variable
+	try:
+		some_var = ESBValue(command)
+		if not some_var.is_valid:
+			# this command is not variable name, assum command is lldb command
+			raise ESBValueException
+		
+		if some_var.value == None:
+			# this variable name doesn't hold address, get address of this some_var instead
+			return some_var.addr_of()
 
-		except ESBValueException:
-			# assume command is lldb command
-			some_express = ESBValue.init_with_expression(command)
-			if some_express.is_valid:
-				return some_express.int_value
+		return some_var.int_value
+
+	except ESBValueException:
+		# assume command is lldb command
+		some_express = ESBValue.init_with_expression(command)
+		if some_express.is_valid:
+			return some_express.int_value
 
 	return 0
 
+class NativeExpressionException(Exception):
+	def __init__(self, *args: object) -> None:
+		super().__init__(*args)
+
+NATIVE_EXPRESSION_TOKEN = re.compile(r'\s*(?:(0[xX][0-9a-fA-F]+|\d+)|(\$?[A-Za-z_.][\w.$:@]*)|(<<|>>|[-+*&|~()\[\]]))')
+NATIVE_EXPRESSION_SIZES = { 'byte': 1, 'word': 2, 'dword': 4, 'qword': 8 }
+
+class NativeExpressionParser(object):
+	'''
+		Evaluate address expressions without the lldb expression parser:
+		  integers, registers ($rsp or rsp), code symbols from the symbol index,
+		  + - * << >> & | ~, parentheses,
+		  dereferences *expr, [expr] and byte/word/dword/qword [ptr] [expr]
+		Raises NativeExpressionException for anything else, like C casts.
+	'''
+
+	def __init__(self: Self, text: str, registers: Dict[str, int]):
+		self.registers = registers
+		self.tokens: List[Tuple[str, str]] = []
+		pos = 0
+		text = text.rstrip()
+		while pos < len(text):
+			m = NATIVE_EXPRESSION_TOKEN.match(text, pos)
+			if m == None:
+				raise NativeExpressionException(f'unexpected character at {pos}')
+			kind = 'num' if m.group(1) else 'name' if m.group(2) else 'op'
+			self.tokens.append((kind, m.group(m.lastindex)))
+			pos = m.end()
+		self.pos = 0
+
+	def peek(self: Self) -> Tuple[str, str]:
+		return self.tokens[self.pos] if self.pos < len(self.tokens) else ('end', '')
+
+	def next(self: Self) -> Tuple[str, str]:
+		token = self.peek()
+		self.pos += 1
+		return token
+
+	def expect(self: Self, op: str):
+		if self.next() != ('op', op):
+			raise NativeExpressionException(f'expected {op}')
+
+	def parse(self: Self) -> int:
+		value = self.parse_binary(0)
+		if self.peek()[0] != 'end':
+			raise NativeExpressionException(f'unexpected {self.peek()[1]}')
+		return value & 0xffffffffffffffff
+
+	# binary operators from the lowest precedence
+	BINARY_LEVELS = (('|',), ('&',), ('<<', '>>'), ('+', '-'), ('*',))
+
+	def parse_binary(self: Self, level: int) -> int:
+		if level == len(self.BINARY_LEVELS):
+			return self.parse_unary()
+
+		value = self.parse_binary(level + 1)
+		while self.peek()[0] == 'op' and self.peek()[1] in self.BINARY_LEVELS[level]:
+			op = self.next()[1]
+			rhs = self.parse_binary(level + 1)
+			if op == '|': value |= rhs
+			elif op == '&': value &= rhs
+			elif op == '<<': value <<= rhs
+			elif op == '>>': value >>= rhs
+			elif op == '+': value += rhs
+			elif op == '-': value -= rhs
+			else: value *= rhs
+		return value
+
+	def parse_unary(self: Self) -> int:
+		kind, token = self.peek()
+		if kind == 'op' and token in ('-', '~', '*'):
+			self.next()
+			value = self.parse_unary()
+			if token == '-':
+				return -value
+			if token == '~':
+				return ~value
+			return self.deref(value, get_pointer_size())
+
+		if kind == 'name' and token.lower() in NATIVE_EXPRESSION_SIZES:
+			self.next()
+			size = NATIVE_EXPRESSION_SIZES[token.lower()]
+			if self.peek() == ('name', 'ptr'):
+				self.next()
+			if self.peek() != ('op', '['):
+				raise NativeExpressionException('expected [ after size')
+			return self.parse_memory(size)
+
+		if kind == 'op' and token == '[':
+			return self.parse_memory(get_pointer_size())
+
+		return self.parse_primary()
+
+	def parse_memory(self: Self, size: int) -> int:
+		self.expect('[')
+		address = self.parse_binary(0)
+		self.expect(']')
+		return self.deref(address, size)
+
+	def parse_primary(self: Self) -> int:
+		kind, token = self.next()
+		if kind == 'num':
+			try:
+				return int(token, 0)
+			except ValueError:
+				# e.g. 010 is octal in C, leave literals like that to lldb
+				raise NativeExpressionException(f'unsupported number {token}')
+		if kind == 'name':
+			return self.resolve_name(token)
+		if (kind, token) == ('op', '('):
+			value = self.parse_binary(0)
+			self.expect(')')
+			return value
+		raise NativeExpressionException(f'unexpected {token or "end of expression"}')
+
+	def resolve_name(self: Self, name: str) -> int:
+		reg_name = name[1:] if name.startswith('$') else name
+		value = self.registers.get(reg_name.lower())
+		if value != None:
+			return value
+
+		if name.startswith('$'):
+			# register aliases like $fp/$x30, or lldb convenience variables
+			frame = get_frame() if get_process() else None
+			reg = frame.FindRegister(reg_name) if frame else None
+			if reg == None or not reg.IsValid():
+				raise NativeExpressionException(f'unknown register {name}')
+			return reg.unsigned
+
+		addresses = get_symbol_index().find(name)
+		if not addresses:
+			raise NativeExpressionException(f'unknown symbol {name}')
+		return addresses[0]
+
+	def deref(self: Self, address: int, size: int) -> int:
+		try:
+			data = read_mem(address & 0xffffffffffffffff, size)
+		except LLDBMemoryException:
+			data = b''
+		if len(data) != size:
+			raise NativeExpressionException(f'unable to read memory at {address:#x}')
+		return int.from_bytes(data, byteorder='little')
+
+def evaluate_native(expression: str) -> int:
+	'''
+		Evaluate a simple address expression against the register snapshot of
+		the current stop, raise NativeExpressionException if it needs lldb
+	'''
+	return NativeExpressionParser(expression, get_register_snapshot()).parse()
+
 def is_i386() -> bool:
 	arch = get_arch()
 	return arch[0:1] == "i"
@@ -244,7 +495,9 @@ def is_supported_arch() -> bool:
 	return is_i386() or is_x64() or is_arm() or is_aarch64()
 
 def get_pointer_size() -> int:
-	poisz = evaluate("sizeof(long)")
+	poisz = get_target().GetAddressByteSize()
+	if not poisz:
+		poisz = evaluate("sizeof(long)")
 	return poisz
 
 # from https://github.com/facebook/chisel/blob/master/fblldbobjcruntimehelpers.py
@@ -288,6 +541,64 @@ def get_gp_registers() -> Dict[str, int]:
 
 	return registers
 
+REGISTER_SNAPSHOT: Dict[str, int] = {}
+REGISTER_SNAPSHOT_KEY: Tuple[int, int, int] = (-1, -1, -1)
+
+def get_register_snapshot() -> Dict[str, int]:
+	'''
+		Return general purpose registers of the selected frame. Inside
+		evaluate_batch() they are read once per (stop, thread, frame) and
+		dropped when the plugin writes a register, outside they are read on
+		every call as lldb's register write can't be seen
+	'''
+	global REGISTER_SNAPSHOT
+	global REGISTER_SNAPSHOT_KEY
+
+	process = get_process()
+	if not process:
+		return {}
+
+	if not EVALUATE_CACHE.depth:
+		return read_register_snapshot(process)
+
+	frame_key = get_frame_key()
+	if frame_key != REGISTER_SNAPSHOT_KEY:
+		REGISTER_SNAPSHOT = read_register_snapshot(process)
+		REGISTER_SNAPSHOT_KEY = frame_key
+	return REGISTER_SNAPSHOT
+
+def read_register_snapshot(process: SBProcess) -> Dict[str, int]:
+	frame: SBFrame = process.GetSelectedThread().GetSelectedFrame()
+	if frame.IsValid():
+		return {reg.GetName(): reg.unsigned for reg in get_registers_by_frame(frame, 'general')}
+	return get_gp_registers()
+
+def invalidate_register_caches():
+	'''
+		Drop values computed from registers, call it after writing a register
+	'''
+	global REGISTER_SNAPSHOT_KEY
+
+	REGISTER_SNAPSHOT_KEY = (-1, -1, -1)
+	EVALUATE_CACHE.invalidate()
+
+@contextlib.contextmanager
+def evaluate_batch() -> Iterator[None]:
+	'''
+		Reuse evaluate() results until the outermost batch ends
+	'''
+	EVALUATE_CACHE.depth += 1
+	try:
+		yield
+	finally:
+		EVALUATE_CACHE.depth -= 1
+		if not EVALUATE_CACHE.depth:
+			invalidate_register_caches()
+
+def write_register(reg_name: str, value: int):
+	get_frame().reg[reg_name].value = format(value, '#x')
+	invalidate_register_caches()
+
 def get_registers_by_frame(frame: SBFrame, kind: str) -> SBValue:
 	registerSets: SBValueList = frame.GetRegisters()
 	
@@ -365,16 +676,851 @@ def objc_get_classname(objc: str) -> str:
 	
 	return class_name.str_value
 
+def get_text_section(module: SBModule) -> SBSection:
+	return module.FindSection('__TEXT')
+
+class AddressTranslator(object):
+	'''
+		Cache of modules by name and their __TEXT (file base, load base), used
+		to convert addresses between the IDA default mapping and ASLR addresses.
+		The cache is dropped when the process changes, resumes or modules are
+		loaded. Bases of a module are dropped when its header moves (image load,
+		target modules load --slide, kext reload).
+	'''
+
+	def __init__(self: Self):
+		self.generation: Tuple[int, int, int] = (-1, -1, -1)
+		self.modules: Dict[str, SBModule] = {}
+		# module path -> (header load address, file base, load base)
+		self.bases: Dict[str, Tuple[int, int, int]] = {}
+		self.pinned = False
+
+	@contextlib.contextmanager
+	def batch(self: Self, target: SBTarget) -> Iterator['AddressTranslator']:
+		'''
+			Check module load addresses once for many translations
+		'''
+		self.refresh(target)
+		pinned = self.pinned
+		self.pinned = True
+		try:
+			yield self
+		finally:
+			self.pinned = pinned
+
+	def refresh(self: Self, target: SBTarget):
+		if self.pinned:
+			return
+
+		process = target.GetProcess()
+		generation = (process.GetUniqueID(), target.GetNumModules(), process.GetStopID())
+		if generation == self.generation:
+			return
+
+		self.generation = generation
+		self.modules = {}
+		self.bases = {}
+		for module in target.module_iter():
+			self.modules.setdefault(module.file.basename, module)
+
+	def find_module(self: Self, target: SBTarget, module_name: str) -> Optional[SBModule]:
+		self.refresh(target)
+		return self.modules.get(module_name)
+
+	def module_bases(self: Self, target: SBTarget, module: SBModule) -> Tuple[int, int]:
+		'''
+			Return (file base, load base) of the __TEXT section of module
+		'''
+		self.refresh(target)
+		key = module.file.fullpath
+		bases = self.bases.get(key)
+		if bases != None and self.pinned:
+			return bases[1:]
+
+		# only this module is checked for a slide
+		header_addr = module.GetObjectFileHeaderAddress().GetLoadAddress(target)
+		if bases == None or bases[0] != header_addr:
+			text_section = get_text_section(module)
+			bases = (header_addr, text_section.file_addr, text_section.GetLoadAddress(target))
+			# not loaded yet, don't cache the invalid load address
+			if bases[2] != lldb.LLDB_INVALID_ADDRESS:
+				self.bases[key] = bases
+		return bases[1:]
+
+	def to_load_address(self: Self, target: SBTarget, module: SBModule, ida_addr: int) -> int:
+		file_base, load_base = self.module_bases(target, module)
+		return load_base + (ida_addr - file_base)
+
+	def to_ida_address(self: Self, target: SBTarget, module: SBModule, aslr_addr: int) -> int:
+		file_base, load_base = self.module_bases(target, module)
+		return file_base + (aslr_addr - load_base)
+
+	def translate_lines(self: Self, target: SBTarget, lines: List[str], to_ida: bool, module_name: str = '') -> Tuple[List[str], List[str]]:
+		'''
+			Translate lines of "[module] <address>" in one pass.
+			Without a module, module_name is used, or the module containing the
+			address when converting to IDA addresses.
+			IDA -> ASLR lines are written as "0x<address>", ASLR -> IDA lines as
+			"<module> 0x<address>", both formats are accepted by lb.
+			Return (translated lines, unresolved lines)
+		'''
+		translated: List[str] = []
+		unresolved: List[str] = []
+		with self.batch(target):
+			for line in lines:
+				self.translate_line(target, line, to_ida, module_name, translated, unresolved)
+
+		return translated, unresolved
+
+	def translate_line(self: Self, target: SBTarget, line: str, to_ida: bool, module_name: str,
+						translated: List[str], unresolved: List[str]):
+		line = line.strip()
+		if not line or line.startswith(('#', ';', '//')):
+			return
+
+		tokens = line.split()
+		try:
+			address = int(tokens[-1], 16)
+		except ValueError:
+			unresolved.append(line)
+			return
+
+		name = tokens[0] if len(tokens) > 1 else module_name
+		module = self.find_module(target, name) if name else None
+		if module == None and to_ida and not name:
+			module = target.ResolveLoadAddress(address).GetModule()
+			module = module if module.IsValid() else None
+		if module == None or self.module_bases(target, module)[1] == lldb.LLDB_INVALID_ADDRESS:
+			unresolved.append(line)
+			return
+
+		if to_ida:
+			translated.append(f'{module.file.basename} {self.to_ida_address(target, module, address):#x}')
+		else:
+			translated.append(f'{self.to_load_address(target, module, address):#x}')
+
+ADDRESS_TRANSLATOR = AddressTranslator()
+
+def get_address_translator() -> AddressTranslator:
+	return ADDRESS_TRANSLATOR
+
 def find_module_by_name(target: SBTarget, module_name: str):
-	for module in target.modules:
-		module: SBModule = module
-		if module.file.basename == module_name:
-			return module
+	return ADDRESS_TRANSLATOR.find_module(target, module_name)
+
+def ida_to_load_address(target: SBTarget, module: SBModule, ida_addr: int) -> int:
+	'''
+		Convert an address of module in IDA default mapping to its ASLR address
+	'''
+	return ADDRESS_TRANSLATOR.to_load_address(target, module, ida_addr)
+
+def load_to_ida_address(target: SBTarget, module: SBModule, aslr_addr: int) -> int:
+	'''
+		Convert ASLR address of module to its address in IDA default mapping
+	'''
+	return ADDRESS_TRANSLATOR.to_ida_address(target, module, aslr_addr)
+
+def get_module_load_base(target: SBTarget, module: SBModule) -> int:
+	'''
+		Return load address of the first loaded section of module, used as base of RVAs
+	'''
+	for section in module.section_iter():
+		load_addr = section.GetLoadAddress(target)
+		if load_addr != lldb.LLDB_INVALID_ADDRESS:
+			return load_addr
+
+	return lldb.LLDB_INVALID_ADDRESS
+
+SYMBOL_INDEX_DIR = Path.home() / '.cache' / 'lldbinit' / 'symbols'
+
+class ModuleSymbolIndex(object):
+	'''
+		Code symbols of one module: name -> offsets from the module header and a
+		sorted offset table for address lookups. Offsets don't depend on ASLR so
+		the index is saved to disk keyed by module UUID.
+	'''
+
+	def __init__(self: Self, uuid: str, names: Dict[str, List[int]]):
+		self.uuid = uuid
+		self.names = names
+		self.sorted_names = sorted(names)
+		table = sorted((offset, name) for name, offsets in names.items() for offset in offsets)
+		self.offsets = [offset for offset, _ in table]
+		self.offset_names = [name for _, name in table]
+
+	@classmethod
+	def build(cls: Type[Self], module: SBModule) -> Self:
+		header_file_addr = module.GetObjectFileHeaderAddress().GetFileAddress()
+		names: Dict[str, List[int]] = {}
+		for symbol in module.symbol_iter():
+			symbol: SBSymbol
+			if symbol.GetType() != lldb.eSymbolTypeCode:
+				continue
+
+			file_addr = symbol.GetStartAddress().GetFileAddress()
+			if file_addr == lldb.LLDB_INVALID_ADDRESS:
+				continue
+
+			offset = file_addr - header_file_addr
+			names.setdefault(symbol.GetName(), []).append(offset)
+			mangled_name = symbol.GetMangledName()
+			if mangled_name:
+				names.setdefault(mangled_name, []).append(offset)
+
+		return cls(module.GetUUIDString(), names)
+
+	@classmethod
+	def load(cls: Type[Self], path: Path) -> Optional[Self]:
+		try:
+			with open(path, 'r') as f:
+				data = json.load(f)
+			# truncated or old format files are rebuilt by the caller
+			if not isinstance(data['names'], dict):
+				return None
+			return cls(data['uuid'], data['names'])
+		except (OSError, ValueError, KeyError, TypeError):
+			return None
+
+	def save(self: Self, path: Path):
+		path.parent.mkdir(parents=True, exist_ok=True)
+		with open(path, 'w') as f:
+			json.dump({'uuid': self.uuid, 'names': self.names}, f)
+
+	def exact(self: Self, name: str) -> List[int]:
+		return self.names.get(name, [])
+
+	def prefix(self: Self, prefix: str) -> Iterator[str]:
+		i = bisect.bisect_left(self.sorted_names, prefix)
+		while i < len(self.sorted_names) and self.sorted_names[i].startswith(prefix):
+			yield self.sorted_names[i]
+			i += 1
+
+	def regex(self: Self, pattern: 're.Pattern') -> Iterator[str]:
+		return (name for name in self.sorted_names if pattern.search(name))
+
+	def symbolicate(self: Self, offset: int) -> Tuple[str, int]:
+		'''
+			Return (symbol name, offset into symbol) of the nearest symbol before offset
+		'''
+		i = bisect.bisect_right(self.offsets, offset) - 1
+		if i < 0:
+			return '', 0
+		return self.offset_names[i], offset - self.offsets[i]
+
+class SymbolIndex(object):
+	'''
+		Lazily built symbol indexes of all modules in the target, loaded from
+		SYMBOL_INDEX_DIR when the module UUID was indexed before
+	'''
+
+	def __init__(self: Self, index_dir: Path = SYMBOL_INDEX_DIR):
+		self.index_dir = index_dir
+		self.modules: Dict[str, ModuleSymbolIndex] = {}
+
+	def module_index(self: Self, module: SBModule) -> ModuleSymbolIndex:
+		uuid = module.GetUUIDString()
+		key = uuid or module.file.fullpath
+		index = self.modules.get(key)
+		if index != None:
+			return index
+
+		path = self.index_dir / f'{uuid}.json'
+		index = ModuleSymbolIndex.load(path) if uuid else None
+		if index == None or index.uuid != uuid:
+			index = ModuleSymbolIndex.build(module)
+			if uuid:
+				try:
+					index.save(path)
+				except OSError:
+					pass
+
+		self.modules[key] = index
+		return index
+
+	def loaded_modules(self: Self, target: SBTarget) -> Iterator[Tuple[ModuleSymbolIndex, int]]:
+		'''
+			Yield (module index, header load address) of every loaded module
+		'''
+		for module in target.module_iter():
+			header_addr = module.GetObjectFileHeaderAddress().GetLoadAddress(target)
+			if header_addr == lldb.LLDB_INVALID_ADDRESS:
+				continue
+			yield self.module_index(module), header_addr
+
+	def find(self: Self, name: str, target: Optional[SBTarget] = None) -> List[int]:
+		'''
+			Return load addresses of symbol name in all modules
+		'''
+		target = target or get_target()
+		return [header_addr + offset for index, header_addr in self.loaded_modules(target) for offset in index.exact(name)]
+
+	def find_prefix(self: Self, prefix: str, target: Optional[SBTarget] = None) -> List[Tuple[str, int]]:
+		target = target or get_target()
+		return [(name, header_addr + offset) for index, header_addr in self.loaded_modules(target)
+					for name in index.prefix(prefix) for offset in index.exact(name)]
+
+	def find_regex(self: Self, pattern: str, target: Optional[SBTarget] = None) -> List[Tuple[str, int]]:
+		'''
+			Raises re.error if pattern is invalid
+		'''
+		target = target or get_target()
+		compiled = re.compile(pattern)
+		return [(name, header_addr + offset) for index, header_addr in self.loaded_modules(target)
+					for name in index.regex(compiled) for offset in index.exact(name)]
+
+	def symbolicate(self: Self, address: int, target: Optional[SBTarget] = None) -> Tuple[str, int]:
+		'''
+			Return (symbol name, offset into symbol) of a load address
+		'''
+		target = target or get_target()
+		module: SBModule = target.ResolveLoadAddress(address).GetModule()
+		if not module.IsValid():
+			return '', 0
+
+		header_addr = module.GetObjectFileHeaderAddress().GetLoadAddress(target)
+		if header_addr == lldb.LLDB_INVALID_ADDRESS:
+			return '', 0
+		return self.module_index(module).symbolicate(address - header_addr)
+
+SYMBOL_INDEX: Optional[SymbolIndex] = None
+
+def get_symbol_index() -> SymbolIndex:
+	global SYMBOL_INDEX
+
+	if SYMBOL_INDEX == None:
+		SYMBOL_INDEX = SymbolIndex()
+	return SYMBOL_INDEX
+
+@dataclass
+class BreakpointImportReport:
+	created: int = 0
+	locations: int = 0
+	skipped: int = 0
+	elapsed: float = 0
+	unresolved: List[str] = field(default_factory=list)
+
+BREAKPOINT_NAME_BATCH = 0x400
+
+def import_breakpoints(lines: List[str], rva_base: int = -1, report_names: bool = False) -> BreakpointImportReport:
+	'''
+		Create breakpoints from lines of a breakpoint list. Supported entries:
+		  name                   function name, resolved through the symbol index
+		  0x<address>            absolute address, only when rva_base isn't given
+		  <rva>                  hex RVA with or without 0x, only when rva_base is given (lbrva),
+		                         names are not resolved then
+		  module+<offset>        offset from module load base
+		  module!<offset>        same as module+<offset>
+		  module <ida address>   address in IDA default mapping of module (like mbp)
+		Blank lines and lines starting with '#', ';' or '//' are skipped.
+		Names missing from the symbol index become lldb name breakpoints, one per batch,
+		which also match base names and C++ names. With report_names they are reported instead.
+	'''
+	start_time = time.time()
+	target = get_target()
+	report = BreakpointImportReport()
+
+	modules: Dict[str, SBModule] = {module.file.basename: module for module in target.module_iter()}
+	symbol_index = get_symbol_index()
+	loaded_modules: Optional[List[Tuple[ModuleSymbolIndex, int]]] = None
+	addresses: List[int] = []
+	unresolved_names: List[str] = []
+
+	# module slides are checked once for the whole list
+	with ADDRESS_TRANSLATOR.batch(target):
+		for line in lines:
+			line = line.strip()
+			if not line or line.startswith(('#', ';', '//')):
+				report.skipped += 1
+				continue
+
+			try:
+				tokens = line.split()
+				if len(tokens) == 2 and tokens[0] in modules:
+					addresses.append(ida_to_load_address(target, modules[tokens[0]], int(tokens[1], 16)))
+					continue
+
+				m = re.match(r'^(.+)[+!](0x[0-9a-fA-F]+|[0-9a-fA-F]+)$', line)
+				if m and m.group(1) in modules:
+					base = get_module_load_base(target, modules[m.group(1)])
+					if base == lldb.LLDB_INVALID_ADDRESS:
+						report.unresolved.append(line)
+					else:
+						addresses.append(base + int(m.group(2), 16))
+					continue
+
+				if rva_base != -1:
+					# every number is an RVA in lbrva, 0x prefix included
+					addresses.append(rva_base + int(line, 16))
+					continue
+
+				if line.lower().startswith('0x'):
+					addresses.append(int(line, 16))
+					continue
+			except ValueError:
+				report.unresolved.append(line)
+				continue
+
+			if loaded_modules == None:
+				loaded_modules = list(symbol_index.loaded_modules(target))
+
+			symbol_addresses = [header_addr + offset for index, header_addr in loaded_modules for offset in index.exact(line)]
+			if symbol_addresses:
+				addresses.extend(symbol_addresses)
+			else:
+				unresolved_names.append(line)
+
+	for address in dict.fromkeys(addresses):
+		breakpoint: SBBreakpoint = target.BreakpointCreateByAddress(address)
+		if breakpoint.IsValid():
+			report.created += 1
+			report.locations += breakpoint.GetNumLocations()
+
+	if not report_names:
+		for i in range(0, len(unresolved_names), BREAKPOINT_NAME_BATCH):
+			names = unresolved_names[i:i + BREAKPOINT_NAME_BATCH]
+			breakpoint = target.BreakpointCreateByNames(names, lldb.eFunctionNameTypeAuto, lldb.SBFileSpecList(), lldb.SBFileSpecList())
+			if breakpoint.IsValid():
+				report.created += 1
+				report.locations += breakpoint.GetNumLocations()
+	else:
+		report.unresolved.extend(unresolved_names)
+
+	report.elapsed = time.time() - start_time
+	return report
+
+# ----------------------------------------------------------
+# Tracepoints
+# ----------------------------------------------------------
+
+@dataclass
+class TraceSite:
+	site_id: int
+	address: int
+	registers: List[str]
+	# (register name, size) - read size bytes at the register value
+	memory: List[Tuple[str, int]]
+	hits: int = 0
+	first_hit: float = 0
+	last_hit: float = 0
+
+	@property
+	def rate(self: Self) -> float:
+		elapsed = self.last_hit - self.first_hit
+		return self.hits / elapsed if elapsed > 0 else 0
+
+class TraceBuffer(object):
+	'''
+		Preallocated ring buffer of tracepoint hits, the oldest records are overwritten
+	'''
+
+	def __init__(self: Self, capacity: int = 0x10000):
+		self.capacity = capacity
+		# record: (timestamp, site id, thread id, register values, memory snippets)
+		self.records: List[Optional[Tuple[float, int, int, Tuple[int, ...], Tuple[bytes, ...]]]] = [None] * capacity
+		self.index = 0
+		self.total = 0
+
+	def append(self: Self, record: Tuple[float, int, int, Tuple[int, ...], Tuple[bytes, ...]]):
+		self.records[self.index] = record
+		self.index = (self.index + 1) % self.capacity
+		self.total += 1
+
+	def clear(self: Self):
+		self.records = [None] * self.capacity
+		self.index = 0
+		self.total = 0
+
+	def __iter__(self: Self) -> Iterator[Tuple[float, int, int, Tuple[int, ...], Tuple[bytes, ...]]]:
+		'''
+			Iterate records from the oldest to the newest
+		'''
+		if self.total >= self.capacity:
+			order = self.records[self.index:] + self.records[:self.index]
+		else:
+			order = self.records[:self.index]
+		return iter(order)
+
+def trace_capture(site: TraceSite, frame: SBFrame, buffer: TraceBuffer):
+	'''
+		Save registers and memory snippets of a tracepoint hit into buffer
+	'''
+	now = time.time()
+	if not site.hits:
+		site.first_hit = now
+	site.hits += 1
+	site.last_hit = now
+
+	values = tuple(frame.FindRegister(reg_name).GetValueAsUnsigned() for reg_name in site.registers)
+	snippets: Tuple[bytes, ...] = ()
+	if site.memory:
+		process = frame.GetThread().GetProcess()
+		err = SBError()
+		snippets = tuple(process.ReadMemory(frame.FindRegister(reg_name).GetValueAsUnsigned(), size, err) or b''
+							for reg_name, size in site.memory)
+
+	buffer.append((now, site.site_id, frame.GetThread().GetThreadID(), values, snippets))
+
+# ----------------------------------------------------------
+# Compiled breakpoint conditions
+# ----------------------------------------------------------
+
+class ConditionScope(dict):
+	'''
+		Names visible to a breakpoint condition, registers are read from the
+		frame the first time the condition uses them
+	'''
+
+	def __init__(self: Self, frame: SBFrame, helpers: Dict[str, Callable]):
+		super().__init__(helpers)
+		self.frame = frame
+
+	def __missing__(self: Self, name: str) -> int:
+		reg = self.frame.FindRegister(name)
+		if not reg.IsValid():
+			# let the lookup continue in globals and builtins
+			raise KeyError(name)
+		value = reg.GetValueAsUnsigned()
+		self[name] = value
+		return value
+
+# memory accessors are resolved at call time, the readers are defined later in this module
+CONDITION_HELPERS: Dict[str, Callable] = {
+	'u8': lambda addr: read_u8(addr),
+	'u16': lambda addr: read_u16(addr),
+	'u32': lambda addr: read_u32(addr),
+	'u64': lambda addr: read_u64(addr),
+	'ptr': lambda addr: read_pointer_from(addr, get_pointer_size()),
+	'mem': lambda addr, size: read_mem(addr, size),
+	'cstr': lambda addr, max_size=1024: read_cstr(addr, max_size).decode('utf-8', 'replace'),
+}
+CONDITION_GLOBALS: Dict[str, Any] = {'__builtins__': __builtins__}
+
+@dataclass
+class BreakpointCondition:
+	bp_id: int
+	source: str
+	code: CodeType
+	evaluations: int = 0
+	hits: int = 0
+	errors: int = 0
+	last_error: str = ''
+
+def compile_condition(bp_id: int, source: str) -> BreakpointCondition:
+	'''
+		Compile a python expression once, raises SyntaxError if invalid
+	'''
+	return BreakpointCondition(bp_id, source, compile(source, f'<bpcond {bp_id}>', 'eval'))
+
+def evaluate_condition(condition: BreakpointCondition, frame: SBFrame) -> bool:
+	'''
+		Evaluate a compiled condition against the registers of frame,
+		a condition raising an error counts as true so the process stops
+	'''
+	condition.evaluations += 1
+	try:
+		result = bool(eval(condition.code, CONDITION_GLOBALS, ConditionScope(frame, CONDITION_HELPERS)))
+	except Exception as err:
+		condition.errors += 1
+		condition.last_error = f'{type(err).__name__}: {err}'
+		result = True
+
+	if result:
+		condition.hits += 1
+	return result
+
+# ----------------------------------------------------------
+# Instruction trace recorder
+# ----------------------------------------------------------
+
+# file layout: magic, u32 checkpoint interval, u16 register count, register names
+# (u8 length + name), then one record per step:
+#   'C' + u64 value of every register               full checkpoint
+#   'D' + u16 count + count * (u16 index, u64 value) changed registers only
+INSTTRACE_MAGIC = b'LLDBTRC\x01'
+INSTTRACE_CHECKPOINT = ord('C')
+INSTTRACE_DELTA = ord('D')
+
+class InstructionTraceWriter(object):
+	'''
+		Write register states of single steps as deltas to the previous step,
+		with a full checkpoint every `checkpoint_interval` steps
+	'''
+
+	def __init__(self: Self, path: str, register_names: List[str], checkpoint_interval: int = 0x400):
+		self.file = open(path, 'wb')
+		self.register_names = register_names
+		self.checkpoint_interval = checkpoint_interval
+		self.prev_values: List[int] = []
+		self.steps = 0
+		self.buffer = bytearray()
+
+		self.buffer += INSTTRACE_MAGIC + pack('<IH', checkpoint_interval, len(register_names))
+		for name in register_names:
+			encoded = name.encode('utf-8')
+			self.buffer += pack('<B', len(encoded)) + encoded
+
+	def add(self: Self, registers: Dict[str, int]):
+		values = [registers.get(name, 0) & 0xffffffffffffffff for name in self.register_names]
+		if self.steps % self.checkpoint_interval == 0:
+			self.buffer.append(INSTTRACE_CHECKPOINT)
+			self.buffer += array.array('Q', values).tobytes()
+		else:
+			changed = [(i, value) for i, (value, prev) in enumerate(zip(values, self.prev_values)) if value != prev]
+			self.buffer.append(INSTTRACE_DELTA)
+			self.buffer += pack('<H', len(changed))
+			for i, value in changed:
+				self.buffer += pack('<HQ', i, value)
+
+		self.prev_values = values
+		self.steps += 1
+		if len(self.buffer) >= 0x10000:
+			self.flush()
+
+	def flush(self: Self):
+		self.file.write(self.buffer)
+		self.buffer = bytearray()
+
+	def close(self: Self):
+		self.flush()
+		self.file.close()
+
+class InstructionTraceReader(object):
+	'''
+		Random access to register states of a trace written by InstructionTraceWriter
+	'''
+
+	def __init__(self: Self, path: str):
+		self.path = path
+		with open(path, 'rb') as f:
+			self.data = f.read()
+
+		if self.data[:len(INSTTRACE_MAGIC)] != INSTTRACE_MAGIC:
+			raise ValueError(f'{path} is not an instruction trace')
+
+		off = len(INSTTRACE_MAGIC)
+		self.checkpoint_interval, nregs = unpack('<IH', self.data[off:off + 6])
+		off += 6
+		self.register_names: List[str] = []
+		for _ in range(nregs):
+			length = self.data[off]
+			self.register_names.append(self.data[off + 1:off + 1 + length].decode('utf-8'))
+			off += 1 + length
+
+		# offset of every step record
+		self.offsets = array.array('Q')
+		checkpoint_size = 1 + 8 * nregs
+		while off < len(self.data):
+			self.offsets.append(off)
+			if self.data[off] == INSTTRACE_CHECKPOINT:
+				off += checkpoint_size
+			else:
+				count, = unpack('<H', self.data[off + 1:off + 3])
+				off += 3 + count * 10
+
+	def __len__(self: Self) -> int:
+		return len(self.offsets)
+
+	def state_at(self: Self, step: int) -> Dict[str, int]:
+		'''
+			Rebuild registers at step from the last checkpoint
+		'''
+		checkpoint = step - step % self.checkpoint_interval
+		off = self.offsets[checkpoint]
+		nregs = len(self.register_names)
+		values = list(array.array('Q', self.data[off + 1:off + 1 + 8 * nregs]))
+
+		for i in range(checkpoint + 1, step + 1):
+			off = self.offsets[i]
+			count, = unpack('<H', self.data[off + 1:off + 3])
+			for idx, value in struct.iter_unpack('<HQ', self.data[off + 3:off + 3 + count * 10]):
+				values[idx] = value
+
+		return dict(zip(self.register_names, values))
+
+	def find_pc(self: Self, pc_name: str, address: int, start: int = 0) -> int:
+		'''
+			Return the first step from start where pc_name == address, or -1
+		'''
+		pc_index = self.register_names.index(pc_name)
+		pc = self.state_at(start)[pc_name] if start < len(self) else -1
+		for step in range(start, len(self)):
+			off = self.offsets[step]
+			if self.data[off] == INSTTRACE_CHECKPOINT:
+				pc, = unpack('<Q', self.data[off + 1 + 8 * pc_index:off + 9 + 8 * pc_index])
+			elif step != start:
+				count, = unpack('<H', self.data[off + 1:off + 3])
+				for idx, value in struct.iter_unpack('<HQ', self.data[off + 3:off + 3 + count * 10]):
+					if idx == pc_index:
+						pc = value
+			if pc == address:
+				return step
+
+		return -1
+
+# ----------------------------------------------------------
+# Breakpoint based code coverage
+# ----------------------------------------------------------
+
+X86_FLOW_PREFIXES = ('j', 'call', 'ret', 'loop')
+ARM64_FLOW_INSTS = (
+	'b', 'bl', 'br', 'blr', 'ret', 'retaa', 'retab', 'cbz', 'cbnz', 'tbz', 'tbnz'
+)
+
+def is_flow_inst(mnemonic: str) -> bool:
+	'''
+		Return True if instruction ends a basic block
+	'''
+	mnemonic = mnemonic.lower()
+	if is_aarch64() or is_arm():
+		return mnemonic in ARM64_FLOW_INSTS or mnemonic.startswith('b.') or is_bl_pac_inst(mnemonic)
+
+	return mnemonic.startswith(X86_FLOW_PREFIXES)
+
+def get_code_section(module: SBModule) -> Optional[SBSection]:
+	'''
+		Return section holding code of module (__TEXT,__text or .text)
+	'''
+	text_segment = module.FindSection('__TEXT')
+	if text_segment.IsValid():
+		text_section = text_segment.FindSubSection('__text')
+		return text_section if text_section.IsValid() else text_segment
+
+	text_section = module.FindSection('.text')
+	if text_section.IsValid():
+		return text_section
 
 	return None
 
-def get_text_section(module: SBModule) -> SBSection:
-	return module.FindSection('__TEXT')
+def sweep_basic_blocks(target: SBTarget, start: int, code: bytes) -> Dict[int, int]:
+	'''
+		Linear sweep disassembly of code loaded at start, return {block start: block size}.
+		Leaders are the first instruction, direct branch targets and instructions
+		following a branch.
+	'''
+	instructions: SBInstructionList = target.GetInstructions(SBAddress(start, target), code)
+	end = start + len(code)
+
+	leaders: Set[int] = {start}
+	inst_addrs: List[int] = []
+	for inst in instructions:
+		inst: SBInstruction
+		addr = inst.GetAddress().GetLoadAddress(target)
+		inst_addrs.append(addr)
+
+		if not is_flow_inst(inst.GetMnemonic(target)):
+			continue
+
+		leaders.add(addr + inst.GetByteSize())
+		m = re.search(r'(0x[0-9a-fA-F]+)\s*$', inst.GetOperands(target))
+		if m:
+			branch_target = int(m.group(1), 16)
+			if start <= branch_target < end:
+				leaders.add(branch_target)
+
+	# only keep leaders that are on an instruction boundary
+	leaders &= set(inst_addrs)
+	sorted_leaders = sorted(leaders) + [end]
+	return {sorted_leaders[i]: sorted_leaders[i + 1] - sorted_leaders[i] for i in range(len(sorted_leaders) - 1)}
+
+class CoverageSession(object):
+	'''
+		Collect basic block coverage of one module with breakpoints disabled on first hit
+	'''
+
+	def __init__(self: Self, module: SBModule):
+		target = get_target()
+		self.module = module
+		self.path = module.file.fullpath
+		self.base = module.GetObjectFileHeaderAddress().GetLoadAddress(target)
+		self.end = self.base
+		for section in module.section_iter():
+			load_addr = section.GetLoadAddress(target)
+			if load_addr != lldb.LLDB_INVALID_ADDRESS:
+				self.end = max(self.end, load_addr + section.GetByteSize())
+
+		# block start -> size, block start are absolute addresses
+		self.blocks: Dict[int, int] = {}
+		self.hits: Set[int] = set()
+		# breakpoints stay in the target, disabled once hit, until clear()
+		self.breakpoint_ids: Set[int] = set()
+		self.planted: Set[int] = set()
+
+	def load_block_list(self: Self, lines: List[str]):
+		'''
+			Block list entries are "<offset from module base> [<size>]" in hex
+		'''
+		for line in lines:
+			line = line.strip()
+			if not line or line.startswith(('#', ';', '//')):
+				continue
+
+			tokens = line.split()
+			self.blocks[self.base + int(tokens[0], 16)] = int(tokens[1], 16) if len(tokens) > 1 else 1
+
+	def sweep(self: Self) -> bool:
+		target = get_target()
+		code_section = get_code_section(self.module)
+		if code_section == None:
+			return False
+
+		start = code_section.GetLoadAddress(target)
+		code = read_mem(start, code_section.GetByteSize())
+		if not code:
+			return False
+
+		self.blocks.update(sweep_basic_blocks(target, start, code))
+		return True
+
+	def plant(self: Self, callback: str) -> int:
+		'''
+			Set breakpoints on every block not hit yet, callback is the function
+			path passed to SBBreakpoint.SetScriptCallbackFunction() and must
+			disable the location it is called for
+		'''
+		target = get_target()
+		for block in self.blocks:
+			if block in self.hits or block in self.planted:
+				continue
+
+			breakpoint: SBBreakpoint = target.BreakpointCreateByAddress(block)
+			if not breakpoint.IsValid():
+				continue
+
+			breakpoint.SetScriptCallbackFunction(callback)
+			self.breakpoint_ids.add(breakpoint.GetID())
+			self.planted.add(block)
+
+		return self.remaining
+
+	@property
+	def remaining(self: Self) -> int:
+		# planted breakpoints not hit yet
+		return len(self.planted - self.hits)
+
+	def on_hit(self: Self, pc: int):
+		self.hits.add(pc)
+
+	def clear(self: Self):
+		target = get_target()
+		for breakpoint_id in self.breakpoint_ids:
+			target.BreakpointDelete(breakpoint_id)
+		self.breakpoint_ids.clear()
+		self.planted.clear()
+
+	def save_drcov(self: Self, path: str) -> int:
+		'''
+			Write hit blocks in drcov v2 format, readable by lighthouse
+		'''
+		hits = sorted(self.hits)
+		with open(path, 'wb') as f:
+			f.write(b'DRCOV VERSION: 2\n')
+			f.write(b'DRCOV FLAVOR: drcov\n')
+			f.write(b'Module Table: version 2, count 1\n')
+			f.write(b'Columns: id, base, end, entry, checksum, timestamp, path\n')
+			f.write(f' 0, {self.base:#x}, {self.end:#x}, 0x0000000000000000, 0x00000000, 0x00000000, {self.path}\n'.encode())
+			f.write(f'BB Table: {len(hits)} bbs\n'.encode())
+			f.write(b''.join(pack('<IHH', hit - self.base, min(self.blocks.get(hit, 1), 0xffff), 0) for hit in hits))
+
+		return len(hits)
 
 def resolve_symbol_name(address: int) -> str:
 	'''
@@ -547,17 +1693,550 @@ class LLDBMemoryException(Exception):
 	def __init__(self, *args: object) -> None:
 		super().__init__(*args)
 
-def read_mem(addr: int, size: int) -> bytes:
-	err = SBError()
+@dataclass
+class MemoryRegion:
+	start: int
+	end: int
+	perm: str = ''
+	name: str = ''
+
+	@property
+	def size(self: Self) -> int:
+		return self.end - self.start
+
+def get_memory_regions(writable_only: bool = False) -> List[MemoryRegion]:
+	'''
+		Return all readable memory regions of the current process,
+		or the regions stored in the loaded memory image
+	'''
+	if MEMORY_READER.is_offline:
+		return [region for region in MEMORY_READER.regions() if not writable_only or 'w' in region.perm]
+
+	regions: List[MemoryRegion] = []
+
 	process = get_process()
-	if process == None:
-		raise LLDBMemoryException('get_process() return None')
+	if not process:
+		return regions
+
+	region_list: lldb.SBMemoryRegionInfoList = process.GetMemoryRegions()
+	for i in range(region_list.GetSize()):
+		info = lldb.SBMemoryRegionInfo()
+		if not region_list.GetMemoryRegionAtIndex(i, info):
+			continue
+
+		if not info.IsReadable():
+			continue
+
+		if writable_only and not info.IsWritable():
+			continue
+
+		perm = 'r'
+		perm+= 'w' if info.IsWritable() else '-'
+		perm+= 'x' if info.IsExecutable() else '-'
+		regions.append(MemoryRegion(info.GetRegionBase(), info.GetRegionEnd(), perm, info.GetName() or ''))
+
+	return regions
+
+class MemoryReader(ABC):
+	'''
+		Source of target memory used by read_mem()/write_mem()
+	'''
+	name: str = 'process'
+	is_offline: bool = False
+
+	@abstractmethod
+	def read(self: Self, addr: int, size: int) -> bytes:
+		pass
+
+	@abstractmethod
+	def write(self: Self, addr: int, data: bytes) -> int:
+		pass
+
+	def regions(self: Self) -> List[MemoryRegion]:
+		return []
+
+class ProcessMemoryReader(MemoryReader):
+	'''
+		Read memory of the live process through SBProcess
+	'''
+
+	def read(self: Self, addr: int, size: int) -> bytes:
+		err = SBError()
+		process = get_process()
+		if process == None:
+			raise LLDBMemoryException('get_process() return None')
+
+		mem_data = process.ReadMemory(addr, size, err)
+		if mem_data == None:
+			mem_data = b''
+
+		return mem_data
+
+	def write(self: Self, addr: int, data: bytes) -> int:
+		err = SBError()
+		process = get_process()
+		if process == None:
+			raise LLDBMemoryException('get_process() return None')
+
+		sz_write = process.WriteMemory(addr, data, err)
+		if not err.Success():
+			sz_write = 0
+
+		return sz_write
+
+MEMIMAGE_MAGIC = b'LLDBIMG\x01'
+MEMIMAGE_HEADER_SIZE = 0x1000
+MEMIMAGE_CHUNK_SIZE = 0x100000
+
+class ImageMemoryReader(MemoryReader):
+	'''
+		mmap-backed reader over a memory image written by MemoryImageWriter.
+
+		Layout: header (magic, index offset, index size) padded to a page,
+		then page aligned region data, then a json index of
+		[start, size, file offset, perm, name] records.
+	'''
+	is_offline = True
+
+	def __init__(self: Self, path: str):
+		self.path = path
+		self.name = Path(path).name
+		self.file = open(path, 'rb')
+		self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+		magic, index_offset, index_size = unpack('<8sQQ', self.mm[:24])
+		if magic != MEMIMAGE_MAGIC:
+			self.close()
+			raise LLDBMemoryException(f'{path} is not a memory image')
+
+		index = json.loads(self.mm[index_offset:index_offset + index_size])
+		self.metadata: Dict[str, Any] = index.get('metadata', {})
+		self.records: List[Tuple[int, int, int, str, str]] = sorted(tuple(r) for r in index['regions'])
+		self.starts = [record[0] for record in self.records]
+
+	def close(self: Self):
+		self.mm.close()
+		self.file.close()
+
+	def read(self: Self, addr: int, size: int) -> bytes:
+		out = bytearray()
+		while size > 0:
+			idx = bisect.bisect_right(self.starts, addr) - 1
+			if idx < 0:
+				break
+
+			start, region_size, file_offset, _, _ = self.records[idx]
+			if addr >= start + region_size:
+				break
+
+			n = min(size, start + region_size - addr)
+			offset = file_offset + (addr - start)
+			out += self.mm[offset:offset + n]
+			addr += n
+			size -= n
+
+		return bytes(out)
+
+	def write(self: Self, addr: int, data: bytes) -> int:
+		# memory images are read only
+		return 0
+
+	def regions(self: Self) -> List[MemoryRegion]:
+		return [MemoryRegion(start, start + size, perm, name) for start, size, _, perm, name in self.records]
+
+class MemoryImageWriter(object):
+	'''
+		Dump memory regions into a sparse image file readable by ImageMemoryReader.
+		Unreadable pages split a region, all zero pages are left as file holes.
+	'''
+
+	def __init__(self: Self, path: str, page_size: int = 0x1000):
+		self.path = path
+		self.page_size = page_size
+		self.file = open(path, 'wb')
+		self.file.write(b'\x00' * MEMIMAGE_HEADER_SIZE)
+		self.offset = MEMIMAGE_HEADER_SIZE
+		self.records: List[Tuple[int, int, int, str, str]] = []
+		self.metadata: Dict[str, Any] = {}
+		self.total_size = 0
+		# size of the run being written at self.offset
+		self.run_size = 0
+
+	def _append_run(self: Self, data: bytes):
+		# data is written at its final place right away, all zero pages stay holes
+		zero_page = bytes(self.page_size)
+		for page_off in range(0, len(data), self.page_size):
+			page = data[page_off:page_off + self.page_size]
+			if page != zero_page[:len(page)]:
+				self.file.seek(self.offset + self.run_size + page_off)
+				self.file.write(page)
+		self.run_size += len(data)
+
+	def _end_run(self: Self, start: int, perm: str, name: str):
+		self.records.append((start, self.run_size, self.offset, perm, name))
+		self.offset += (self.run_size + self.page_size - 1) & ~(self.page_size - 1)
+		self.total_size += self.run_size
+		self.run_size = 0
+
+	def add_region(self: Self, region: MemoryRegion):
+		run_start = -1
+		self.run_size = 0
+
+		addr = region.start
+		while addr < region.end:
+			size = min(MEMIMAGE_CHUNK_SIZE, region.end - addr)
+			chunk = read_mem(addr, size)
+			if len(chunk) == size:
+				if run_start == -1:
+					run_start = addr
+				self._append_run(chunk)
+			else:
+				# slow path, find out which pages are readable
+				for page_addr in range(addr, addr + size, self.page_size):
+					page = read_mem(page_addr, min(self.page_size, addr + size - page_addr))
+					if page:
+						if run_start == -1:
+							run_start = page_addr
+						self._append_run(page)
+					elif run_start != -1:
+						self._end_run(run_start, region.perm, region.name)
+						run_start = -1
+			addr += size
+
+		if run_start != -1:
+			self._end_run(run_start, region.perm, region.name)
+
+	def close(self: Self):
+		index = json.dumps({'metadata': self.metadata, 'regions': self.records}).encode('utf-8')
+		self.file.seek(self.offset)
+		self.file.write(index)
+		self.file.seek(0)
+		self.file.write(pack('<8sQQ', MEMIMAGE_MAGIC, self.offset, len(index)))
+		self.file.close()
+
+def dump_memory_image(path: str, regions: List[MemoryRegion]) -> MemoryImageWriter:
+	'''
+		Write regions of the live process into a memory image, module slides
+		are saved so symbols resolve the same way when the image is loaded
+	'''
+	target = get_target()
+	writer = MemoryImageWriter(path)
+	writer.metadata['triple'] = target.GetTriple()
+	writer.metadata['modules'] = []
+	for module in target.module_iter():
+		header_addr: SBAddress = module.GetObjectFileHeaderAddress()
+		load_addr = header_addr.GetLoadAddress(target)
+		if load_addr == lldb.LLDB_INVALID_ADDRESS:
+			continue
+		writer.metadata['modules'].append([module.GetUUIDString(), load_addr - header_addr.GetFileAddress()])
+
+	try:
+		for region in regions:
+			writer.add_region(region)
+	finally:
+		writer.close()
+
+	return writer
+
+def load_memory_image(path: str) -> ImageMemoryReader:
+	'''
+		Route read_mem() to a memory image and slide modules of the target
+		to the addresses they had when the image was dumped
+	'''
+	reader = ImageMemoryReader(path)
+	target = get_target()
+	slides = dict(reader.metadata.get('modules', []))
+	for module in target.module_iter():
+		slide = slides.get(module.GetUUIDString())
+		if slide != None:
+			target.SetModuleLoadAddress(module, slide)
+
+	prev_reader = set_memory_reader(reader)
+	if isinstance(prev_reader, ImageMemoryReader):
+		prev_reader.close()
+
+	return reader
+
+def unload_memory_image() -> bool:
+	if not isinstance(MEMORY_READER, ImageMemoryReader):
+		return False
+
+	set_memory_reader(ProcessMemoryReader()).close()
+	return True
+
+class PageCache(object):
+	'''
+		Cache of target memory pages, dropped whenever the process stop id changes
+	'''
+
+	def __init__(self: Self, page_size: int = 0x1000):
+		self.page_size = page_size
+		self.pages: Dict[int, bytes] = {}
+		self.stop_id = -1
+		self.hits = 0
+		self.misses = 0
+
+	def sync(self: Self):
+		stop_id = get_stop_id()
+		if stop_id != self.stop_id:
+			self.pages.clear()
+			self.stop_id = stop_id
+
+	def invalidate(self: Self, addr: int = 0, size: int = 0):
+		if not size:
+			self.pages.clear()
+			return
+
+		page_mask = ~(self.page_size - 1)
+		for page_addr in range(addr & page_mask, addr + size, self.page_size):
+			self.pages.pop(page_addr, None)
+
+	def missing_runs(self: Self, addr: int, size: int) -> List[Tuple[int, int]]:
+		'''
+			Return (address, size) runs of pages not in the cache
+		'''
+		runs: List[Tuple[int, int]] = []
+		page_mask = ~(self.page_size - 1)
+		for page_addr in range(addr & page_mask, addr + size, self.page_size):
+			if page_addr in self.pages:
+				self.hits += 1
+				continue
+
+			self.misses += 1
+			if runs and runs[-1][0] + runs[-1][1] == page_addr:
+				runs[-1] = (runs[-1][0], runs[-1][1] + self.page_size)
+			else:
+				runs.append((page_addr, self.page_size))
+
+		return runs
+
+	def put(self: Self, addr: int, data: bytes):
+		# addr is page aligned, partial pages are not cached
+		for off in range(0, len(data) - self.page_size + 1, self.page_size):
+			self.pages[addr + off] = data[off:off + self.page_size]
+
+	def get(self: Self, addr: int, size: int) -> bytes:
+		'''
+			Return cached bytes at addr, stops at the first page not in the cache
+		'''
+		out = bytearray()
+		while size > 0:
+			page_addr = addr & ~(self.page_size - 1)
+			page = self.pages.get(page_addr)
+			if page == None:
+				break
+
+			off = addr - page_addr
+			n = min(size, self.page_size - off)
+			out += page[off:off + n]
+			addr += n
+			size -= n
+
+		return bytes(out)
+
+class GdbRemoteException(Exception):
+	def __init__(self, *args: object) -> None:
+		super().__init__(*args)
+
+class GdbRemoteMemoryReader(ProcessMemoryReader):
+	'''
+		Read memory over a separate connection to the gdb-remote stub the target
+		is attached to, keeping several m/x packets in flight.
+		Writes still go through SBProcess.
+	'''
+	name = 'gdb-remote'
+
+	def __init__(self: Self, host: str, port: int, window: int = 16, timeout: float = 5.0):
+		self.host = host
+		self.port = port
+		self.window = window
+		self.packet_size = 0x400
+		self.binary_upload = False
+		self.no_ack = False
+		self.buffer = b''
+		self.packets = 0
+		self.cache = PageCache()
+		self.connected = True
+
+		self.sock = socket.create_connection((host, port), timeout=timeout)
+		self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		try:
+			self._handshake()
+		except (OSError, GdbRemoteException):
+			self.close()
+			raise
+
+	def close(self: Self):
+		self.connected = False
+		self.buffer = b''
+		self.sock.close()
+
+	def drop_connection(self: Self, err: Exception):
+		'''
+			Give up on the stub after a failed exchange, replies still in flight
+			can't be matched to requests anymore
+		'''
+		self.close()
+		self.cache.invalidate()
+		if MEMORY_READER is self:
+			set_memory_reader(ProcessMemoryReader())
+		print(f'[!] gdbfast: lost {self.host}:{self.port} ({err}), reading through lldb again')
+
+	def _handshake(self: Self):
+		self.send_packets([b'qSupported:multiprocess+;xmlRegisters=i386'])
+		features = self.recv_packet().split(b';')
+		for feature in features:
+			if feature.startswith(b'PacketSize='):
+				self.packet_size = int(feature[len(b'PacketSize='):], 16)
+			elif feature == b'binary-upload+':
+				self.binary_upload = True
+
+		if b'QStartNoAckMode+' in features:
+			self.send_packets([b'QStartNoAckMode'])
+			if self.recv_packet() == b'OK':
+				self.no_ack = True
+
+	def send_packets(self: Self, payloads: List[bytes]):
+		out = bytearray()
+		for payload in payloads:
+			out += b'$' + payload + b'#' + b'%02x' % (sum(payload) & 0xff)
+		self.sock.sendall(out)
+		self.packets += len(payloads)
+
+	def _recv_more(self: Self):
+		data = self.sock.recv(0x10000)
+		if not data:
+			raise GdbRemoteException('connection closed by remote stub')
+		self.buffer += data
+
+	def recv_packet(self: Self) -> bytes:
+		while True:
+			# skip acks and anything before the packet start
+			start = self.buffer.find(b'$')
+			if start == -1:
+				self.buffer = b''
+				self._recv_more()
+				continue
+
+			end = self.buffer.find(b'#', start)
+			if end == -1 or len(self.buffer) < end + 3:
+				self._recv_more()
+				continue
+
+			payload = self.buffer[start + 1:end]
+			self.buffer = self.buffer[end + 3:]
+			if not self.no_ack:
+				self.sock.sendall(b'+')
+			return payload
+
+	@staticmethod
+	def decode_payload(payload: bytes) -> bytes:
+		'''
+			Undo binary escaping and run-length encoding of a reply
+		'''
+		out = bytearray()
+		i = 0
+		while i < len(payload):
+			c = payload[i]
+			if c == 0x7d: # '}'
+				i += 1
+				out.append(payload[i] ^ 0x20)
+			elif c == 0x2a: # '*'
+				i += 1
+				out += out[-1:] * (payload[i] - 29)
+			else:
+				out.append(c)
+			i += 1
+
+		return bytes(out)
+
+	def _max_read_size(self: Self) -> int:
+		# leave room for '$', '#', checksum and escaped bytes in binary replies
+		max_size = self.packet_size - 4
+		if self.binary_upload:
+			max_size = max_size // 2 - 1
+		else:
+			max_size //= 2
+		return max(max_size & ~0xf, 0x10)
+
+	def read_runs(self: Self, runs: List[Tuple[int, int]]) -> List[bytes]:
+		'''
+			Read (address, size) runs with up to self.window packets in flight,
+			a run stops at the first failed packet
+		'''
+		max_size = self._max_read_size()
+		requests: List[Tuple[int, int, int]] = []
+		for run_idx, (addr, size) in enumerate(runs):
+			for off in range(0, size, max_size):
+				requests.append((run_idx, addr + off, min(max_size, size - off)))
+
+		results = [bytearray() for _ in runs]
+		failed = set()
+		cmd = b'x' if self.binary_upload else b'm'
+
+		for i in range(0, len(requests), self.window):
+			batch = requests[i:i + self.window]
+			self.send_packets([cmd + b'%x,%x' % (addr, size) for _, addr, size in batch])
+			for run_idx, addr, size in batch:
+				reply = self.recv_packet()
+				if run_idx in failed:
+					continue
+
+				if reply.startswith(b'E') and len(reply) == 3 or not reply:
+					failed.add(run_idx)
+					continue
+
+				if self.binary_upload:
+					data = self.decode_payload(reply[1:])
+				else:
+					data = bytes.fromhex(self.decode_payload(reply).decode('ascii'))
+
+				results[run_idx] += data
+				if len(data) < size:
+					failed.add(run_idx)
+
+		return [bytes(result) for result in results]
+
+	def read(self: Self, addr: int, size: int) -> bytes:
+		if not self.connected:
+			return super().read(addr, size)
+
+		self.cache.sync()
+		runs = self.cache.missing_runs(addr, size)
+		if runs:
+			try:
+				for (run_addr, _), data in zip(runs, self.read_runs(runs)):
+					self.cache.put(run_addr, data)
+			except (OSError, GdbRemoteException) as err:
+				self.drop_connection(err)
+				return super().read(addr, size)
+
+		return self.cache.get(addr, size)
+
+	def write(self: Self, addr: int, data: bytes) -> int:
+		self.cache.invalidate(addr, len(data))
+		return super().write(addr, data)
+
+MEMORY_READER: MemoryReader = ProcessMemoryReader()
+
+def get_memory_reader() -> MemoryReader:
+	return MEMORY_READER
+
+def set_memory_reader(reader: MemoryReader) -> MemoryReader:
+	'''
+		Switch the memory source of read_mem()/write_mem(), return the previous one
+	'''
+	global MEMORY_READER
 
-	mem_data = process.ReadMemory(addr, size, err)
-	if mem_data == None:
-		mem_data = b''
+	prev_reader = MEMORY_READER
+	MEMORY_READER = reader
+	return prev_reader
 
-	return mem_data
+def is_offline() -> bool:
+	return MEMORY_READER.is_offline
+
+def read_mem(addr: int, size: int) -> bytes:
+	return MEMORY_READER.read(addr, size)
 
 def readable(addr: int) -> bool:
 	try:
@@ -617,19 +2296,125 @@ def read_cstr(addr: int, max_size: int=1024) -> bytes:
 
 	return bytes(c_str)
 
+def read_cstrings(addrs: List[int], max_size: int = 0x100) -> Dict[int, str]:
+	'''
+		Read many C strings with one read per cluster of nearby addresses,
+		strings are usually packed together in __cstring
+	'''
+	strings: Dict[int, str] = {}
+	sorted_addrs = sorted(set(addr for addr in addrs if addr))
+	i = 0
+	while i < len(sorted_addrs):
+		# grow the window while the next string starts close to the previous one
+		j = i + 1
+		start = sorted_addrs[i]
+		while j < len(sorted_addrs) and sorted_addrs[j] - sorted_addrs[j - 1] <= 0x1000 \
+				and sorted_addrs[j] - start < 0x100000:
+			j += 1
+
+		try:
+			data = read_mem(start, sorted_addrs[j - 1] - start + max_size)
+		except LLDBMemoryException:
+			data = b''
+
+		for addr in sorted_addrs[i:j]:
+			chunk = data[addr - start:addr - start + max_size]
+			if len(chunk) < max_size and b'\x00' not in chunk:
+				# window read failed at the end, read this string alone
+				chunk = read_cstr(addr, max_size)
+			strings[addr] = chunk.split(b'\x00', 1)[0].decode('utf-8', 'replace')
+		i = j
+
+	return strings
+
+def read_ranges(ranges: List[Tuple[int, int]]) -> List[bytes]:
+	'''
+		Read (address, size) ranges with one read per cluster of nearby ranges,
+		return the bytes of every range in the same order, short if unreadable
+	'''
+	results = [b''] * len(ranges)
+	order = sorted(range(len(ranges)), key=lambda idx: ranges[idx][0])
+	i = 0
+	while i < len(order):
+		start, size = ranges[order[i]]
+		end = start + size
+		j = i + 1
+		while j < len(order):
+			addr, size = ranges[order[j]]
+			if addr - end > 0x1000 or addr + size - start >= 0x100000:
+				break
+			end = max(end, addr + size)
+			j += 1
+
+		try:
+			data = read_mem(start, end - start)
+		except LLDBMemoryException:
+			data = b''
+
+		for idx in order[i:j]:
+			addr, size = ranges[idx]
+			chunk = data[addr - start:addr - start + size]
+			if len(chunk) < size:
+				# window read stopped at an unmapped page, read this one alone
+				try:
+					chunk = read_mem(addr, size)
+				except LLDBMemoryException:
+					chunk = b''
+			results[idx] = chunk
+		i = j
+
+	return results
+
+def read_structs(addrs: List[int], size: int) -> Dict[int, bytes]:
+	'''
+		Read a struct of `size` bytes at every address with one read per cluster
+		of nearby addresses, objects from the same zone usually sit close together.
+		Addresses that can't be read are left out
+	'''
+	sorted_addrs = sorted(set(addr for addr in addrs if addr))
+	chunks = read_ranges([(addr, size) for addr in sorted_addrs])
+	return {addr: chunk for addr, chunk in zip(sorted_addrs, chunks) if len(chunk) == size}
+
 def write_mem(addr: int, data: bytes) -> int:
-	err = SBError()
-	process = get_process()
-	if process == None:
-		raise LLDBMemoryException('get_process() return None')
+	# memoized expressions may dereference the written memory
+	EVALUATE_CACHE.invalidate()
+	return MEMORY_READER.write(addr, data)
 
-	sz_write = process.WriteMemory(addr, data, err)
-	if not err.Success():
-		sz_write = 0
+def coalesce_ranges(ranges: List[Tuple[int, bytes]]) -> List[Tuple[int, bytes]]:
+	'''
+		Merge (address, data) pairs that touch each other, ranges must not overlap
+	'''
+	merged: List[Tuple[int, bytearray]] = []
+	for addr, data in sorted(ranges, key=lambda r: r[0]):
+		if merged and merged[-1][0] + len(merged[-1][1]) == addr:
+			merged[-1][1].extend(data)
+		else:
+			merged.append((addr, bytearray(data)))
+
+	return [(addr, bytes(data)) for addr, data in merged]
 
-	return sz_write
+def write_mem_ranges(ranges: List[Tuple[int, bytes]]) -> List[Tuple[int, bytes]]:
+	'''
+		Write (address, data) pairs with one write per contiguous range,
+		return the ranges that failed
+	'''
+	failed: List[Tuple[int, bytes]] = []
+	for addr, data in coalesce_ranges(ranges):
+		if write_mem(addr, data) != len(data):
+			failed.append((addr, data))
+
+	return failed
 
 def size_of(struct_name: str) -> int:
+	try:
+		return get_type(struct_name).GetByteSize()
+	except NameError:
+		pass
+
+	if is_offline():
+		# no process to evaluate expression
+		return -1
+
 	res = lldb.SBCommandReturnObject()
 	ci: SBCommandInterpreter = get_debugger().GetCommandInterpreter()
 	ci.HandleCommand(f"p sizeof({struct_name})", res)
@@ -755,16 +2540,117 @@ def get_enum_name(enum_name, _key, prefix = ''):
 	return name
 
 # overwrites SBValue for easier to access struct member
+# names that are not global variables, FindGlobalVariables scans every module
+# so don't look them up again until new modules are loaded
+NOT_GLOBAL_NAMES: Set[str] = set()
+NOT_GLOBAL_NAMES_MAX = 0x1000
+NOT_GLOBAL_GENERATION = -1
+
 def find_global_variable(name: str) -> Optional[SBValue]:
+	global NOT_GLOBAL_GENERATION
+
 	target = get_target()
+	generation = target.GetNumModules()
+	if generation != NOT_GLOBAL_GENERATION or len(NOT_GLOBAL_NAMES) >= NOT_GLOBAL_NAMES_MAX:
+		NOT_GLOBAL_NAMES.clear()
+		NOT_GLOBAL_GENERATION = generation
+
+	if name in NOT_GLOBAL_NAMES:
+		return None
 
 	sbvar_list: SBValueList = target.FindGlobalVariables(name, 1)
 	sbvar: SBValue = sbvar_list.GetValueAtIndex(0)
 	if not sbvar.IsValid():
+		NOT_GLOBAL_NAMES.add(name)
 		return None
 		
 	return sbvar
 
+def find_field_offset(sb_type: SBType, name: str) -> int:
+	'''
+		Return byte offset of member `name` in sb_type, looking into anonymous
+		struct/union members, or -1 when the member doesn't exist
+	'''
+	sb_type = sb_type.GetCanonicalType()
+	for i in range(sb_type.GetNumberOfFields()):
+		field = sb_type.GetFieldAtIndex(i)
+		if field.GetName() == name:
+			return field.GetOffsetInBytes()
+
+		if not field.GetName():
+			offset = find_field_offset(field.GetType(), name)
+			if offset != -1:
+				return field.GetOffsetInBytes() + offset
+
+	return -1
+
+def find_member(sb_type: SBType, name: str) -> Optional[Tuple[int, int, SBType]]:
+	'''
+		Return (bit offset, bit size, type) of member `name` in sb_type,
+		looking into anonymous struct/union members and base classes
+	'''
+	sb_type = sb_type.GetCanonicalType()
+	for i in range(sb_type.GetNumberOfFields()):
+		field = sb_type.GetFieldAtIndex(i)
+		if field.GetName() == name:
+			bit_size = field.GetBitfieldSizeInBits() if field.IsBitfield() else field.GetType().GetByteSize() * 8
+			return field.GetOffsetInBits(), bit_size, field.GetType()
+
+		if not field.GetName():
+			member = find_member(field.GetType(), name)
+			if member != None:
+				return field.GetOffsetInBits() + member[0], member[1], member[2]
+
+	# C++ members inherited from base classes, e.g. OSSymbol -> OSString
+	for i in range(sb_type.GetNumberOfDirectBaseClasses()):
+		base = sb_type.GetDirectBaseClassAtIndex(i)
+		member = find_member(base.GetType(), name)
+		if member != None:
+			return base.GetOffsetInBits() + member[0], member[1], member[2]
+
+	return None
+
+def find_field_bits(sb_type: SBType, name: str) -> Tuple[int, int]:
+	'''
+		Return (bit offset, bit size) of member `name` in sb_type, bitfields
+		and nested paths like "link.next" included, or (-1, 0) when the member
+		doesn't exist
+	'''
+	bit_offset = 0
+	bit_size = 0
+	for part in name.split('.'):
+		member = find_member(sb_type, part)
+		if member == None:
+			return -1, 0
+		bit_offset += member[0]
+		bit_size = member[1]
+		sb_type = member[2]
+
+	return bit_offset, bit_size
+
+def unpack_field(data: bytes, base: int, field_bits: Tuple[int, int]) -> int:
+	'''
+		Extract a field located by find_field_bits from a struct at data[base:]
+	'''
+	bit_offset, bit_size = field_bits
+	if bit_offset == -1:
+		return 0
+
+	start = base + bit_offset // 8
+	end = base + (bit_offset + bit_size + 7) // 8
+	value = int.from_bytes(data[start:end], byteorder='little') >> (bit_offset % 8)
+	return value & ((1 << bit_size) - 1)
+
+def read_value_offline(address: int, sb_type: SBType) -> SBValue:
+	'''
+		Build an SBValue of sb_type from bytes of the loaded memory image
+	'''
+	target = get_target()
+	err = SBError()
+	data = lldb.SBData()
+	data.SetData(err, read_mem(address, sb_type.GetByteSize()), target.GetByteOrder(), target.GetAddressByteSize())
+	return target.CreateValueFromData('var_name', data, sb_type)
+
 class ESBValueException(Exception):
 	# handle exception while using sb_value
 	def __init__(self, *args: object) -> None:
@@ -780,6 +2666,9 @@ class ESBValue(object):
 	is_expression: bool
 	# store metadata for ESBValue
 	sb_attributes: Dict[str, Any]
+	# when reading from a memory image sb_value is built from data,
+	# so keep track of the address it was read from
+	offline_address: Optional[int]
 
 	def __init__(self: Self, var_name: str, var_type: str = ''):
 		super().__init__()
@@ -787,6 +2676,7 @@ class ESBValue(object):
 		# store metadata
 		self.sb_attributes = {}
 		self.is_expression = False
+		self.offline_address = None
 
 		if var_name == 'classcall':
 			# skip initialize for classcall
@@ -795,6 +2685,9 @@ class ESBValue(object):
 		# find this variable in global context
 		g_sb_value = find_global_variable(var_name)
 		if not g_sb_value:
+			if is_offline():
+				raise ESBValueException(f'Unable to find variable {var_name} in this context.')
+
 			# find this variable in local context
 			sb_value: SBValue = get_frame().FindVariable(var_name)
 			if not sb_value.IsValid():
@@ -805,6 +2698,16 @@ class ESBValue(object):
 		else:
 			self.sb_value = g_sb_value
 
+		if is_offline():
+			address = self.sb_value.GetAddress().GetLoadAddress(get_target())
+			self.sb_value = read_value_offline(address, self.sb_value.GetType())
+			self.sb_var_name = 'var_name'
+			self.offline_address = address
+			if var_type:
+				self.sb_value = ESBValue.init_with_address(self.int_value, var_type).sb_value
+				self.offline_address = None
+			return
+
 		if var_type and self.sb_value:
 			address = int(self.sb_value.GetValue(), 16)
 			target = get_target()
@@ -822,12 +2725,28 @@ class ESBValue(object):
 	def init_with_address(cls: Type['ESBValue'], address: int, var_type: str):
 		target = get_target()
 		new_esbvalue = cls('classcall')
-		new_esbvalue.sb_value = target.CreateValueFromExpression('var_name', f'({var_type}){address}')
+		if is_offline():
+			# expression needs a process, build the pointer value from data instead
+			data = lldb.SBData.CreateDataFromUInt64Array(target.GetByteOrder(), target.GetAddressByteSize(), [address])
+			new_esbvalue.sb_value = target.CreateValueFromData('var_name', data, get_type(var_type))
+		else:
+			new_esbvalue.sb_value = target.CreateValueFromExpression('var_name', f'({var_type}){address}')
+		new_esbvalue.sb_var_name = 'var_name'
+		return new_esbvalue
+
+	@classmethod
+	def init_with_offline_address(cls: Type['ESBValue'], address: int, sb_type: SBType):
+		new_esbvalue = cls('classcall')
+		new_esbvalue.sb_value = read_value_offline(address, sb_type)
 		new_esbvalue.sb_var_name = 'var_name'
+		new_esbvalue.offline_address = address
 		return new_esbvalue
 	
 	@classmethod
 	def init_with_expression(cls: Type['ESBValue'], expression: str):
+		if is_offline():
+			raise ESBValueException(f'Unable to evaluate {expression} on memory image.')
+
 		frame = get_frame()
 		if frame != None:
 			exp_sbvalue: SBValue = frame.EvaluateExpression(expression)
@@ -866,6 +2785,9 @@ class ESBValue(object):
 			attr_names = attr_name.split('.')
 		else:
 			attr_names = [attr_name]
+
+		if self.offline_address != None or is_offline():
+			return self._get_offline(attr_names)
 		
 		sb_value = self.sb_value
 
@@ -876,6 +2798,24 @@ class ESBValue(object):
 				raise ESBValueException(f'member attribute {attr_name} didn\'t exists.')
 			
 		return ESBValue.init_with_SBValue(sb_value)
+
+	def _get_offline(self: Self, attr_names: List[str]) -> 'ESBValue':
+		esb_value = self
+		for attr_name in attr_names:
+			if esb_value.sb_value.GetType().IsPointerType():
+				esb_value = esb_value.dereference()
+
+			sb_value: SBValue = esb_value.sb_value.GetChildMemberWithName(attr_name)
+			if not sb_value.IsValid():
+				raise ESBValueException(f'member attribute {attr_name} didn\'t exists.')
+
+			offset = find_field_offset(esb_value.sb_value.GetType(), attr_name)
+			child = ESBValue.init_with_SBValue(sb_value)
+			if esb_value.offline_address != None and offset != -1:
+				child.offline_address = esb_value.offline_address + offset
+			esb_value = child
+
+		return esb_value
 	
 	def has_member(self: Self, attr_name: str) -> bool:
 		'''
@@ -893,6 +2833,9 @@ class ESBValue(object):
 			allproc = ESBValue('allproc')
 			allproc.add_of() is equal to &allproc in C-lang
 		'''
+		if self.offline_address != None:
+			return self.offline_address
+
 		return self.sb_value.GetLoadAddress()
 	
 	@property
@@ -963,6 +2906,10 @@ class ESBValue(object):
 		'''
 			dereference a pointer
 		'''
+		if is_offline():
+			pointee_type = self.sb_value.GetType().GetPointeeType()
+			return ESBValue.init_with_offline_address(self.int_value, pointee_type)
+
 		return ESBValue.init_with_SBValue(self.sb_value.Dereference())
 	
 	def get_SBAddress(self: Self) -> SBAddress:
@@ -975,8 +2922,431 @@ class ESBValue(object):
 		return ESBValue.init_with_address(self.addr_of(), var_type)
 
 	def __getitem__(self: Self, idx) -> 'ESBValue':
+		if is_offline():
+			sb_type: SBType = self.sb_value.GetType()
+			if sb_type.IsPointerType():
+				elem_type = sb_type.GetPointeeType()
+				base = self.int_value
+			else:
+				elem_type = sb_type.GetArrayElementType()
+				base = self.addr_of()
+			return ESBValue.init_with_offline_address(base + idx * elem_type.GetByteSize(), elem_type)
+
 		return ESBValue.init_with_SBValue(self.sb_value.GetChildAtIndex(idx))
 
+# ----------------------------------------------------------
+# Memory patch manager
+# ----------------------------------------------------------
+
+class PatchException(Exception):
+	def __init__(self, *args: object) -> None:
+		super().__init__(*args)
+
+@dataclass
+class PatchRecord:
+	patch_id: int
+	address: int
+	data: bytes
+	original: bytes
+	kind: str = 'bytes'
+	# module uuid and offset from module header, used to rebase the patch
+	# when the module is loaded at another address
+	module_uuid: str = ''
+	module_offset: int = 0
+	applied: bool = True
+	# UniqueID of the process the patch was written in, -1 for patches loaded
+	# from the journal, not saved
+	process_id: int = -1
+
+	@property
+	def size(self: Self) -> int:
+		return len(self.data)
+
+	def to_json(self: Self) -> Dict[str, Any]:
+		return {
+			'id': self.patch_id, 'address': self.address, 'data': self.data.hex(),
+			'original': self.original.hex(), 'kind': self.kind, 'module_uuid': self.module_uuid,
+			'module_offset': self.module_offset, 'applied': self.applied
+		}
+
+	@classmethod
+	def from_json(cls: Type['PatchRecord'], record: Dict[str, Any]) -> 'PatchRecord':
+		return cls(record['id'], record['address'], bytes.fromhex(record['data']),
+					bytes.fromhex(record['original']), record['kind'], record['module_uuid'],
+					record['module_offset'], record['applied'])
+
+def get_module_offset(address: int) -> Tuple[str, int]:
+	'''
+		Return (module uuid, offset from module header) of a loaded address
+	'''
+	target = get_target()
+	sb_addr: SBAddress = target.ResolveLoadAddress(address)
+	module: SBModule = sb_addr.GetModule()
+	if not module.IsValid():
+		return '', 0
+
+	header_addr = module.GetObjectFileHeaderAddress().GetLoadAddress(target)
+	if header_addr == lldb.LLDB_INVALID_ADDRESS:
+		return '', 0
+
+	return module.GetUUIDString(), address - header_addr
+
+def get_module_bases(module_uuids: Set[str]) -> Dict[str, int]:
+	'''
+		Return header load address of every module of module_uuids that is loaded
+	'''
+	bases: Dict[str, int] = {}
+	if not module_uuids:
+		return bases
+
+	target = get_target()
+	for module in target.module_iter():
+		module_uuid = module.GetUUIDString()
+		if module_uuid not in module_uuids or module_uuid in bases:
+			continue
+
+		header_addr = module.GetObjectFileHeaderAddress().GetLoadAddress(target)
+		if header_addr != lldb.LLDB_INVALID_ADDRESS:
+			bases[module_uuid] = header_addr
+
+	return bases
+
+PATCH_JOURNAL_PATH = Path.home() / '.cache' / 'lldbinit' / 'patches.json'
+
+class PatchManager(object):
+	'''
+		Apply memory patches and keep a journal of original bytes per patch id.
+		The journal is saved to disk so patches can be re-applied after a VM
+		snapshot revert or a reboot.
+	'''
+
+	patches: Dict[int, PatchRecord]
+
+	def __init__(self: Self, journal_path: Path = PATCH_JOURNAL_PATH):
+		self.journal_path = journal_path
+		self.patches = {}
+		self.next_id = 1
+		self.load()
+
+	def load(self: Self):
+		try:
+			journal = json.loads(self.journal_path.read_text())
+		except (OSError, ValueError):
+			return
+
+		for record in journal.get('patches', []):
+			patch = PatchRecord.from_json(record)
+			# written in an earlier session, state is unknown until sync() checks memory
+			patch.applied = False
+			self.patches[patch.patch_id] = patch
+		self.next_id = max(self.patches, default=0) + 1
+
+	def save(self: Self):
+		try:
+			self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+			journal = {'patches': [patch.to_json() for patch in self.patches.values()]}
+			self.journal_path.write_text(json.dumps(journal, indent=1))
+		except OSError as err:
+			print(f'[!] Unable to save patch journal {self.journal_path}: {err}')
+
+	def find(self: Self, address: int, kind: str = '') -> Optional[PatchRecord]:
+		for patch in self.patches.values():
+			if patch.address <= address < patch.address + patch.size and (not kind or patch.kind == kind):
+				return patch
+		return None
+
+	def select(self: Self, patch_ids: List[int]) -> List[PatchRecord]:
+		'''
+			Return patches matching patch_ids, all patches if patch_ids is empty
+		'''
+		if not patch_ids:
+			return list(self.patches.values())
+
+		missing = [patch_id for patch_id in patch_ids if patch_id not in self.patches]
+		if missing:
+			raise PatchException(f'patch {missing[0]} not found')
+
+		return [self.patches[patch_id] for patch_id in patch_ids]
+
+	def add(self: Self, address: int, data: bytes, kind: str = 'bytes') -> PatchRecord:
+		for patch in self.patches.values():
+			if patch.applied and patch.address < address + len(data) and address < patch.address + patch.size:
+				raise PatchException(f'0x{address:x} overlaps patch {patch.patch_id} at 0x{patch.address:x}')
+
+		original = read_mem(address, len(data))
+		if len(original) != len(data):
+			raise PatchException(f'Failed to read memory at 0x{address:x}.')
+
+		if write_mem(address, data) != len(data):
+			raise PatchException(f'Failed to write memory at 0x{address:x}.')
+
+		module_uuid, module_offset = get_module_offset(address)
+		patch = PatchRecord(self.next_id, address, bytes(data), original, kind, module_uuid, module_offset,
+							process_id=get_process().GetUniqueID())
+		self.patches[patch.patch_id] = patch
+		self.next_id += 1
+		self.save()
+		return patch
+
+	def rebase(self: Self, patches: List[PatchRecord]) -> List[PatchRecord]:
+		'''
+			Update addresses of patches whose module was loaded at another address,
+			return patches whose address can't be resolved in the current process:
+			module isn't loaded, or the patch is outside any module and was written
+			in another process
+		'''
+		process = get_process()
+		process_id = process.GetUniqueID() if process != None else -1
+		bases = get_module_bases({patch.module_uuid for patch in patches if patch.module_uuid})
+		unresolved: List[PatchRecord] = []
+		for patch in patches:
+			if not patch.module_uuid:
+				if patch.process_id != process_id:
+					unresolved.append(patch)
+				continue
+
+			if patch.module_uuid in bases:
+				patch.address = bases[patch.module_uuid] + patch.module_offset
+			else:
+				unresolved.append(patch)
+
+		return unresolved
+
+	def sync(self: Self, patches: List[PatchRecord]) -> Tuple[List[PatchRecord], List[PatchRecord]]:
+		'''
+			Rebase patches and set applied from the bytes currently in memory.
+			Return (unresolved, mismatched) patches, mismatched ones hold neither
+			the patch nor the original bytes and must not be written
+		'''
+		unresolved = self.rebase(patches)
+		for patch in unresolved:
+			patch.applied = False
+
+		resolved = [patch for patch in patches if patch not in unresolved]
+		mismatched: List[PatchRecord] = []
+		for patch, current in zip(resolved, read_ranges([(patch.address, patch.size) for patch in resolved])):
+			if current == patch.data:
+				patch.applied = True
+			elif current == patch.original:
+				patch.applied = False
+			else:
+				patch.applied = False
+				mismatched.append(patch)
+
+		return unresolved, mismatched
+
+	def _write_patches(self: Self, patches: List[PatchRecord], use_original: bool) -> List[PatchRecord]:
+		ranges = [(patch.address, patch.original if use_original else patch.data) for patch in patches]
+		failed_ranges = write_mem_ranges(ranges)
+
+		failed: List[PatchRecord] = []
+		for patch in patches:
+			if any(addr <= patch.address < addr + len(data) for addr, data in failed_ranges):
+				failed.append(patch)
+			else:
+				patch.applied = not use_original
+
+		self.save()
+		return failed
+
+	def revert(self: Self, patch_ids: List[int] = []) -> List[PatchRecord]:
+		'''
+			Restore original bytes of patches found in memory, return patches
+			failed to revert. Without patch_ids, patches not resolved in this
+			process are skipped
+		'''
+		patches = self.select(patch_ids)
+		unresolved, mismatched = self.sync(patches)
+		failed = mismatched + (unresolved if patch_ids else [])
+		return failed + self._write_patches([patch for patch in patches if patch.applied], use_original=True)
+
+	def reapply(self: Self, patch_ids: List[int] = []) -> List[PatchRecord]:
+		'''
+			Write patches again, e.g after the VM snapshot was reverted or the
+			target rebooted, return patches failed to apply
+		'''
+		patches = self.select(patch_ids)
+		unresolved, mismatched = self.sync(patches)
+		patches = [patch for patch in patches if not patch.applied and patch not in unresolved + mismatched]
+		return unresolved + mismatched + self._write_patches(patches, use_original=False)
+
+	def remove(self: Self, patch_ids: List[int] = []) -> List[PatchRecord]:
+		'''
+			Revert and forget patches, return patches failed to revert.
+			Patches not resolved in this process are forgotten without writing
+		'''
+		patches = self.select(patch_ids)
+		unresolved, mismatched = self.sync(patches)
+		failed = mismatched + self._write_patches([patch for patch in patches if patch.applied], use_original=True)
+		for patch in patches:
+			if patch not in failed:
+				del self.patches[patch.patch_id]
+
+		self.save()
+		return failed
+
+PATCH_MANAGER: Optional[PatchManager] = None
+
+def get_patch_manager() -> PatchManager:
+	global PATCH_MANAGER
+
+	if PATCH_MANAGER == None:
+		PATCH_MANAGER = PatchManager()
+
+	return PATCH_MANAGER
+
+# ----------------------------------------------------------
+# Memory snapshot and page-hash diff
+# ----------------------------------------------------------
+
+MEMSNAP_PAGE_SIZE  = 0x1000
+MEMSNAP_CHUNK_SIZE = 0x100000 # bulk read size, hashing is done per page inside a chunk
+MEMSNAP_IN_FLIGHT  = 8        # chunks read but not hashed yet, bounds snapshot memory use
+
+def page_hash(data: bytes) -> int:
+	if CONFIG_XXHASH_AVAILABLE:
+		return xxhash.xxh3_64_intdigest(data)
+
+	return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+@dataclass
+class MemorySnapshot:
+	name: str
+	stop_id: int
+	page_size: int
+	regions: List[MemoryRegion]
+	# page address -> page hash
+	hashes: Dict[int, int]
+	# page address -> zlib compressed page content, empty if contents were not kept
+	pages: Dict[int, bytes]
+	elapsed: float = 0.0
+
+	@property
+	def has_data(self: Self) -> bool:
+		return len(self.pages) != 0
+
+	def page_data(self: Self, page_addr: int) -> Optional[bytes]:
+		try:
+			return zlib.decompress(self.pages[page_addr])
+		except KeyError:
+			return None
+
+@dataclass
+class MemoryPageDiff:
+	page_addr: int
+	# list of (address, old bytes, new bytes), empty if page contents are not available
+	runs: List[Tuple[int, bytes, bytes]]
+
+def _hash_pages(base: int, chunk: bytes, page_size: int, keep_data: bool) -> Tuple[Dict[int, int], Dict[int, bytes]]:
+	hashes = {}
+	pages = {}
+	view = memoryview(chunk)
+	for offset in range(0, len(chunk), page_size):
+		page = view[offset:offset + page_size]
+		hashes[base + offset] = page_hash(page)
+		if keep_data:
+			pages[base + offset] = zlib.compress(page, 1)
+
+	return hashes, pages
+
+def _read_snapshot_chunk(addr: int, size: int, page_size: int) -> Iterator[Tuple[int, bytes]]:
+	'''
+		Read a chunk in one transfer, if it fails fall back to page granularity
+		so a single unmapped page doesn't drop the whole chunk
+	'''
+	chunk = read_mem(addr, size)
+	if len(chunk) == size:
+		yield addr, chunk
+		return
+
+	for page_addr in range(addr, addr + size, page_size):
+		page = read_mem(page_addr, min(page_size, addr + size - page_addr))
+		if page:
+			yield page_addr, page
+
+def take_memory_snapshot(name: str, regions: List[MemoryRegion], keep_data: bool = True,
+						page_size: int = MEMSNAP_PAGE_SIZE, workers: Optional[int] = None) -> MemorySnapshot:
+	'''
+		Hash every page of regions, memory is read in bulk on the calling thread
+		and hashed/compressed by a thread pool (hashlib and zlib release the GIL)
+	'''
+	start_time = time.time()
+	snapshot = MemorySnapshot(name, get_stop_id(), page_size, regions, {}, {})
+
+	def collect(future: Future):
+		hashes, pages = future.result()
+		snapshot.hashes.update(hashes)
+		snapshot.pages.update(pages)
+
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		futures: typing.Deque[Future] = deque()
+		for region in regions:
+			addr = region.start & ~(page_size - 1)
+			while addr < region.end:
+				size = min(MEMSNAP_CHUNK_SIZE, region.end - addr)
+				for base, chunk in _read_snapshot_chunk(addr, size, page_size):
+					futures.append(pool.submit(_hash_pages, base, chunk, page_size, keep_data))
+					# raw chunks are dropped as soon as they are hashed
+					while len(futures) > MEMSNAP_IN_FLIGHT:
+						collect(futures.popleft())
+				addr += size
+
+		while futures:
+			collect(futures.popleft())
+
+	snapshot.elapsed = time.time() - start_time
+	return snapshot
+
+def diff_bytes(base: int, old: bytes, new: bytes, block: int = 64) -> List[Tuple[int, bytes, bytes]]:
+	'''
+		Return runs of different bytes between old and new, equal blocks are
+		skipped with a single slice comparison
+	'''
+	runs = []
+	length = min(len(old), len(new))
+	run_start = -1
+
+	for block_start in range(0, length, block):
+		block_end = min(block_start + block, length)
+		if old[block_start:block_end] == new[block_start:block_end]:
+			if run_start != -1:
+				runs.append((base + run_start, old[run_start:block_start], new[run_start:block_start]))
+				run_start = -1
+			continue
+
+		for i in range(block_start, block_end):
+			if old[i] != new[i]:
+				if run_start == -1:
+					run_start = i
+			elif run_start != -1:
+				runs.append((base + run_start, old[run_start:i], new[run_start:i]))
+				run_start = -1
+
+	if run_start != -1:
+		runs.append((base + run_start, old[run_start:length], new[run_start:length]))
+
+	return runs
+
+def diff_memory_snapshots(old: MemorySnapshot, new: MemorySnapshot) -> List[MemoryPageDiff]:
+	'''
+		Compare two snapshots, only pages with different hashes are decompressed
+		and compared byte by byte
+	'''
+	changes = []
+	for page_addr in sorted(old.hashes.keys() & new.hashes.keys()):
+		if old.hashes[page_addr] == new.hashes[page_addr]:
+			continue
+
+		old_page = old.page_data(page_addr)
+		new_page = new.page_data(page_addr)
+		runs = []
+		if old_page != None and new_page != None:
+			runs = diff_bytes(page_addr, old_page, new_page)
+
+		changes.append(MemoryPageDiff(page_addr, runs))
+
+	return changes
+
 # ----------------------------------------------------------
 # Cyclic algorithm to find offset on memory
 # ----------------------------------------------------------
@@ -985,62 +3355,75 @@ def de_bruijn(charset: bytes, n: int = 4, maxlen: int = 0x10000) -> bytearray:
 		# string cyclic function
 		# this code base on https://github.com/Gallopsled/pwntools/blob/master/pwnlib/util/cyclic.py
 		# Taken from https://en.wikipedia.org/wiki/De_Bruijn_sequence but changed to a generator
-		"""de_bruijn(charset = string.ascii_lowercase, n = 4) -> generator
+		"""de_bruijn(charset = string.ascii_lowercase, n = 4) -> bytearray
 
-		Generator for a sequence of unique substrings of length `n`. This is implemented using a
+		Sequence of unique substrings of length `n`. This is implemented using a
 		De Bruijn Sequence over the given `charset`.
 
-		The returned generator will yield up to ``len(charset)**n`` elements.
+		Lyndon words are generated iteratively in lexicographic order (same output
+		as the recursive FKM algorithm) so long sequences don't hit recursion limit.
+
+		The returned sequence has up to ``len(charset)**n`` elements.
 
 		Arguments:
 		  charset: List or string to generate the sequence over.
 		  n(int): The length of subsequences that should be unique.
 		"""
 		k = len(charset)
-		a = [0] * k * n
-		sequence = []
-		def db(t, p):
-			if len(sequence) == maxlen:
-				return
-			if t > n:
-				if n % p == 0:
-					for j in range(1	, p + 1):
-						sequence.append(charset[a[j]])
-						if len(sequence) == maxlen:
-							return
-			else:
-				a[t] = a[t - p]
-				db(t + 1, p)
+		sequence = bytearray()
+		word = [-1]
+		while word and len(sequence) < maxlen:
+			word[-1] += 1
+			m = len(word)
+			if n % m == 0:
+				sequence.extend(charset[c] for c in word)
 
-				for j in range(a[t - p] + 1, k):
-					a[t] = j
-					db(t + 1, t)
-		db(1,1)
-		return bytearray(sequence)
+			# extend word periodically to length n
+			while len(word) < n:
+				word.append(word[len(word) - m])
 
-# generate a cyclic string
-def cyclic(length: int = 0, n: int = 4) -> bytearray:
-	charset = [b'ABCDEFGHIJKLMNOPQRSTUVWXYZ', b'%$-;abcdefghijklmopqrtuvwxyz', b'sn()0123456789']
+			while word and word[-1] == k - 1:
+				word.pop()
+
+		del sequence[maxlen:]
+		return sequence
+
+CYCLIC_CHARSETS = [b'ABCDEFGHIJKLMNOPQRSTUVWXYZ', b'%$-;abcdefghijklmopqrtuvwxyz', b'sn()0123456789']
+
+def cyclic_charset() -> bytes:
 	mixed_charset = mixed = b''
 	k = 0
 	while True:
-		for i in range(0, len(charset)): mixed += charset[i][k:k+1]
+		for i in range(0, len(CYCLIC_CHARSETS)): mixed += CYCLIC_CHARSETS[i][k:k+1]
 		if not mixed: break
 		mixed_charset += mixed
 		mixed = b''
 		k+=1
 
-	pattern = de_bruijn(mixed_charset, 3, length)
-	return pattern
+	return mixed_charset
 
-def cyclic_find(subseq: Union[int, bytes], length: int = 0x10000) -> int:
-	# finding subseq in generator then return pos of this subseq
-	# if it doens't find then return -1
-	generator = cyclic(length)
+@functools.lru_cache(maxsize=8)
+def _cyclic_sequence(charset: bytes, n: int, length: int) -> bytes:
+	return bytes(de_bruijn(charset, n, length))
+
+@functools.lru_cache(maxsize=8)
+def _cyclic_index(charset: bytes, n: int, length: int) -> Dict[bytes, int]:
+	'''
+		n-gram -> offset of the cyclic sequence, every n-gram is unique
+	'''
+	sequence = _cyclic_sequence(charset, n, length)
+	return {sequence[i:i + n]: i for i in range(len(sequence) - n + 1)}
+
+# generate a cyclic string
+def cyclic(length: int = 0, n: int = 3) -> bytearray:
+	return bytearray(_cyclic_sequence(cyclic_charset(), n, length))
 
+def cyclic_find(subseq: Union[int, bytes], length: int = 0x10000, n: int = 3) -> int:
+	# finding subseq in cyclic pattern then return pos of this subseq
+	# if it doens't find then return -1
 	if isinstance(subseq, int): # subseq might be a number or hex value
 		try:
-			subseq = p32(subseq)
+			subseq = p32(subseq) if n <= 4 else p64(subseq)
 		except struct.error: # struct.error
 			try:
 				subseq = p64(subseq)
@@ -1049,53 +3432,146 @@ def cyclic_find(subseq: Union[int, bytes], length: int = 0x10000) -> int:
 	
 	if not isinstance(subseq, bytes):
 		return -1
-	
-	# finding position of subseq
-	subseq = bytearray(subseq)
-	saved = bytearray([])
-	pos = 0
-
-	for c in generator:
-		saved.append(c)
-		if len(saved) > len(subseq):
-			saved.pop(0)
-			pos += 1
-		if saved == subseq: # if subseq equal saved then return pos of subseq
-			return pos
-	
-	return -1
 
-def hexdump(addr: int, chars: bytes, sep: str, width: int, lines: int = 0xFFFFFFF) -> str:
-	l = []
-	line_count = 0
-	
-	while chars:
-		if line_count >= lines:
-			break
-		line = chars[:width]
-		chars = chars[width:]
-		line = line.ljust(width, b'\x00' )
-		if get_pointer_size() == 4:
-			szaddr = "0x%.08X" % addr
+	charset = cyclic_charset()
+	sequence = _cyclic_sequence(charset, n, length)
+	if len(subseq) < n:
+		return sequence.find(subseq)
+
+	pos = _cyclic_index(charset, n, length).get(subseq[:n], -1)
+	if pos == -1 or sequence[pos:pos + len(subseq)] != subseq:
+		return -1
+
+	return pos
+
+@dataclass
+class CyclicMatch:
+	address: int # memory address, or byte index in a register value
+	offset: int  # offset in cyclic pattern
+	span: int    # number of matched bytes
+
+def cyclic_search(data: bytes, base: int = 0, length: int = 0x10000, n: int = 3, min_span: int = 4) -> List[CyclicMatch]:
+	'''
+		Find every run of data that is part of the cyclic pattern,
+		one linear pass using the n-gram index
+	'''
+	charset = cyclic_charset()
+	sequence = _cyclic_sequence(charset, n, length)
+	index = _cyclic_index(charset, n, length)
+	min_span = max(min_span, n)
+
+	matches: List[CyclicMatch] = []
+	i = 0
+	end = len(data) - n + 1
+	while i < end:
+		pos = index.get(data[i:i + n], -1)
+		if pos == -1:
+			i += 1
+			continue
+
+		span = n
+		while i + span < len(data) and pos + span < len(sequence) and data[i + span] == sequence[pos + span]:
+			span += 1
+
+		if span >= min_span:
+			matches.append(CyclicMatch(base + i, pos, span))
+			i += span
 		else:
-			szaddr = "0x%.016lX" % addr
-		
-		l.append("\033[1m%s :\033[0m %s%s \033[1m%s\033[0m" % \
-				(szaddr, sep.join( "%02X" % c for c in line ), sep, quotechars( line )))
-		
-		addr += 0x10
-		line_count = line_count + 1
+			i += 1
+
+	return matches
+
+HEXDUMP_ASCII_TABLE = bytes(c if 0x20 <= c <= 126 else ord('.') for c in range(256))
+HEXDUMP_CHUNK_SIZE = 0x10000
+
+def swap_units(data: bytes, unit: int) -> bytes:
+	'''
+		Reverse byte order of every unit sized value in data, so hex() of the
+		result prints little endian values as numbers. Trailing bytes that
+		don't fill a unit are kept as they are
+	'''
+	if unit == 1:
+		return data
+
+	full = len(data) // unit * unit
+	swapped = bytearray(data)
+	for i in range(unit):
+		swapped[i:full:unit] = data[unit - 1 - i:full:unit]
+	return bytes(swapped)
 
-	return "\n".join(l)
+def hex_units(values: bytes, unit: int) -> str:
+	'''
+		Hex string of values grouped by unit, a trailing partial unit is
+		printed byte by byte
+	'''
+	full = len(values) // unit * unit
+	hex_str = values[:full].hex(' ', unit)
+	if full < len(values):
+		hex_str = ' '.join(filter(None, [hex_str, values[full:].hex(' ')]))
+	return hex_str
+
+def hexdump_lines(addr: int, data: bytes, unit: int = 1, width: int = 16, show_ascii: bool = True,
+					split: bool = False, pointer_size: int = 0, bold: bool = True) -> Iterator[str]:
+	'''
+		Format data as hexdump lines of `width` bytes, values are `unit` bytes long.
+		split puts a '-' between two halves of a line.
+	'''
+	if not pointer_size:
+		pointer_size = get_pointer_size()
+	addr_fmt = '0x{:08X}' if pointer_size == 4 else '0x{:016X}'
+	bold_on, bold_off = ('\033[1m', '\033[0m') if bold else ('', '')
+
+	values = swap_units(data, unit)
+	hex_width = width * 2 + width // unit - 1
+	if split:
+		hex_width += 2
+
+	for off in range(0, len(data), width):
+		line = values[off:off + width]
+		if split:
+			half = width // 2
+			hex_str = hex_units(line[:half], unit)
+			if len(line) > half:
+				hex_str += ' - ' + hex_units(line[half:], unit)
+		else:
+			hex_str = hex_units(line, unit)
+		hex_str = hex_str.upper()
+
+		if show_ascii:
+			ascii_str = data[off:off + width].translate(HEXDUMP_ASCII_TABLE).decode('ascii')
+			yield f'{bold_on}{addr_fmt.format(addr + off)} :{bold_off} {hex_str:<{hex_width}} {bold_on}{ascii_str}{bold_off}'
+		else:
+			yield f'{bold_on}{addr_fmt.format(addr + off)} :{bold_off} {hex_str}'
+
+def hexdump_stream(addr: int, length: int, write, unit: int = 1, width: int = 16,
+					show_ascii: bool = True, split: bool = False, bold: bool = True) -> int:
+	'''
+		Read and format memory in chunks, pass every formatted chunk to write().
+		Stops at the first unreadable chunk, return number of bytes dumped.
+	'''
+	pointer_size = get_pointer_size()
+	chunk_size = max(HEXDUMP_CHUNK_SIZE // width * width, width)
+
+	dumped = 0
+	while dumped < length:
+		size = min(chunk_size, length - dumped)
+		data = read_mem(addr + dumped, size)
+		if not data:
+			break
+
+		write('\n'.join(hexdump_lines(addr + dumped, data, unit, width, show_ascii, split, pointer_size, bold)) + '\n')
+		dumped += len(data)
+		if len(data) < size:
+			break
+
+	return dumped
+
+def hexdump(addr: int, chars: bytes, sep: str, width: int, lines: int = 0xFFFFFFF) -> str:
+	chars = chars[:width * lines].ljust(width, b'\x00')
+	return "\n".join(hexdump_lines(addr, chars, width=width))
 
 def quotechars(chars: bytes) -> str:
-	data = ""
-	for x in bytearray(chars):
-		if x >= 0x20 and x <= 126:
-			data += chr(x)
-		else:       
-			data += "."
-	return data
+	return chars.translate(HEXDUMP_ASCII_TABLE).decode('ascii')
 
 def get_uuid_summary(uuid_bytes: bytes) -> str:
 
@@ -27,6 +27,40 @@ MACOS_PANIC_STACKSHOT_SUCCEEDED_FLAG = 0x04
 AURR_PANIC_MAGIC = 0x41555252
 AURR_PANIC_VERSION = 1
 
+def get_kernel_load_key() -> Tuple[int, int]:
+	'''
+		(process unique id, kernel header load address), a reboot changes the
+		kernel slide and a re-attach the process
+	'''
+	target = get_target()
+	process = target.GetProcess()
+	if not process.IsValid() or target.GetNumModules() == 0:
+		return -1, -1
+
+	kernel_header = target.GetModuleAtIndex(0).GetObjectFileHeaderAddress()
+	return process.GetUniqueID(), kernel_header.GetLoadAddress(target)
+
+class KernelCache(object):
+	'''
+		functools.lru_cache of a function of kernel addresses, cleared when
+		get_kernel_load_key() changes
+	'''
+
+	def __init__(self: Self, func: Callable, maxsize: int):
+		self.cached_func = functools.lru_cache(maxsize=maxsize)(func)
+		self.load_key = (-1, -1)
+		functools.update_wrapper(self, func)
+
+	def __call__(self: Self, *args: Any) -> Any:
+		load_key = get_kernel_load_key()
+		if load_key != self.load_key:
+			self.cached_func.cache_clear()
+			self.load_key = load_key
+		return self.cached_func(*args)
+
+def kernel_lru_cache(maxsize: int) -> Callable[[Callable], KernelCache]:
+	return lambda func: KernelCache(func, maxsize)
+
 ## main functions ##
 @dataclass
 class KextInfo:
@@ -83,6 +117,42 @@ def xnu_showallkexts():
 		kext_name    = KEXT_INFO_DICTIONARY[kext_bin_name].name
 		print(f'+ {kext_name:{longest_kext_name}}\t{kext_uuid}\t\t0x{kext_address:X}\t{kext_size}')
 
+VM_PROT_READ    = 0x1
+VM_PROT_WRITE   = 0x2
+VM_PROT_EXECUTE = 0x4
+
+def xnu_kernel_map_regions() -> List[MemoryRegion]:
+	'''
+		Walk vm_map_entry list of kernel_map, return mapped regions
+	'''
+	try:
+		kernel_map = ESBValue('kernel_map')
+	except ESBValueException:
+		print('Unable to find "kernel_map" symbol in this kernel')
+		return []
+
+	header = kernel_map.get('hdr.links')
+	header_addr = header.addr_of()
+	nentries = kernel_map.get('hdr.nentries').int_value
+
+	regions: List[MemoryRegion] = []
+	entry = header.get('next')
+	while entry.is_not_null and entry.int_value != header_addr and len(regions) < nentries:
+		start = entry.get('links.start').int_value
+		end = entry.get('links.end').int_value
+
+		perm = ''
+		if entry.has_member('protection'):
+			protection = entry.get('protection').int_value
+			perm += 'r' if protection & VM_PROT_READ else '-'
+			perm += 'w' if protection & VM_PROT_WRITE else '-'
+			perm += 'x' if protection & VM_PROT_EXECUTE else '-'
+
+		regions.append(MemoryRegion(start, end, perm))
+		entry = entry.get('links.next')
+
+	return regions
+
 def xnu_write_task_kdp_pmap(task: ESBValue) -> bool:
 	try:
 		kdp_pmap = ESBValue('kdp_pmap')
@@ -115,78 +185,253 @@ def xnu_reset_kdp_pmap() -> bool:
 
 	return True
 
-def xnu_read_user_address(task: ESBValue, address: int, size: int) -> bytes:
-	out = ''
+# page caches of user address spaces, keyed by pmap
+USER_PAGE_CACHES: Dict[int, PageCache] = {}
 
-	if get_connection_protocol() != 'kdp':
-		print('[!] xnu_read_user_address() only works on kdp-remote')
-		return b''
+class UserAddressSpace(MemoryReader):
+	'''
+		Route read_mem()/write_mem() to the address space of a task over kdp.
+		kdp_pmap is switched once when the session starts and the original value
+		is written back when it ends, even if a command fails in between:
 
-	if not xnu_write_task_kdp_pmap(task):
-		return b''
+			with UserAddressSpace(task):
+				data = read_mem(user_addr, size)
 
-	out = read_mem(address, size)
+		A session started inside another one reads through the reader below
+		the outer session, so pages of the two address spaces never mix.
+		A session lasts for one stop: once the process resumed, detached or
+		was re-attached it ends at the next read or context draw
+	'''
+	name = 'user'
+
+	def __init__(self: Self, task: ESBValue):
+		task = task.cast_to('task *')
+		self.pmap = task.get('map').get('pmap').int_value
+		self.kdp_pmap_addr = 0
+		self.original_pmap = 0
+		# reader installed before the session, restored when it ends
+		self.prev_reader: Optional[MemoryReader] = None
+		# reader serving kdp memory, never a UserAddressSpace
+		self.base_reader: Optional[MemoryReader] = None
+		# (process unique id, stop id) the session was started in
+		self.stop_key: Tuple[int, int] = (-1, -1)
+		self.cache = USER_PAGE_CACHES.setdefault(self.pmap, PageCache())
+
+	@staticmethod
+	def get_stop_key() -> Tuple[int, int]:
+		process = get_process()
+		if not process.IsValid():
+			return -1, -1
+		return process.GetUniqueID(), process.GetStopID()
 
-	if not xnu_reset_kdp_pmap():
-		print(f'[!] Reset kdp_pmap failed')
-		return b''
+	@property
+	def is_active(self: Self) -> bool:
+		return self.prev_reader != None
 
-	return out
+	def start(self: Self):
+		if get_connection_protocol() != 'kdp':
+			raise LLDBMemoryException('user address space only works on kdp-remote')
 
-def xnu_write_user_address(task: ESBValue, address: int, value: int) -> bool:
-	if get_connection_protocol() != 'kdp':
-		print('[!] xnu_read_user_address() only works on kdp-remote')
-		return False
+		try:
+			self.kdp_pmap_addr = ESBValue('kdp_pmap').addr_of()
+		except ESBValueException:
+			raise LLDBMemoryException('Unable to find "kdp_pmap" symbol in this kernel')
+
+		prev_reader = get_memory_reader()
+		base_reader = prev_reader.base_reader if isinstance(prev_reader, UserAddressSpace) else prev_reader
+		original_pmap = base_reader.read(self.kdp_pmap_addr, 8)
+		if len(original_pmap) != 8:
+			raise LLDBMemoryException('Unable to read kdp_pmap.')
+
+		if base_reader.write(self.kdp_pmap_addr, pack('<Q', self.pmap)) != 8:
+			raise LLDBMemoryException('Overwrite kdp_pmap with task->map->pmap failed.')
+		self.original_pmap = unpack('<Q', original_pmap)[0]
+		self.prev_reader = prev_reader
+		self.base_reader = base_reader
+		self.stop_key = self.get_stop_key()
+		# kdp_pmap itself may sit in a page cached by an earlier session
+		self.cache.invalidate(self.kdp_pmap_addr, 8)
+		set_memory_reader(self)
+
+	def stop(self: Self) -> bool:
+		if self.prev_reader == None:
+			return True
 
-	if xnu_write_task_kdp_pmap(task):
-		return False
+		set_memory_reader(self.prev_reader)
+		# kdp_pmap of a detached or rebooted kernel can't be written anymore
+		restored = True
+		if self.get_stop_key()[0] == self.stop_key[0]:
+			restored = self.base_reader.write(self.kdp_pmap_addr, pack('<Q', self.original_pmap)) == 8
+		self.cache.invalidate(self.kdp_pmap_addr, 8)
+		self.prev_reader = None
+		self.base_reader = None
+		return restored
+
+	def stop_if_stale(self: Self) -> bool:
+		'''
+			End the session if the process resumed or changed since it started,
+			return True if it ended
+		'''
+		if not self.is_active or self.get_stop_key() == self.stop_key:
+			return False
 
-	if not write_mem(address, value.to_bytes(byteorder='little', length=4)):
-		return False
+		if not self.stop():
+			print('[!] Reset kdp_pmap failed')
+		print(f'[!] Left user address space {self.pmap:#x}, the process resumed or changed')
+		return True
+
+	def __enter__(self: Self) -> 'UserAddressSpace':
+		self.start()
+		return self
 
-	if not xnu_reset_kdp_pmap():
-		print(f'[!] Reset kdp_pmap failed')
+	def __exit__(self: Self, *args: object) -> bool:
+		if not self.stop():
+			print(f'[!] Reset kdp_pmap failed')
 		return False
 
-	return True
+	def read(self: Self, addr: int, size: int) -> bytes:
+		if self.stop_if_stale():
+			return read_mem(addr, size)
 
-def xnu_find_process_by_name(proc_name: str) -> Optional[ESBValue]:
+		self.cache.sync()
+		for run_addr, run_size in self.cache.missing_runs(addr, size):
+			self.cache.put(run_addr, self.base_reader.read(run_addr, run_size))
+
+		data = self.cache.get(addr, size)
+		if len(data) < size:
+			# partial pages are not cached, read the rest directly
+			data += self.base_reader.read(addr + len(data), size - len(data))
+		return data
+
+	def write(self: Self, addr: int, data: bytes) -> int:
+		if self.stop_if_stale():
+			return write_mem(addr, data)
+
+		self.cache.invalidate(addr, len(data))
+		return self.base_reader.write(addr, data)
+
+def xnu_read_user_address(task: ESBValue, address: int, size: int) -> bytes:
+	try:
+		with UserAddressSpace(task):
+			return read_mem(address, size)
+	except LLDBMemoryException as err:
+		print(f'[!] xnu_read_user_address(): {err}')
+		return b''
+
+def xnu_write_user_address(task: ESBValue, address: int, value: int) -> bool:
 	try:
+		with UserAddressSpace(task):
+			return write_mem(address, value.to_bytes(byteorder='little', length=4)) == 4
+	except LLDBMemoryException as err:
+		print(f'[!] xnu_write_user_address(): {err}')
+		return False
+
+@dataclass(frozen=True)
+class ProcInfo:
+	pid: int
+	name: str
+	address: int
+	task: int
+
+class ProcessTable(object):
+	'''
+		Snapshot of allproc taken with one read per proc, indexed by pid, name and task
+	'''
+
+	def __init__(self: Self):
+		self.stop_id = get_stop_id()
+		self.procs: List[ProcInfo] = []
+		self.by_pid: Dict[int, ProcInfo] = {}
+		self.by_name: Dict[str, List[ProcInfo]] = {}
+		self.by_task: Dict[int, ProcInfo] = {}
+		self.by_address: Dict[int, ProcInfo] = {}
+
 		allproc = ESBValue('allproc')
-	except ESBValueException:
-		print('Unable to find "allproc" symbol in this kernel')
+		proc_type = get_type('struct proc')
+		next_field = find_field_bits(proc_type, 'p_list.le_next')
+		pid_field = find_field_bits(proc_type, 'p_pid')
+		name_field = find_field_bits(proc_type, 'p_name')
+		task_field = find_field_bits(proc_type, 'task')
+		# newer kernels allocate the task right after the proc
+		proc_struct_size = get_proc_struct_size() if task_field[0] == -1 else 0
+
+		read_size = max(sum(field) for field in (next_field, pid_field, name_field, task_field)) // 8
+		proc_addr = allproc.get('lh_first').int_value
+		while proc_addr and proc_addr not in self.by_address:
+			data = read_mem(proc_addr, read_size)
+			if len(data) != read_size:
+				break
+
+			name_start = name_field[0] // 8
+			p_name = data[name_start:name_start + name_field[1] // 8].split(b'\x00', 1)[0].decode('utf-8', 'replace')
+			task = unpack_field(data, 0, task_field) if task_field[0] != -1 else proc_addr + proc_struct_size
+			self.add(ProcInfo(unpack_field(data, 0, pid_field), p_name, proc_addr, task))
+			proc_addr = unpack_field(data, 0, next_field)
+
+	def add(self: Self, proc: ProcInfo):
+		self.procs.append(proc)
+		self.by_pid.setdefault(proc.pid, proc)
+		self.by_name.setdefault(proc.name, []).append(proc)
+		self.by_task[proc.task] = proc
+		self.by_address[proc.address] = proc
+
+	def find(self: Self, pid_or_name: str) -> Optional[ProcInfo]:
+		'''
+			Find a proc by pid when pid_or_name is a number, else by name
+		'''
+		if pid_or_name.isdigit() and pid_or_name not in self.by_name:
+			return self.by_pid.get(int(pid_or_name))
+
+		procs = self.by_name.get(pid_or_name)
+		return procs[0] if procs else None
+
+PROCESS_TABLE: Optional[ProcessTable] = None
+PROC_STRUCT_SIZE = -1
+
+def get_proc_struct_size() -> int:
+	global PROC_STRUCT_SIZE
+
+	if PROC_STRUCT_SIZE == -1:
+		PROC_STRUCT_SIZE = ESBValue('proc_struct_size').int_value
+	return PROC_STRUCT_SIZE
+
+def get_process_table() -> Optional[ProcessTable]:
+	'''
+		Return the allproc snapshot of the current stop, None if allproc is missing
+	'''
+	global PROCESS_TABLE
+
+	if PROCESS_TABLE == None or PROCESS_TABLE.stop_id != get_stop_id():
+		try:
+			PROCESS_TABLE = ProcessTable()
+		except (ESBValueException, NameError):
+			print('Unable to find "allproc" symbol in this kernel')
+			return None
+
+	return PROCESS_TABLE
+
+def xnu_find_proc_info(pid_or_name: str) -> Optional[ProcInfo]:
+	process_table = get_process_table()
+	if process_table == None:
 		return None
-	
-	allproc_ptr = allproc.get('lh_first')
 
-	match_proc = None
-	while not allproc_ptr.is_null:
-		p_name = allproc_ptr.get('p_name').str_value
-		if p_name == proc_name:
-			match_proc = allproc_ptr 
-			break
+	return process_table.find(pid_or_name)
 
-		allproc_ptr = allproc_ptr.get('p_list').get('le_next')
+def xnu_find_process_by_name(proc_name: str) -> Optional[ESBValue]:
+	proc_info = xnu_find_proc_info(proc_name)
+	if proc_info == None:
+		return None
 
-	return match_proc	
+	return ESBValue.init_with_address(proc_info.address, 'proc *')
 
 def xnu_list_all_process():
-	try:
-		allproc = ESBValue('allproc')
-	except ESBValueException:
-		print('Unable to find "allproc" symbol in this kernel')
+	process_table = get_process_table()
+	if process_table == None:
 		return None
 
-	pproc = allproc.get('lh_first')
-	
 	print(f'+ {"PID":<5} | {"Proc Name":<40} | {"Proc Address":<20} | {"Task Address":<20}')
-	while not pproc.is_null:
-		p_name = pproc.get('p_name').str_value
-		p_pid = pproc.get('p_pid').int_value
-		task = get_ipc_task(pproc)
-		print(f'+ {p_pid:<5} | {p_name:<40} | {pproc.int_value:#20x} | {task.int_value:#20x}')
-
-		pproc = pproc.get('p_list').get('le_next')
+	for proc in process_table.procs:
+		print(f'+ {proc.pid:<5} | {proc.name:<40} | {proc.address:#20x} | {proc.task:#20x}')
 
 def xnu_showbootargs() -> str:
 	try:
@@ -240,6 +485,21 @@ LTABLE_ID_IDX_SHIFT = LTABLE_ID_GEN_BITS
 LTABLE_ID_IDX_BITS  = 18
 LTABLE_ID_IDX_MASK  = 0xffffc00000000000
 
+# ie_bits of ipc_entry
+IE_BITS_UREFS_MASK       = 0x0000ffff
+IE_BITS_TYPE_MASK        = 0x001f0000
+MACH_PORT_TYPE_SEND      = 0x00010000
+MACH_PORT_TYPE_RECEIVE   = 0x00020000
+MACH_PORT_TYPE_SEND_ONCE = 0x00040000
+MACH_PORT_TYPE_PORT_SET  = 0x00080000
+MACH_PORT_TYPE_DEAD_NAME = 0x00100000
+
+# io_bits of ipc_object
+IO_BITS_KOTYPE     = 0x000003ff
+IO_BITS_KOBJECT    = 0x00000800
+IO_BITS_FILTER_MSG = 0x00001000
+IO_BITS_ACTIVE     = 0x80000000
+
 def waitq_table_idx_from_id(_id: ESBValue) -> int:
 	return int((_id.int_value & LTABLE_ID_IDX_MASK) >> LTABLE_ID_IDX_SHIFT)
 
@@ -268,12 +528,18 @@ def get_ipc_task(proc: ESBValue) -> ESBValue:
 	if proc.has_member('task'):
 		return proc.get('task').cast_to('task *')
 	
-	proc_struct_size = ESBValue('proc_struct_size').int_value
-	task = ESBValue.init_with_address(proc.int_value + proc_struct_size, 'task *')
+	task = ESBValue.init_with_address(proc.int_value + get_proc_struct_size(), 'task *')
 	return task
 
 def get_proc_from_task(task: ESBValue) -> ESBValue:
-	return task.get('bsd_info').cast_to('proc *')
+	if task.has_member('bsd_info'):
+		return task.get('bsd_info').cast_to('proc *')
+
+	# the proc is allocated right before its task
+	process_table = get_process_table()
+	proc_info = process_table.by_task.get(task.int_value) if process_table != None else None
+	proc_addr = proc_info.address if proc_info != None else task.int_value - get_proc_struct_size()
+	return ESBValue.init_with_address(proc_addr, 'proc *')
 
 def get_destination_proc_from_port(port : ESBValue) -> ESBValue:
 	dest_space = port.get('ip_receiver')
@@ -334,13 +600,17 @@ def get_iokit_object_type_str(kobject: ESBValue) -> str:
 	# get iokit object type
 	vtable_ptr = kobject.cast_to('uintptr_t *').dereference()
 	vtable_func_ptr = ESBValue.init_with_address(vtable_ptr.int_value + 2 * size_of('uintptr_t'), 'uintptr_t *')
-	first_vtable_func = vtable_func_ptr[0].int_value
-	func_desc = resolve_symbol_name(first_vtable_func)
-	m = re.match(r'(\w*)::(\w*)', func_desc)
-	if not m:
-		return '<unknow>'
-	
-	return m[1]
+	return get_iokit_class_from_vfunc(vtable_func_ptr[0].int_value)
+
+def get_kotype_name(io_bits: int) -> str:
+	objtype_index = io_bits & IO_BITS_KOTYPE
+	try:
+		return get_enum_name('ipc_kotype_t', objtype_index, "IKOT_")
+	except NameError:
+		try:
+			return kobject_types[objtype_index]
+		except IndexError:
+			return 'UNKNOW'
 
 def get_kobject_from_port(portval: ESBValue) -> str:
 	""" Get Kobject description from the port.
@@ -356,14 +626,7 @@ def get_kobject_from_port(portval: ESBValue) -> str:
 		kobject_val = portval.get('kdata.kobject') # use old way
 
 	kobject_str = "{0: <#020x}".format(kobject_val.int_value)
-	objtype_index = io_bits & 0x3ff
-	try:
-		objtype_str   = get_enum_name('ipc_kotype_t', objtype_index, "IKOT_")
-	except NameError:
-		try:
-			objtype_str = kobject_types[objtype_index]
-		except IndexError:
-			objtype_str = 'UNKNOW'
+	objtype_str = get_kotype_name(io_bits)
 
 	if objtype_str == 'IOKIT_OBJECT' or objtype_str == 'IOKIT_OBJ':
 		iokit_classnm = get_iokit_object_type_str(kobject_val)
@@ -398,160 +661,367 @@ def get_port_destination_summary(port: ESBValue) -> str:
 	out_str += "{0: <20s} {1: <20s}".format(destname_str, destination_str)
 	return out_str
 
-def get_ipc_entry_summary(entry: ESBValue, ipc_name: int = 0, rights_filter: str = ''):
-	""" 
-		Borrow from XNU source
-		Get summary of a ipc entry.
-		params:
-			entry - core.value representing ipc_entry_t in the kernel
-			ipc_name - str of format '0x0123' for display in summary.  
-		returns:
-			str - string of ipc entry related information
-
-		types of rights:
-			'Dead'  : Dead name
-			'Set'   : Port set
-			'S'     : Send right
-			'R'     : Receive right
-			'O'     : Send-once right
-			'm'     : Immovable send port
-			'i'     : Immovable receive port
-			'g'     : No grant port
-		types of notifications:
-			'd'     : Dead-Name notification requested
-			's'     : Send-Possible notification armed
-			'r'     : Send-Possible notification requested
-			'n'     : No-Senders notification requested
-			'x'     : Port-destroy notification requested
-	"""
-	ipc_entry_info = {
-		"object" : 0,
-		"right" : '', "urefs" : 0,
-		"nsets" : 0, "nmsgs" : 0,
-		"destname" : '', "destination" : ''
-	}
-
-	ie_object = entry.get('ie_object')
-	ie_bits = entry.get('ie_bits').int_value
-
-	if (ie_bits & 0x001f0000) == 0:
-		# entry is freed
-		return None
+def get_ie_bits_rights(ie_bits: int) -> str:
+	if ie_bits & MACH_PORT_TYPE_DEAD_NAME:
+		return 'Dead'
+	if ie_bits & MACH_PORT_TYPE_PORT_SET:
+		return 'Set'
+	if ie_bits & MACH_PORT_TYPE_SEND:
+		return 'SR' if ie_bits & MACH_PORT_TYPE_RECEIVE else 'S'
+	if ie_bits & MACH_PORT_TYPE_RECEIVE:
+		return 'R'
+	if ie_bits & MACH_PORT_TYPE_SEND_ONCE:
+		return 'O'
+	return ''
+
+@kernel_lru_cache(maxsize=0x1000)
+def get_iokit_class_from_vfunc(first_vtable_func: int) -> str:
+	m = re.match(r'(\w*)::(\w*)', resolve_symbol_name(first_vtable_func))
+	if not m:
+		return '<unknow>'
 
-	io_bits = ie_object.get('io_bits').int_value
-	ipc_entry_info['urefs'] = ie_bits & 0xffff
-	ipc_entry_info['object'] = ie_object.int_value
+	return m[1]
 
-	if ie_bits & 0x00100000:
-		ipc_entry_info['right'] = 'Dead'
-	elif ie_bits & 0x00080000:
-		ipc_entry_info['right'] = 'Set'
-		psetval = ie_object.cast_to('ipc_pset *')
+def find_first_field_bits(sb_type: SBType, *names: str) -> Tuple[int, int]:
+	'''
+		find_field_bits() of the first member that exists, for members renamed across versions
+	'''
+	for name in names:
+		field_bits = find_field_bits(sb_type, name)
+		if field_bits[0] != -1:
+			return field_bits
 
-		wqset_q = psetval.get('ips_wqset.wqset_q')
-		if not wqset_q.is_valid:
-			wqset_q = psetval.get('ips_messages.data.pset.setq.wqset_q')
-		
-		# set_str = get_waitq_sets(wqset_q)
+	return -1, 0
 
-		# ipc_entry_info['nsets'] = len(set_str)
-		ipc_entry_info['nmsgs'] = 0
-	else:
-		if ie_bits & 0x00010000:
-			if ie_bits & 0x00020000:
-				# SEND + RECV
-				ipc_entry_info['right'] = 'SR'
-			else:
-				# SEND only
-				ipc_entry_info['right'] = 'S'
-		elif ie_bits & 0x00020000:
-			# RECV only
-			ipc_entry_info['right'] = 'R'
-		elif ie_bits & 0x00040000 :
-			# SEND_ONCE
-			ipc_entry_info['right'] = 'O'
-		portval = ie_object.cast_to('ipc_port_t')
-
-		ie_request = entry.get('ie_request').int_value
-		if ie_request:
-			ip_requests_addr = portval.get('ip_requests').int_value
-			requestsval = ESBValue.init_with_address(
-								ip_requests_addr + ie_request * size_of('struct ipc_port_request'),
-								'struct ipc_port_request *'
-							)
-			sorightval = requestsval.get('notify.port')
-			soright_ptr = sorightval.int_value
-			if soright_ptr != 0:
-				# dead-name notification requested
-				ipc_entry_info['right'] += 'd'
-				# send-possible armed
-				if soright_ptr & 0x1:
-					ipc_entry_info['right'] += 's'
-				# send-possible requested
-				if soright_ptr & 0x2:
-					ipc_entry_info['right'] += 'r'
-		
-		if portval.has_member('ip_kobject_nsrequest'):
-			no_sender_request = portval.get('ip_kobject_nsrequest').int_value
-		
-		else:
-			no_sender_request = portval.get('ip_nsrequest').int_value
+@dataclass(frozen=True)
+class IPCEntry:
+	idx: int
+	name: int
+	object: int
+	bits: int
+	request: int
 
-		# No-senders notification requested
-		if no_sender_request:
-			ipc_entry_info['right'] += 'n'
-		
-		# port-destroy notification requested
-		if portval.get('ip_pdrequest').int_value:
-			ipc_entry_info['right'] += 'x'
-		
-		# Immovable receive rights
-		if portval.get('ip_immovable_receive').int_value:
-			ipc_entry_info['right'] += 'i'
-		
-		# Immovable send rights
-		if portval.get('ip_immovable_send').int_value:
-			ipc_entry_info['right'] += 'm'
+	@property
+	def urefs(self: Self) -> int:
+		return self.bits & IE_BITS_UREFS_MASK
+
+	@property
+	def rights(self: Self) -> str:
+		return get_ie_bits_rights(self.bits)
 
-		# No-grant Port
-		if portval.get('ip_no_grant').int_value:
-			ipc_entry_info['right'] += 'g'
+	@property
+	def is_port(self: Self) -> bool:
+		return self.object != 0 and not self.bits & (MACH_PORT_TYPE_PORT_SET | MACH_PORT_TYPE_DEAD_NAME)
+
+@dataclass(frozen=True)
+class IPCPort:
+	address: int
+	io_bits: int
+	# ipc_space holding the receive right
+	receiver: int
+	receiver_name: int
+	kobject: int
+	msgcount: int
+	requests: int
+	# port notification/attribute flags, see IPCIndex.entry_rights()
+	flags: str
+
+	@property
+	def is_active(self: Self) -> bool:
+		return bool(self.io_bits & IO_BITS_ACTIVE)
 
-		# Port with SB filtering on
-		if io_bits & 0x00001000 != 0:
-			ipc_entry_info['right'] += 'f'
+	@property
+	def is_kobject(self: Self) -> bool:
+		return bool(self.io_bits & IO_BITS_KOBJECT)
 
-		# early-out if the rights-filter doesn't match
-		if rights_filter != '' and rights_filter != ipc_entry_info['right']:
+class IPCIndex(object):
+	'''
+		Entry tables of all tasks decoded from one read per table and referenced
+		ipc_port structs read in clustered batches, indexed by port so holders
+		of a right and the receiver of a port are lookups
+	'''
+
+	def __init__(self: Self, process_table: ProcessTable):
+		self.stop_id = get_stop_id()
+		# ipc_space -> proc owning it
+		self.spaces: Dict[int, ProcInfo] = {}
+		# proc address -> ipc_space, used entries of its table
+		self.proc_spaces: Dict[int, int] = {}
+		self.entries: Dict[int, List[IPCEntry]] = {}
+		self.ports: Dict[int, IPCPort] = {}
+		# port -> (proc, entry) of every task naming the port
+		self.holders: Dict[int, List[Tuple[ProcInfo, IPCEntry]]] = {}
+		# (port, ie_request) -> notify.port of the port request
+		self.notify_requests: Dict[Tuple[int, int], int] = {}
+		# kobject -> IOKit class name
+		self.iokit_classes: Dict[int, str] = {}
+
+		task_type = get_type('struct task')
+		space_field = find_field_bits(task_type, 'itk_space')
+		tasks = read_structs([proc.task for proc in process_table.procs], sum(space_field) // 8)
+		for proc in process_table.procs:
+			space = unpack_field(tasks.get(proc.task, b''), 0, space_field)
+			if space:
+				self.proc_spaces[proc.address] = space
+				self.spaces.setdefault(space, proc)
+
+		self.load_entries(process_table)
+		self.load_ports()
+
+	def load_entries(self: Self, process_table: ProcessTable):
+		space_type = get_type('struct ipc_space')
+		entry_type = get_type('struct ipc_entry')
+		entry_size = entry_type.GetByteSize()
+
+		table_field = find_field_bits(space_type, 'is_table.__hazard_ptr')
+		size_field = (-1, 0)
+		if table_field[0] == -1:
+			# macOS 11 structure
+			table_field = find_field_bits(space_type, 'is_table')
+			size_field = find_field_bits(space_type, 'is_table_size')
+
+		object_field = find_field_bits(entry_type, 'ie_object')
+		bits_field = find_field_bits(entry_type, 'ie_bits')
+		request_field = find_field_bits(entry_type, 'ie_request')
+
+		spaces = read_structs(list(self.spaces), max(sum(table_field), sum(size_field)) // 8)
+		tables: Dict[int, Tuple[int, int]] = {}
+		for space, data in spaces.items():
+			table = unpack_field(data, 0, table_field)
+			if table:
+				tables[space] = (table, unpack_field(data, 0, size_field))
+
+		if size_field[0] == -1:
+			# macOS 12 structure keeps the table size in its first entry
+			ie_size_field = find_field_bits(entry_type, 'ie_size')
+			first_entries = read_structs([table for table, _ in tables.values()], entry_size)
+			tables = {
+				space: (table, unpack_field(first_entries.get(table, b''), 0, ie_size_field))
+				for space, (table, _) in tables.items()
+			}
+
+		table_entries: Dict[int, List[IPCEntry]] = {}
+		for space, (table, num_entries) in tables.items():
+			try:
+				data = read_mem(table, num_entries * entry_size)
+			except LLDBMemoryException:
+				continue
+
+			entries: List[IPCEntry] = []
+			for idx in range(1, len(data) // entry_size):
+				base = idx * entry_size
+				ie_bits = unpack_field(data, base, bits_field)
+				if not ie_bits & IE_BITS_TYPE_MASK:
+					# entry is freed
+					continue
+
+				entries.append(IPCEntry(
+					idx,
+					get_ipc_port_name(ie_bits, idx),
+					unpack_field(data, base, object_field),
+					ie_bits,
+					unpack_field(data, base, request_field)
+				))
+			table_entries[space] = entries
+
+		for proc in process_table.procs:
+			space = self.proc_spaces.get(proc.address, 0)
+			entries = table_entries.get(space, [])
+			self.entries[proc.address] = entries
+			if self.spaces.get(space) != proc:
+				# tasks sharing a space (ipc_space_kernel) are listed once as holders
+				continue
+
+			for entry in entries:
+				if entry.object:
+					self.holders.setdefault(entry.object, []).append((proc, entry))
+
+	def load_ports(self: Self):
+		port_type = get_type('struct ipc_port')
+		io_bits_field = find_field_bits(port_type, 'ip_object.io_bits')
+		receiver_field = find_first_field_bits(port_type, 'ip_receiver', 'data.receiver')
+		receiver_name_field = find_first_field_bits(port_type, 'ip_messages.imq_receiver_name', 'ip_receiver_name')
+		kobject_field = find_first_field_bits(port_type, 'ip_kobject', 'kdata.kobject')
+		msgcount_field = find_field_bits(port_type, 'ip_messages.imq_msgcount')
+		requests_field = find_field_bits(port_type, 'ip_requests')
+		flag_fields = (
+			# No-senders notification requested
+			('n', find_first_field_bits(port_type, 'ip_kobject_nsrequest', 'ip_nsrequest')),
+			# port-destroy notification requested
+			('x', find_field_bits(port_type, 'ip_pdrequest')),
+			# Immovable receive rights
+			('i', find_field_bits(port_type, 'ip_immovable_receive')),
+			# Immovable send rights
+			('m', find_field_bits(port_type, 'ip_immovable_send')),
+			# No-grant Port
+			('g', find_field_bits(port_type, 'ip_no_grant')),
+		)
+
+		port_addrs = [port for port, holders in self.holders.items() if holders[0][1].is_port]
+		for port, data in read_structs(port_addrs, port_type.GetByteSize()).items():
+			io_bits = unpack_field(data, 0, io_bits_field)
+			flags = ''.join(flag for flag, field in flag_fields if unpack_field(data, 0, field))
+			if io_bits & IO_BITS_FILTER_MSG:
+				# Port with SB filtering on
+				flags += 'f'
+
+			self.ports[port] = IPCPort(
+				port,
+				io_bits,
+				unpack_field(data, 0, receiver_field),
+				unpack_field(data, 0, receiver_name_field),
+				unpack_field(data, 0, kobject_field),
+				unpack_field(data, 0, msgcount_field),
+				unpack_field(data, 0, requests_field),
+				flags
+			)
+
+		# notify.port of entries with a port request
+		request_type = get_type('struct ipc_port_request')
+		request_size = request_type.GetByteSize()
+		notify_field = find_field_bits(request_type, 'notify.port')
+		request_addrs: Dict[Tuple[int, int], int] = {}
+		for port, holders in self.holders.items():
+			portval = self.ports.get(port)
+			if portval == None or not portval.requests:
+				continue
+			for _, entry in holders:
+				if entry.request:
+					request_addrs[(port, entry.request)] = portval.requests + entry.request * request_size
+
+		requests = read_structs(list(request_addrs.values()), request_size)
+		for key, request_addr in request_addrs.items():
+			self.notify_requests[key] = unpack_field(requests.get(request_addr, b''), 0, notify_field)
+
+		# IOKit class names from the first virtual function of each kobject,
+		# only a handful of distinct classes need a symbol lookup
+		iokit_kobjects = [
+			port.kobject for port in self.ports.values()
+			if port.is_kobject and port.kobject and get_kotype_name(port.io_bits) in ('IOKIT_OBJECT', 'IOKIT_OBJ')
+		]
+		pointer_size = get_pointer_size()
+		vtables = {kobject: int.from_bytes(data, byteorder='little') for kobject, data in read_structs(iokit_kobjects, pointer_size).items()}
+		vfuncs = read_structs([vtable + 2 * pointer_size for vtable in vtables.values() if vtable], pointer_size)
+		for kobject, vtable in vtables.items():
+			vfunc = vfuncs.get(vtable + 2 * pointer_size)
+			self.iokit_classes[kobject] = get_iokit_class_from_vfunc(int.from_bytes(vfunc, byteorder='little')) if vfunc else '<unknow>'
+
+	def entry_rights(self: Self, entry: IPCEntry) -> str:
+		'''
+			Rights string of an entry with notification and port flags
+
+			types of rights:
+				'Dead'  : Dead name
+				'Set'   : Port set
+				'S'     : Send right
+				'R'     : Receive right
+				'O'     : Send-once right
+				'm'     : Immovable send port
+				'i'     : Immovable receive port
+				'g'     : No grant port
+				'f'     : Port with sandbox filtering
+			types of notifications:
+				'd'     : Dead-Name notification requested
+				's'     : Send-Possible notification armed
+				'r'     : Send-Possible notification requested
+				'n'     : No-Senders notification requested
+				'x'     : Port-destroy notification requested
+		'''
+		rights = entry.rights
+		port = self.ports.get(entry.object) if entry.is_port else None
+		if port == None:
+			return rights
+
+		soright_ptr = self.notify_requests.get((port.address, entry.request), 0)
+		if soright_ptr:
+			# dead-name notification requested
+			rights += 'd'
+			# send-possible armed
+			if soright_ptr & 0x1:
+				rights += 's'
+			# send-possible requested
+			if soright_ptr & 0x2:
+				rights += 'r'
+
+		return rights + port.flags
+
+	def receiver_of(self: Self, port: int) -> Optional[ProcInfo]:
+		portval = self.ports.get(port)
+		if portval == None or not portval.is_active:
 			return None
 
-		# # now show the port destination part
-		ipc_entry_info['destname'] = get_port_destination_summary(ie_object.cast_to('ipc_port_t'))
+		return self.spaces.get(portval.receiver)
 
-		# Get the number of sets to which this port belongs
-		# ip_waitq = portval.get('ip_waitq')
-		# set_str = get_waitq_sets(ip_waitq)
-		# ipc_entry_info['nsets'] = len(set_str)
-		ipc_entry_info['nmsgs'] = portval.get('ip_messages.imq_msgcount').int_value
+	def holders_of(self: Self, port: int, right_type: int = IE_BITS_TYPE_MASK) -> List[Tuple[ProcInfo, IPCEntry]]:
+		'''
+			Procs naming the port with any of the MACH_PORT_TYPE_* bits of right_type
+		'''
+		return [(proc, entry) for proc, entry in self.holders.get(port, []) if entry.bits & right_type]
 
-	if rights_filter == '' or rights_filter == ipc_entry_info['right']:
-		return ipc_entry_info
-	
-	return ipc_entry_info
+	def destination(self: Self, port: int) -> Tuple[str, str]:
+		'''
+			(destname, destination) columns, see get_port_destination_summary()
+		'''
+		portval = self.ports.get(port)
+		if portval == None:
+			return "{0: <#020x}".format(port), ''
+
+		if portval.is_kobject:
+			objtype_str = get_kotype_name(portval.io_bits)
+			destname = "{0: <#020x}".format(portval.kobject)
+			if portval.kobject in self.iokit_classes:
+				return destname, "kobject({:s}:{:s})".format(objtype_str, self.iokit_classes[portval.kobject])
+
+			desc_str = "kobject({0:s})".format(objtype_str)
+			if objtype_str[:5] == 'TASK_':
+				process_table = get_process_table()
+				proc = process_table.by_task.get(portval.kobject) if process_table != None else None
+				if proc != None:
+					desc_str += " " + proc.name
+			if objtype_str != 'TIMER':
+				return destname, desc_str
+
+		if not portval.is_active:
+			return "{0: <#020x}".format(port), "inactive-port"
+
+		proc = self.spaces.get(portval.receiver)
+		destination = "{0:s}({1:d})".format(proc.name, proc.pid) if proc != None else 'task()'
+		return "{0: <#020x}".format(portval.receiver_name), destination
+
+IPC_INDEX: Optional[IPCIndex] = None
+
+def get_ipc_index() -> Optional[IPCIndex]:
+	'''
+		Return the port index of all tasks for the current stop
+	'''
+	global IPC_INDEX
 
-def print_ipc_information(ipc_space: ESBValue):
-	entry_table, num_entries = get_ipc_space_table(ipc_space)
-	if entry_table == None:
-		print('[!] Unable to retrieve entry_table')
+	if IPC_INDEX == None or IPC_INDEX.stop_id != get_stop_id():
+		process_table = get_process_table()
+		if process_table == None:
+			return None
+		IPC_INDEX = IPCIndex(process_table)
+
+	return IPC_INDEX
+
+def print_ipc_information(proc: ProcInfo, rights_filter: str = ''):
+	ipc_index = get_ipc_index()
+	if ipc_index == None:
+		return
+
+	space = ipc_index.proc_spaces.get(proc.address, 0)
+	if not space:
+		print('[!] Unable to retrieve ipc_space')
 		return
 
-	entry_table_address = entry_table.int_value
+	ipc_space = ESBValue.init_with_address(space, 'ipc_space_t')
+	entry_table, num_entries = get_ipc_space_table(ipc_space)
 	print("{0: <20s} {1: <20s} {2: <20s} {3: <8s} {4: <10s} {5: <18s} {6: >8s} {7: <8s}".format(
 		'ipc_space', 'is_task', 'is_table', 'flags', 'ports', 'table_next', 'low_mod', 'high_mod'
 	))
 
 	flags = ''
-	if entry_table_address:
+	if entry_table.int_value:
 		flags += 'A'
 	else:
 		flags += ' '
@@ -571,22 +1041,23 @@ def print_ipc_information(ipc_space: ESBValue):
 
 	print("{: <20s} {: <12s} {: <8s} {: <8s} {: <8s} {: <8s} {: <20s} {: <20s}".format(
 		"object", "name", "rights", "urefs", "nsets", "nmsgs", "destname", "destination"))
-	
-	for idx in range(1, num_entries):
-		ipc_entry = ESBValue.init_with_address(entry_table_address + idx * size_of('struct ipc_entry'), 'ipc_entry_t')
-		ipc_entry_info = get_ipc_entry_summary(ipc_entry)
-		if ipc_entry_info == None:
+
+	for entry in ipc_index.entries.get(proc.address, []):
+		rights = ipc_index.entry_rights(entry)
+		if rights_filter != '' and rights_filter != rights:
 			continue
-		
+
+		port = ipc_index.ports.get(entry.object) if entry.is_port else None
+		destname, destination = ipc_index.destination(entry.object) if port != None else ('', '')
 		print("{: <#020x} {: <12s} {: <8s} {: <8d} {: <8d} {: <8d} {: <20s} {: <20s}".format(
-			ipc_entry_info['object'],
-			str(hex(get_ipc_port_name(ipc_entry.get('ie_bits').int_value, idx))),
-			ipc_entry_info['right'],
-			ipc_entry_info['urefs'],
-			ipc_entry_info['nsets'],
-			ipc_entry_info['nmsgs'],
-			ipc_entry_info['destname'],
-			ipc_entry_info['destination']
+			entry.object,
+			hex(entry.name),
+			rights,
+			entry.urefs,
+			0,
+			port.msgcount if port != None else 0,
+			destname,
+			destination
 		))
 
 
@@ -743,6 +1214,45 @@ class ZoneMetaOld(object):
 				next_addr = cur.int_value ^ self.zp_nopoison_cookie
 				cur = ESBValue.init_with_address(next_addr, 'vm_offset_t *')
 
+	def getFreeSet(self: Self) -> Set[int]:
+		'''
+			Decode the whole freelist of the page once
+		'''
+		free_elems: Set[int] = set()
+		cur = self.getFreeList().int_value
+		while cur and cur not in free_elems:
+			free_elems.add(cur)
+			try:
+				cur = read_u64(cur) ^ self.zp_nopoison_cookie
+			except LLDBMemoryException:
+				break
+
+		return free_elems
+
+	def classifyElements(self: Self) -> Iterator[Tuple[int, bool]]:
+		'''
+			Yield (element address, is free) of all elements in the page
+		'''
+		free_elems = self.getFreeSet()
+		for elem in self.iterateElements():
+			yield elem, elem in free_elems
+
+	def getElementBits(self: Self) -> Tuple[int, int, int, int]:
+		'''
+			Return (first element, element size, element count, free bits) of the page
+		'''
+		elems = list(self.iterateElements())
+		if not elems:
+			return self.page_addr, 0, 0, 0
+
+		free_elems = self.getFreeSet()
+		esize = elems[1] - elems[0] if len(elems) > 1 else 0
+		free_bits = 0
+		for i, elem in enumerate(elems):
+			if elem in free_elems:
+				free_bits |= 1 << i
+		return elems[0], esize, len(elems), free_bits
+
 	def iterateElements(self: Self) -> Iterator[int]:
 		if self.meta is None:
 			return
@@ -901,30 +1411,41 @@ class ZoneMetaNew(object):
 		if not self.meta or self.zone.get('z_permanent').int_value or not self.meta.get('zm_chunk_len').int_value:
 			return self.getAllocAvail() - self.getAllocCount()
 
-		n = 0
+		return bin(self.getFreeBits()).count('1')
+
+	def getFreeBits(self: Self) -> int:
+		'''
+			Read the inline or external bitmap of the chunk at once, bit i is set
+			when element i is free. Return -1 (all bits set) for chunks without
+			bitmap, as isElementFree does.
+		'''
+		if self.zone.is_null:
+			return 0
+
+		if self.meta.is_null or self.zone.get('z_permanent').int_value or not self.meta.get('zm_chunk_len').int_value:
+			return -1
+
 		if self.meta.get('zm_inline_bitmap').is_not_null:
-			for i in range(0, self.getInlineBitmapChunkLength()):
-				m = ESBValue.init_with_address(self.meta_addr + i * 16, 'struct zone_page_metadata *');
-				bits = m.get('zm_bitmap').int_value
-				while bits:
-					n += 1
-					bits &= bits - 1
-		else:
-			bitmap = ESBValue.init_with_address(self.getBitmap(), 'uint64_t *')
-			for i in range(0, 1 << (self.meta.get('zm_bitmap').int_value & 0x7)):
-				bits = bitmap[i].int_value
-				while bits:
-					n += 1
-					bits &= bits - 1
-		
-		return n
+			# one 32 bits zm_bitmap per page metadata of the chunk
+			chunk_len = self.getInlineBitmapChunkLength()
+			meta_size = size_of('struct zone_page_metadata')
+			bitmap_offset = find_field_offset(get_type('struct zone_page_metadata'), 'zm_bitmap')
+			data = read_mem(self.meta_addr, chunk_len * meta_size)
+			bits = 0
+			for i in range(len(data) // meta_size):
+				word_offset = i * meta_size + bitmap_offset
+				bits |= int.from_bytes(data[word_offset:word_offset + 4], byteorder='little') << (32 * i)
+			return bits
+
+		bitmap_size = 8 << (self.meta.get('zm_bitmap').int_value & 0x7)
+		return int.from_bytes(read_mem(self.getBitmap(), bitmap_size), byteorder='little')
 
 	def isElementFree(self: Self, addr: int) -> bool:
 		meta = self.meta
 		if self.zone.is_null:
 			return False
 
-		if meta.is_not_null or self.zone.get('z_permanent').int_value or not meta.get('zm_chunk_len').int_value:
+		if meta.is_null or self.zone.get('z_permanent').int_value or not meta.get('zm_chunk_len').int_value:
 			return True
 		
 		start = self.page_addr
@@ -932,7 +1453,7 @@ class ZoneMetaNew(object):
 		eidx  = (addr - start) // esize
 		if meta.get('zm_inline_bitmap').is_not_null:
 			idx = (eidx // 32)
-			meta = ESBValue.init_with_address(meta.int_value + idx, 'struct zone_page_metadata *')
+			meta = ESBValue.init_with_address(self.meta_addr + idx * size_of('struct zone_page_metadata'), 'struct zone_page_metadata *')
 			bits = meta.get('zm_bitmap').int_value
 			return bits & (1 << (eidx % 32)) != 0
 		else:
@@ -943,6 +1464,33 @@ class ZoneMetaNew(object):
 	def isInFreeList(self: Self, addr: int) -> bool:
 		return self.isElementFree(addr)
 
+	def classifyElements(self: Self) -> Iterator[Tuple[int, bool]]:
+		'''
+			Yield (element address, is free) of all elements in the chunk,
+			statuses come from one read of the bitmap
+		'''
+		start, esize, count, free_bits = self.getElementBits()
+		# bit i of the bitmap becomes character i
+		flags = format(free_bits, 'b')[::-1].ljust(count, '0')
+		for i in range(count):
+			yield start + i * esize, flags[i] == '1'
+
+	def getElementBits(self: Self) -> Tuple[int, int, int, int]:
+		'''
+			Return (first element, element size, element count, free bits) of the chunk
+		'''
+		if self.meta.is_null or self.zone.is_null:
+			return self.page_addr, 0, 0, 0
+
+		esize = self.zone.get('z_elem_size').int_value
+		if not esize:
+			return self.page_addr, 0, 0, 0
+
+		count = self.pagesize * self.meta.get('zm_chunk_len').int_value // esize
+		mask = (1 << count) - 1
+		bits = self.getFreeBits()
+		return self.page_addr, esize, count, mask if bits == -1 else bits & mask
+
 	def iterateElements(self: Self) -> Iterator[int]:
 		if self.meta.is_null or self.zone.is_null:
 			return
@@ -955,47 +1503,154 @@ class ZoneMetaNew(object):
 		for offs in range(start, end, esize):
 			yield self.page_addr + offs
 
+@kernel_lru_cache(maxsize=0x4000)
+def symbolize_pc(pc: int) -> str:
+	sb_addr = get_target().ResolveLoadAddress(pc)
+	return str(sb_addr) if sb_addr else ''
+
+def format_btlog_backtrace(pcs: Tuple[int, ...]) -> str:
+	out_str = ''
+	for frame_pc in pcs:
+		out_str += "{0: <#0X} <{1: <s}>\n".format(frame_pc, symbolize_pc(frame_pc))
+	return out_str
+
+class BTLogIndex(object):
+	'''
+		btlog of a logged zone parsed at once: element -> record indexes in
+		element_hash_queue order, record index -> (operation, backtrace)
+	'''
+
+	def __init__(self: Self, btlog_addr: int):
+		self.btlog_addr = btlog_addr
+		self.stop_id = get_stop_id()
+		self.elements: Dict[int, List[int]] = {}
+		self.records: Dict[int, Tuple[int, Tuple[int, ...]]] = {}
+
+		btlog = ESBValue.init_with_address(btlog_addr, 'btlog_t *')
+		record_size = btlog.get('btrecord_size').int_value
+		btrecords = btlog.get('btrecords').int_value
+		depth = btlog.get('btrecord_btdepth').int_value
+		hashelem = btlog.get('elem_linkage_un').get('element_hash_queue').get('tqh_first').int_value
+
+		element_type = get_type('btlog_element_t')
+		element_size = element_type.GetByteSize()
+		elem_field = find_field_bits(element_type, 'elem')
+		recindex_field = find_field_bits(element_type, 'recindex')
+		next_field = find_field_bits(element_type, 'element_hash_link.tqe_next')
+
+		visited: Set[int] = set()
+		while hashelem and hashelem not in visited:
+			visited.add(hashelem)
+			data = read_mem(hashelem, element_size)
+			if len(data) != element_size:
+				break
+
+			elem = unpack_field(data, 0, elem_field)
+			self.elements.setdefault(elem, []).append(unpack_field(data, 0, recindex_field))
+			hashelem = unpack_field(data, 0, next_field)
+
+		if not self.elements:
+			return
+
+		# decode all referenced records from one read of the record buffer
+		record_type = get_type('btlog_record_t')
+		operation_field = find_field_bits(record_type, 'operation')
+		bt_offset = find_field_bits(record_type, 'bt')[0] // 8
+		pointer_size = get_pointer_size()
+		max_recindex = max(max(recindexes) for recindexes in self.elements.values())
+		buffer = read_mem(btrecords, (max_recindex + 1) * record_size)
+
+		for recindexes in self.elements.values():
+			for recindex in recindexes:
+				if recindex in self.records:
+					continue
+
+				base = recindex * record_size
+				pc_data = buffer[base + bt_offset:base + bt_offset + depth * pointer_size]
+				pcs = []
+				for i in range(0, len(pc_data) - pointer_size + 1, pointer_size):
+					frame_pc = int.from_bytes(pc_data[i:i + pointer_size], byteorder='little')
+					if not frame_pc:
+						break
+					pcs.append(frame_pc)
+				self.records[recindex] = (unpack_field(buffer, base, operation_field), tuple(pcs))
+
 gkalloc_heap_names: List[str] = []
 
+ZONE_PAGEQ_NEW = ('z_pageq_full', 'z_pageq_partial', 'z_pageq_empty', 'z_pageq_va')
+ZONE_PAGEQ_OLD = ('pages_any_free_foreign', 'pages_all_used_foreign', 'pages_intermediate', 'pages_all_used')
+
+@dataclass(frozen=True)
+class ZoneInfo:
+	idx: int
+	name: str
+	address: int
+	elem_size: int
+
+@dataclass(frozen=True)
+class ZoneState:
+	# packed page indexes of the page queue heads, ZONE_PAGEQ_NEW or ZONE_PAGEQ_OLD order
+	pageq_heads: Tuple[int, ...]
+	btlog: int
+
+	@property
+	def is_logging(self: Self) -> bool:
+		return self.btlog != 0
+
 class XNUZones:
-	zones_access_cache: Dict[str, ESBValue]
-	logged_zones: Dict[str, ESBValue]
+	zone_table: List[ZoneInfo]
+	zone_states: List[ZoneState]
+	zone_ids: Dict[str, int]
 	pointer_size: int
 	is_zone_meta_old: bool
 
 	def __init__(self):
 		# get all zones symbols
-		self.kalloc_heap_names = []
-		self.zones_access_cache = {}
-		self.logged_zones = {}
-		self.zone_index_array = []
+		self.zone_table = []
+		self.zone_states = []
+		self.zone_ids = {}
+		self.zone_values: Dict[int, ESBValue] = {}
+		self.zone_values_stop_id = -1
+		self.states_stop_id = -1
 		self.pointer_size = 8
 		# self.zone_security_array = None
 		self.zone_struct_size = 0
 		self.zone_array_address = 0
+		self.zone_array: Optional[ESBValue] = None
 		self.is_zone_meta_old = False
-	
+		self.btlog_indexes: Dict[int, BTLogIndex] = {}
+		# (process unique id, kernel load address) the zone table was read from
+		self.load_key: Tuple[int, int] = (-1, -1)
+
+	def get_load_key(self: Self) -> Tuple[int, int]:
+		return get_kernel_load_key()
+
 	@property
 	def is_loaded(self: Self) -> bool:
-		return False if not len(self.kalloc_heap_names) else True
+		# a reboot changes the kernel slide, a re-attach the process, both invalidate the table
+		return len(self.zone_table) != 0 and self.load_key == self.get_load_key()
 
 	def load_from_kernel(self: Self, target: SBTarget) -> bool:
+		'''
+			Read zone_array and zone_security_array with one transfer each and
+			build the zone table, names are read in batch
+		'''
 		global gkalloc_heap_names
 
 		self.pointer_size = get_pointer_size()
 		self.target = target
 
 		try:
-			self.zone_security_array = ESBValue('zone_security_array')
-			self.zone_struct_size = size_of('zone')
+			zone_security_array = ESBValue('zone_security_array')
+			zone_type = get_type('struct zone')
 			zone_array = ESBValue('zone_array')
-			num_zones = ESBValue('num_zones')
-		except ESBValueException:
+			num_zones = ESBValue('num_zones').int_value
+		except (ESBValueException, NameError):
 			print(f'[!] Unable to find zone_array/num_zones/zone_security_array/zone symbol in this kernel')
 			return False
-		
-		num_zones = num_zones.int_value
-		
+
+		self.zone_array = zone_array
+		self.zone_struct_size = zone_type.GetByteSize()
 		self.zone_array_address = zone_array.addr_of() # save zone_array base address for later used
 		if len(gkalloc_heap_names) < 4:
 			kalloc_heap_names = ESBValue('kalloc_heap_names')
@@ -1003,102 +1658,147 @@ class XNUZones:
 				kalloc_heap_name = kalloc_heap_names[i].cast_to('char *')
 				gkalloc_heap_names.append(kalloc_heap_name.str_value)
 
-		for idx in range(num_zones):
-			zone_name = self._extract_zone_name(zone_array[idx])
-			zone = zone_array[idx]
-			zone.set_attribute('zone_name', zone_name)
-			zone.set_attribute('zone_idx', idx)
-
-			self.zones_access_cache[zone_name] = zone
-			self.zone_index_array.append(zone_name)
-
-			if self.is_zone_logging(zone):
-				# cache logged zone for lookup
-				self.logged_zones[zone_name] = zone
-		
 		try:
 			_ = ESBValue('zp_nopoison_cookie')
 			self.is_zone_meta_old = True
 		except ESBValueException:
 			self.is_zone_meta_old = False
-		
-		return True
-	
-	def is_zone_logging(self: Self, zone: ESBValue) -> bool:
-		return not zone.get('zlog_btlog').is_null
-	
-	def _extract_zone_name(self: Self, zone: ESBValue) -> str:
-		z_name = zone.get('z_name').str_value
-			
-		if zone.get('kalloc_heap').is_valid:
-			heap_name_idx = zone.get('kalloc_heap').int_value
-		else:
+
+		data = read_mem(self.zone_array_address, num_zones * self.zone_struct_size)
+		if len(data) != num_zones * self.zone_struct_size:
+			print(f'[!] Unable to read zone_array at 0x{self.zone_array_address:x}')
+			return False
+
+		name_field = find_field_bits(zone_type, 'z_name')
+		elem_size_field = find_field_bits(zone_type, 'z_elem_size')
+		kheap_field = find_field_bits(zone_type, 'kalloc_heap')
+
+		if kheap_field[0] == -1:
 			# macOS 12 will change how we retrieve kalloc heap name checkout zone_heap_name
-			zone_idx = (zone.addr_of() - self.zone_array_address) // self.zone_struct_size
-			heap_name_idx = self.zone_security_array[zone_idx].get('z_kheap_id').int_value
+			security_type = zone_security_array.sb_value.GetType().GetArrayElementType()
+			security_size = security_type.GetByteSize()
+			security_data = read_mem(zone_security_array.addr_of(), num_zones * security_size)
+			security_kheap_field = find_field_bits(security_type, 'z_kheap_id')
+			heap_ids = [unpack_field(security_data, idx * security_size, security_kheap_field) for idx in range(num_zones)]
+		else:
+			heap_ids = [unpack_field(data, idx * self.zone_struct_size, kheap_field) for idx in range(num_zones)]
+
+		name_addrs = [unpack_field(data, idx * self.zone_struct_size, name_field) for idx in range(num_zones)]
+		names = read_cstrings(name_addrs)
+
+		self.zone_table = []
+		self.zone_ids = {}
+		self.btlog_indexes = {}
+		self.load_key = self.get_load_key()
+		for idx in range(num_zones):
+			zone_name = names.get(name_addrs[idx], '')
+			if heap_ids[idx] < 4:
+				zone_name = gkalloc_heap_names[heap_ids[idx]] + zone_name
+
+			zone_offset = idx * self.zone_struct_size
+			self.zone_table.append(ZoneInfo(idx, zone_name, self.zone_array_address + zone_offset,
+									unpack_field(data, zone_offset, elem_size_field)))
+			self.zone_ids.setdefault(zone_name, idx)
+
+		self.update_states(data)
+		return True
+
+	def update_states(self: Self, data: bytes = b''):
+		'''
+			Refresh the mutable part of zones (page queues, logging) from one read of zone_array
+		'''
+		size = len(self.zone_table) * self.zone_struct_size
+		if not data:
+			data = read_mem(self.zone_array_address, size)
+			if len(data) != size:
+				return
+
+		zone_type = get_type('struct zone')
+		pageq_fields = [find_field_bits(zone_type, name) for name in (ZONE_PAGEQ_OLD if self.is_zone_meta_old else ZONE_PAGEQ_NEW)]
+		btlog_field = find_field_bits(zone_type, 'zlog_btlog')
+
+		self.zone_states = []
+		for zone_info in self.zone_table:
+			zone_offset = zone_info.idx * self.zone_struct_size
+			# zone_pva_t is a struct of one packed_address
+			pageq_heads = tuple(unpack_field(data, zone_offset, field) for field in pageq_fields)
+			self.zone_states.append(ZoneState(pageq_heads, unpack_field(data, zone_offset, btlog_field)))
+
+		self.states_stop_id = get_stop_id()
+		self.zone_values = {}
+
+	def refresh(self: Self):
+		if self.is_loaded:
+			self.update_states()
+
+	def zone_state(self: Self, idx: int) -> ZoneState:
+		if self.states_stop_id != get_stop_id():
+			self.update_states()
+		return self.zone_states[idx]
+
+	def zone_value(self: Self, idx: int) -> ESBValue:
+		'''
+			ESBValue of zone_array[idx], rebuilt after the process resumed
+		'''
+		stop_id = get_stop_id()
+		if stop_id != self.zone_values_stop_id:
+			self.zone_values = {}
+			self.zone_values_stop_id = stop_id
 
-		if heap_name_idx < 4:
-			return gkalloc_heap_names[heap_name_idx] + z_name
+		zone = self.zone_values.get(idx)
+		if zone == None:
+			zone = self.zone_array[idx]
+			zone.set_attribute('zone_name', self.zone_table[idx].name)
+			zone.set_attribute('zone_idx', idx)
+			self.zone_values[idx] = zone
+		return zone
 
-		return z_name
+	def is_zone_logging(self: Self, zone: ESBValue) -> bool:
+		return self.zone_state(zone.get_attribute('zone_idx')).is_logging
 
 	def __len__(self: Self) -> int:
-		return len(self.zones_access_cache)
+		return len(self.zone_table)
 	
 	def __iter__(self: Self):
-		for zone_name in self.zones_access_cache:
-			yield self.zones_access_cache[zone_name]
+		for zone_info in self.zone_table:
+			yield self.zone_value(zone_info.idx)
 
 	def __getitem__(self: Self, idx: int) -> Optional[ESBValue]:
-		if idx >= len(self.zone_index_array):
+		if idx >= len(self.zone_table):
 			return None
 		
-		zone_name = self.zone_index_array[idx]
-		return self.zones_access_cache[zone_name]
+		return self.zone_value(idx)
 	
 	def has_zone_name(self: Self, zone_name: str) -> bool:
-		return False if zone_name not in self.zones_access_cache else True
+		return zone_name in self.zone_ids
 	
 	def iter_zone_name(self: Self):
-		for zone_name in self.zones_access_cache:
-			yield zone_name
+		for zone_info in self.zone_table:
+			yield zone_info.name
 	
 	def get_zone_by_name(self: Self, zone_name: str) -> Optional[ESBValue]:
-		if zone_name in self.zones_access_cache:
-			return self.zones_access_cache[zone_name]
+		if zone_name in self.zone_ids:
+			return self.zone_value(self.zone_ids[zone_name])
 		
 		return None
 	
 	def get_zone_id_by_name(self: Self, zone_name: str) -> int:
-		return self.zone_index_array.index(zone_name)
-	
-	def get_zones_by_regex(self: Self, zone_name_regex: str) -> list:
-		zones = []
-
-		if self.zones_access_cache:
-			for zone_name in self.zones_access_cache:
-				if re.match(zone_name_regex, zone_name):
-					zones.append(self.zones_access_cache[zone_name])
+		return self.zone_ids[zone_name]
 
-		return zones
+	def get_zones_by_regex(self: Self, zone_name_regex: str) -> list:
+		return [self.zone_value(zone_info.idx) for zone_info in self.zone_table if re.match(zone_name_regex, zone_info.name)]
 	
 	def show_zone_being_logged(self: Self):
-		if not self.logged_zones:
-			return
-		
-		for logged_zone_name in self.logged_zones:
-			zone = self.logged_zones[logged_zone_name]
-			zone_name = zone.get_attribute('zone_name')
-			logged_zone_idx = zone.get_attribute('zone_idx')
-			zlog_btlog = zone.get('zlog_btlog')
-			if not zlog_btlog.is_null:
-				print(f'- zone_array[{logged_zone_idx}]: {zone_name} log at {zlog_btlog.value}')
+		for zone_info in self.zone_table:
+			zlog_btlog = self.zone_state(zone_info.idx).btlog
+			if zlog_btlog:
+				print(f'- zone_array[{zone_info.idx}]: {zone_info.name} log at 0x{zlog_btlog:x}')
 	
 	def get_logged_zone_index_by_name(self: Self, zone_name: str) -> int:
-		try:
-			return typing.cast(int, self.logged_zones[zone_name].get_attribute('zone_idx'))
-		except KeyError:
+		idx = self.zone_ids.get(zone_name, -1)
+		if idx == -1 or not self.zone_state(idx).is_logging:
 			return -1
+		return idx
 	
 	def zone_find_stack_elem(self: Self, zone_name: str, target_element: int, action: int):
 		""" Zone corruption debugging: search the zone log and print out the stack traces for all log entries that
@@ -1130,149 +1830,139 @@ class XNUZones:
 			print(f'[!] Unable to track this zone {zone_name}, please add this zone into boot-args')
 			return
 		
-		btlog_ptr = zone.get('zlog_btlog').cast_to('btlog_t *')
-		
-		btrecord_size = btlog_ptr.get('btrecord_size').int_value
-		btrecords = btlog_ptr.get('btrecords').int_value
-		depth = btlog_ptr.get('btrecord_btdepth').int_value
-
-		prev_operation = -1
-		scan_items = 0
-
-		element_hash_queue = btlog_ptr.get('elem_linkage_un').get('element_hash_queue')
-		hashelem = element_hash_queue.get('tqh_first').cast_to('btlog_element_t *')
-
+		btlog = self.get_btlog_index(zone)
 		if (target_element >> 32) != 0:
 			target_element = target_element ^ 0xFFFFFFFFFFFFFFFF
 		else:
 			target_element = target_element ^ 0xFFFFFFFF
 
+		prev_operation = -1
+
 		'''
-			Loop through element_hash_queue linked list to find record information of our target_element
+			Records of target_element in element_hash_queue order
 		'''
-		while not hashelem.is_null:
-			hashelem_value = hashelem.get('elem').int_value
-			if hashelem_value == target_element:
-				# found record information of target_element
-
-				recindex = hashelem.get('recindex').int_value
-
-				recoffset = recindex * btrecord_size
-				record = ESBValue.init_with_address(btrecords + recoffset, 'btlog_record_t *')
-				# extract action for this chunk address and see if this chunk was freed or allocated
-				record_operation = record.get('operation').int_value
-
-				if action == 0:
-					out_str = ('-' * 8)
-					if record_operation == 1:
-						out_str += "OP: ALLOC. "
-					else:
-						out_str += "OP: FREE.  "
-
-					out_str += "Stack Index {0: <d} {1: <s}\n".format(recindex, ('-' * 8))
-
-					print(out_str)
-					print(self.get_btlog_backtrace(depth, record))
-					print(' \n')
-
-					if record_operation == prev_operation:
-						if prev_operation == 0:
-							print("{0: <s} DOUBLE FREE! {1: <s}".format(('*' * 8), ('*' * 8)))
-						else:
-							print("{0: <s} DOUBLE OP! {1: <s}".format(('*' * 8), ('*' * 8)))
-						return True
-
-				elif action == 1 and not record_operation:
-					# show free only
-					out_str = ('-' * 8)
+		for recindex in btlog.elements.get(target_element, []):
+			# extract action for this chunk address and see if this chunk was freed or allocated
+			record_operation, pcs = btlog.records[recindex]
+
+			if action == 0:
+				out_str = ('-' * 8)
+				if record_operation == 1:
+					out_str += "OP: ALLOC. "
+				else:
 					out_str += "OP: FREE.  "
-					out_str += "Stack Index {0: <d} {1: <s}\n".format(recindex, ('-' * 8))
-					print(out_str)
-					print(self.get_btlog_backtrace(depth, record))
-					print(' \n')
-				elif action == 2 and record_operation:
-					# show allocation only
-					out_str = ('-' * 8)
-					out_str += "OP: ALLOC.  "
-					out_str += "Stack Index {0: <d} {1: <s}\n".format(recindex, ('-' * 8))
-					print(out_str)
-					print(self.get_btlog_backtrace(depth, record))
-					print(' \n')
-				
-				prev_operation = record_operation
-				scan_items = 0
-
-			hashelem = hashelem.get('element_hash_link').get('tqe_next')
-			hashelem = hashelem.cast_to('btlog_element_t *')
-
-			scan_items += 1
-			if scan_items % 100 == 0:
-				print("Scanning is ongoing. {0: <d} items scanned since last check." .format(scan_items))
-	
-	def get_btlog_backtrace(self: Self, depth: int, zstack_record: ESBValue) -> str:
-		""" Helper routine for getting a BT Log record backtrace stack.
-			params:
-				depth:int - The depth of the zstack record
-				zstack_record:btlog_record_t * - A BTLog record
-			returns:
-				str - string with backtrace in it.
-		"""
 
-		out_str = ''
-		frame = 0
-		if not zstack_record:
-			return "Zstack record none!"
-		
-		zstack_record_bt = zstack_record.get('bt')
-		pc_array = read_mem(zstack_record_bt.addr_of(), depth * self.pointer_size)
+				out_str += "Stack Index {0: <d} {1: <s}\n".format(recindex, ('-' * 8))
 
-		while frame < depth:
-			frame_pc = unpack('<Q', pc_array[frame*self.pointer_size : (frame + 1) * self.pointer_size])[0]
-			if not frame_pc:
-				break
+				print(out_str)
+				print(format_btlog_backtrace(pcs))
+				print(' \n')
+
+				if record_operation == prev_operation:
+					if prev_operation == 0:
+						print("{0: <s} DOUBLE FREE! {1: <s}".format(('*' * 8), ('*' * 8)))
+					else:
+						print("{0: <s} DOUBLE OP! {1: <s}".format(('*' * 8), ('*' * 8)))
+					return True
+
+			elif action == 1 and not record_operation:
+				# show free only
+				out_str = ('-' * 8)
+				out_str += "OP: FREE.  "
+				out_str += "Stack Index {0: <d} {1: <s}\n".format(recindex, ('-' * 8))
+				print(out_str)
+				print(format_btlog_backtrace(pcs))
+				print(' \n')
+			elif action == 2 and record_operation:
+				# show allocation only
+				out_str = ('-' * 8)
+				out_str += "OP: ALLOC.  "
+				out_str += "Stack Index {0: <d} {1: <s}\n".format(recindex, ('-' * 8))
+				print(out_str)
+				print(format_btlog_backtrace(pcs))
+				print(' \n')
 			
-			sb_addr = get_target().ResolveLoadAddress(frame_pc)
-			if sb_addr:
-				symbol_str = str(sb_addr)
-			else:
-				symbol_str = ''
-			out_str += "{0: <#0X} <{1: <s}>\n".format(frame_pc, symbol_str)
-			frame += 1
+			prev_operation = record_operation
 
-		return out_str
+	def get_btlog_index(self: Self, zone: ESBValue) -> 'BTLogIndex':
+		'''
+			Parse the btlog of a logged zone once per stop
+		'''
+		btlog_addr = zone.get('zlog_btlog').int_value
+		btlog = self.btlog_indexes.get(btlog_addr)
+		if btlog == None or btlog.stop_id != get_stop_id():
+			start_time = time.time()
+			btlog = BTLogIndex(btlog_addr)
+			print(f'[+] Indexed {len(btlog.records)} btlog records of {len(btlog.elements)} elements ({time.time() - start_time:.2f}s)')
+			self.btlog_indexes[btlog_addr] = btlog
+		return btlog
 	
-	def zone_iterate_queue(self: Self, page: ESBValue):
-		cur_page_addr = page.get('packed_address')#.GetIntValue()
-		while not cur_page_addr.is_null:
+	def zone_iterate_queue(self: Self, packed_address: int):
+		while packed_address:
 			if self.is_zone_meta_old:
-				meta = ZoneMetaOld(self, cur_page_addr.int_value, isPageIndex=True)
+				meta = ZoneMetaOld(self, packed_address, isPageIndex=True)
 			else:
-				meta = ZoneMetaNew(self, cur_page_addr.int_value, isPageIndex=True)
+				meta = ZoneMetaNew(self, packed_address, isPageIndex=True)
 
 			yield meta
-			page = meta.meta.get('zm_page_next')
-			cur_page_addr = cur_page_addr.get('packed_address')
+			packed_address = meta.meta.get('zm_page_next').get('packed_address').int_value
 	
 	def iter_chunks_at_zone(self: Self, zone: ESBValue):
 		if zone.get('z_self').is_null or zone.get('permanent').int_value:
 			yield 'None', 0
 		
-		if self.is_zone_meta_old:
-			iteration_list = [zone.get('pages_any_free_foreign'), zone.get('pages_all_used_foreign'),
-					zone.get('pages_intermediate'), zone.get('pages_all_used')]
-		else:
-			iteration_list = [zone.get('z_pageq_full'), zone.get('z_pageq_partial'), zone.get('z_pageq_empty'), zone.get('z_pageq_va')]
-
-		for head in iteration_list:
+		for head in self.zone_state(zone.get_attribute('zone_idx')).pageq_heads:
 			for meta in self.zone_iterate_queue(head):
-				for elem in meta.iterateElements():
-					status = 'Allocated'
-					if meta.isInFreeList(elem):
-						status = 'Freed'
-					
-					yield status, elem
+				for elem, is_free in meta.classifyElements():
+					yield 'Freed' if is_free else 'Allocated', elem
 	
+	def lookup_chunk(self: Self, chunk_addr: int) -> Optional[Tuple[ESBValue, int, str]]:
+		'''
+			Find (zone, element address, status) of chunk_addr from the zone
+			metadata of its page, without walking the zones.
+			Return None when the address is outside the zone map or its page
+			isn't owned by a zone, callers fall back to walking then.
+		'''
+		if self.is_zone_meta_old:
+			meta = ZoneMetaOld(self, chunk_addr).getReal()
+			if not meta.kind.startswith('Element') or meta.meta.is_null:
+				return None
+
+			zone = self[meta.meta.get('zm_index').int_value]
+			if not zone:
+				return None
+
+			esize = zone.get('z_elem_size').int_value
+			first_elem = meta.page_addr + meta.first_offset
+			if not esize or chunk_addr < first_elem:
+				return None
+
+			elem = first_elem + (chunk_addr - first_elem) // esize * esize
+			status = 'Freed' if meta.isInFreeList(elem) else 'Allocated'
+			return zone, elem, status
+
+		meta = ZoneMetaNew(self, chunk_addr)
+		if meta.kind != 'Element' or meta.meta.is_null:
+			return None
+
+		meta = meta.getReal()
+		if meta.zone.is_null or not meta.zone.get('z_elem_size').int_value:
+			return None
+
+		elem = meta.getElementAddress(chunk_addr)
+		if elem + meta.zone.get('z_elem_size').int_value > meta.page_addr + meta.pagesize * meta.meta.get('zm_chunk_len').int_value:
+			# tail of the chunk that doesn't fit an element
+			return None
+
+		status = 'Freed' if meta.isElementFree(elem) else 'Allocated'
+		return meta.zone, elem, status
+
 	def get_chunk_info_at_zone(self: Self, zone: ESBValue, chunk_addr: int) -> str:
+		chunk = self.lookup_chunk(chunk_addr)
+		if chunk != None:
+			chunk_zone, _, status = chunk
+			return status if chunk_zone.get_attribute('zone_idx') == zone.get_attribute('zone_idx') else 'None'
+
 		for status, elem in self.iter_chunks_at_zone(zone):
 			if status == 'None':
 				break
@@ -1286,22 +1976,32 @@ class XNUZones:
 		if not self.has_zone_name(zone_name):
 			return 'None'
 		
-		zone = self.zones_access_cache[zone_name]
+		zone = self.get_zone_by_name(zone_name)
 		return self.get_chunk_info_at_zone(zone, chunk_addr)
 	
 	def find_chunk_info(self: Self, chunk_addr: int):
 		'''
-			Walk through the hold zone in zone_array, this method could take time
+			Find the zone of chunk_addr from its page metadata, only addresses
+			the metadata can't resolve walk through the hold zone in zone_array
 		'''
-
-		for zone_name in self.zones_access_cache:
-			zone = self.zones_access_cache[zone_name]
-			ret = self.get_chunk_info_at_zone_name(zone_name, chunk_addr)
+		chunk = self.lookup_chunk(chunk_addr)
+		if chunk != None:
+			zone, elem, status = chunk
+			return {
+				'zone_name': zone.get_attribute('zone_name'),
+				'zone_idx': zone.get_attribute('zone_idx'),
+				'status': status,
+				'element': elem
+			}
+
+		for zone in self:
+			ret = self.get_chunk_info_at_zone(zone, chunk_addr)
 			if ret != 'None':
 				info = {
 					'zone_name':zone.get_attribute('zone_name'),
 					'zone_idx': zone.get_attribute('zone_idx'),
-					'status': ret 
+					'status': ret,
+					'element': chunk_addr
 				}
 				return info
 		
@@ -1362,101 +2062,377 @@ class XNUZones:
 		
 		return elems
 
+@dataclass
+class ZoneCensus:
+	name: str
+	stop_id: int
+	# zone index -> first element of chunk -> (element size, element count, allocated bits)
+	chunks: Dict[int, Dict[int, Tuple[int, int, int]]]
+	elapsed: float = 0
+
+	def counts(self: Self, zone_idx: int) -> Tuple[int, int]:
+		'''
+			Return (allocated, free) element counts of a zone
+		'''
+		allocated = 0
+		total = 0
+		for _, count, alloc_bits in self.chunks.get(zone_idx, {}).values():
+			allocated += bin(alloc_bits).count('1')
+			total += count
+		return allocated, total - allocated
+
+def zone_census_chunks(zones: XNUZones, zone_idx: int) -> Dict[int, Tuple[int, int, int]]:
+	'''
+		Classify every element of a zone with one bitmap read per chunk
+	'''
+	chunks: Dict[int, Tuple[int, int, int]] = {}
+	for head in zones.zone_state(zone_idx).pageq_heads:
+		for meta in zones.zone_iterate_queue(head):
+			start, esize, count, free_bits = meta.getElementBits()
+			if count:
+				chunks[start] = (esize, count, ~free_bits & ((1 << count) - 1))
+	return chunks
+
+def take_zone_census(zones: XNUZones, name: str, zone_idxs: List[int]) -> ZoneCensus:
+	'''
+		Record allocated elements of zone_idxs
+	'''
+	start_time = time.time()
+	census = ZoneCensus(name, get_stop_id(), {})
+	census.chunks = {idx: zone_census_chunks(zones, idx) for idx in zone_idxs}
+	census.elapsed = time.time() - start_time
+	return census
+
+def elements_from_bits(start: int, esize: int, bits: int) -> Iterator[int]:
+	while bits:
+		low_bit = bits & -bits
+		yield start + (low_bit.bit_length() - 1) * esize
+		bits ^= low_bit
+
+def diff_zone_census(old: ZoneCensus, new: ZoneCensus) -> Dict[int, Tuple[List[int], List[int]]]:
+	'''
+		Return zone index -> (newly allocated elements, newly freed elements)
+		for zones recorded in both censuses
+	'''
+	diffs: Dict[int, Tuple[List[int], List[int]]] = {}
+	for zone_idx in old.chunks.keys() & new.chunks.keys():
+		old_chunks = old.chunks[zone_idx]
+		new_chunks = new.chunks[zone_idx]
+		allocated: List[int] = []
+		freed: List[int] = []
+		for start in old_chunks.keys() | new_chunks.keys():
+			esize, _, old_bits = old_chunks.get(start, (0, 0, 0))
+			new_esize, _, new_bits = new_chunks.get(start, (esize, 0, 0))
+			esize = esize or new_esize
+			allocated.extend(elements_from_bits(start, esize, new_bits & ~old_bits))
+			freed.extend(elements_from_bits(start, esize, old_bits & ~new_bits))
+
+		if allocated or freed:
+			diffs[zone_idx] = (sorted(allocated), sorted(freed))
+	return diffs
+
 # --- IOKit stuffs --- #
 IOKIT_OBJECTS = (
 	'OSArray', 'OSDictionary', 'OSData', 'OSString', 'OSSymbol',
 	'OSBoolean', 'OSOrderedSet', 'OSNumber', 'OSSet'
 )
 
-def iokit_get_type(object_address: int) -> str:
-	vtable = read_u64(object_address)
+# members read by IOKitDecoder for each class
+IOKIT_OBJECT_FIELDS = {
+	'OSArray': ('count', 'array'),
+	'OSOrderedSet': ('count', 'array'),
+	'OSDictionary': ('count', 'dictionary'),
+	'OSSet': ('members',),
+	'OSData': ('length', 'data'),
+	'OSString': ('length', 'string'),
+	'OSSymbol': ('length', 'string'),
+	'OSNumber': ('value', 'size'),
+	'OSBoolean': ('value',),
+}
+
+@kernel_lru_cache(maxsize=0x1000)
+def iokit_class_from_vtable(vtable: int) -> str:
+	'''
+		Class name from the "vtable for X" symbol, empty when vtable isn't one
+	'''
 	if not vtable:
 		return ''
 
-	sym_name = resolve_symbol_name(vtable)
-	m = re.match(r'vtable for (\w*)', sym_name)
+	m = re.match(r'vtable for (\w*)', resolve_symbol_name(strip_kernel_or_userPAC(vtable)))
 	if not m:
 		return ''
-	
-	if m[1] not in IOKIT_OBJECTS:
-		return ''
 
 	return m[1]
 
-def iokit_print(object_address : int, level = 0):
-	iokit_type = iokit_get_type(object_address)
-	if not iokit_type:
-		print(f'[!] Unable to detect iokit object at address {hex(object_address)}')
-		return
+def iokit_get_type(object_address: int) -> str:
+	iokit_type = iokit_class_from_vtable(read_u64(object_address))
+	if iokit_type not in IOKIT_OBJECTS:
+		return ''
 
-	# cast this address to sepecific IOKit class
-	iokit_object = ESBValue.init_with_address(object_address, iokit_type + ' *')
+	return iokit_type
 
-	if level == 0:
-		print(f'({iokit_type} *){hex(object_address)} : ', end='')
+class IOKitObject(object):
+	'''
+		Decoded libkern object. value is
+			OSDictionary            -> Dict[str, IOKitObject]
+			OSArray/OSOrderedSet    -> List[IOKitObject]
+			OSSet                   -> List[IOKitObject]
+			OSString/OSSymbol       -> str
+			OSNumber                -> int
+			OSBoolean               -> bool
+			OSData                  -> bytes
+		and None for other classes or objects that couldn't be read.
+		Objects referenced from several places are the same IOKitObject,
+		so the graph may contain cycles
+	'''
 
-	if iokit_type == 'OSDictionary':
-		# loop through this OSDictionary
-		print(' '*level + '{')
-		dict_count = iokit_object.get('count').int_value
-		dict_ptr = iokit_object.get('dictionary').int_value
+	def __init__(self: Self, address: int, class_name: str):
+		self.address = address
+		self.class_name = class_name
+		self.value: Any = None
 
-		for i in range(dict_count):
-			key_ptr = read_u64(dict_ptr)
-			value_ptr = read_u64(dict_ptr + 8)
+	def __repr__(self: Self) -> str:
+		return f'{self.class_name or "<unknow>"}({self.address:#x})'
 
-			print(' '*(level + 1), end='')
-			iokit_print(key_ptr, level=level+1)
-			print(' : ', end='')
-			iokit_print(value_ptr, level=level+1)
-			print('')
+	def to_json(self: Self, path: Optional[Set[int]] = None) -> Any:
+		'''
+			Plain JSON value of the object, a reference back to a container
+			that is still being exported becomes {"$ref": "<address>"}
+		'''
+		if self.class_name in ('OSDictionary', 'OSArray', 'OSOrderedSet', 'OSSet') and self.value != None:
+			path = path if path != None else set()
+			if self.address in path:
+				return {'$ref': hex(self.address)}
+
+			path.add(self.address)
+			if self.class_name == 'OSDictionary':
+				out = {key: value.to_json(path) for key, value in self.value.items()}
+			else:
+				out = [value.to_json(path) for value in self.value]
+			path.discard(self.address)
+			return out
 
-			dict_ptr += 0x10
-		
+		if self.class_name == 'OSData' and self.value != None:
+			return self.value.hex()
+
+		if self.class_name in IOKIT_OBJECTS and self.value != None:
+			return self.value
+
+		return {'class': self.class_name or '<unknow>', 'address': hex(self.address)}
+
+class IOKitDecoder(object):
+	'''
+		Decode libkern objects graph breadth first: every level costs one clustered
+		read for vtables, one per class for object structs and one per backing
+		array/string/data buffer. Objects are memoized by address for the stop
+	'''
+
+	def __init__(self: Self, max_objects: int = 0x10000, max_data_size: int = 0x1000):
+		self.stop_id = get_stop_id()
+		self.max_objects = max_objects
+		self.max_data_size = max_data_size
+		self.objects: Dict[int, IOKitObject] = {}
+		self.pointer_size = get_pointer_size()
+		self.fields: Dict[str, Dict[str, Tuple[int, int]]] = {}
+		self.sizes: Dict[str, int] = {}
+
+	def class_fields(self: Self, class_name: str) -> Dict[str, Tuple[int, int]]:
+		if class_name not in self.fields:
+			sb_type = get_type(class_name)
+			self.fields[class_name] = {name: find_field_bits(sb_type, name) for name in IOKIT_OBJECT_FIELDS[class_name]}
+			self.sizes[class_name] = max(sum(field) for field in self.fields[class_name].values()) // 8
+
+		return self.fields[class_name]
+
+	def read_pointers(self: Self, address: int, count: int) -> List[int]:
+		try:
+			data = read_mem(address, count * self.pointer_size)
+		except LLDBMemoryException:
+			return []
+
+		return [
+			int.from_bytes(data[i:i + self.pointer_size], byteorder='little')
+			for i in range(0, len(data) - self.pointer_size + 1, self.pointer_size)
+		]
+
+	def decode(self: Self, address: int) -> IOKitObject:
+		if address in self.objects:
+			return self.objects[address]
+
+		# (object, child addresses) of containers, linked once all levels are read
+		containers: List[Tuple[IOKitObject, List[int]]] = []
+		pending = [address]
+		# max_objects bounds each call, objects memoized by earlier calls are free
+		budget = self.max_objects
+		truncated = False
+		while pending:
+			new_addrs = [addr for addr in dict.fromkeys(pending) if addr not in self.objects]
+			pending = []
+			if len(new_addrs) > budget:
+				truncated = True
+				new_addrs = new_addrs[:budget]
+			budget -= len(new_addrs)
+
+			vtables = read_structs(new_addrs, self.pointer_size)
+			by_class: Dict[str, List[IOKitObject]] = {}
+			for addr in new_addrs:
+				vtable = vtables.get(addr)
+				class_name = iokit_class_from_vtable(int.from_bytes(vtable, byteorder='little')) if vtable else ''
+				iokit_object = IOKitObject(addr, class_name)
+				self.objects[addr] = iokit_object
+				if class_name in IOKIT_OBJECT_FIELDS:
+					by_class.setdefault(class_name, []).append(iokit_object)
+
+			strings: List[Tuple[IOKitObject, int, int]] = []
+			for class_name, iokit_objects in by_class.items():
+				fields = self.class_fields(class_name)
+				structs = read_structs([obj.address for obj in iokit_objects], self.sizes[class_name])
+				for obj in iokit_objects:
+					data = structs.get(obj.address)
+					if data == None:
+						continue
+
+					values = {name: unpack_field(data, 0, field) for name, field in fields.items()}
+					if class_name in ('OSArray', 'OSOrderedSet'):
+						children = self.read_pointers(values['array'], values['count']) if values['array'] else []
+						containers.append((obj, children))
+						pending.extend(children)
+
+					elif class_name == 'OSDictionary':
+						children = self.read_pointers(values['dictionary'], 2 * values['count']) if values['dictionary'] else []
+						containers.append((obj, children))
+						pending.extend(children)
+
+					elif class_name == 'OSSet':
+						# members are kept in an OSArray
+						children = [values['members']] if values['members'] else []
+						containers.append((obj, children))
+						pending.extend(children)
+
+					elif class_name in ('OSString', 'OSSymbol'):
+						strings.append((obj, values['string'], values['length']))
+
+					elif class_name == 'OSData':
+						size = min(values['length'], self.max_data_size)
+						try:
+							obj.value = read_mem(values['data'], size) if values['data'] and size else b''
+						except LLDBMemoryException:
+							pass
+
+					elif class_name == 'OSNumber':
+						obj.value = values['value']
+						if 0 < values['size'] < 64:
+							obj.value &= (1 << values['size']) - 1
+
+					elif class_name == 'OSBoolean':
+						obj.value = bool(values['value'])
+
+			if strings:
+				max_size = min(max(length for _, _, length in strings), self.max_data_size) + 1
+				cstrings = read_cstrings([string for _, string, _ in strings], max_size)
+				for obj, string, _ in strings:
+					obj.value = cstrings.get(string)
+
+		root = self.objects[address]
+
+		for obj, children in containers:
+			if obj.class_name == 'OSSet':
+				continue
+
+			if obj.class_name == 'OSDictionary':
+				obj.value = {}
+				for i in range(0, len(children) - 1, 2):
+					key = self.objects.get(children[i])
+					value = self.objects.get(children[i + 1])
+					if key == None or value == None:
+						continue
+					obj.value[key.value if isinstance(key.value, str) else repr(key)] = value
+
+			else:
+				obj.value = [self.objects[child] for child in children if child in self.objects]
+
+		# OSSet copies the members of its OSArray, linked above whatever level it was read at
+		for obj, children in containers:
+			if obj.class_name == 'OSSet':
+				members = self.objects.get(children[0]) if children else None
+				obj.value = list(members.value) if members != None and members.value != None else []
+
+		if truncated:
+			print(f'[!] Decoded {self.max_objects} objects from {hex(address)}, the rest is left out')
+			# containers may miss children, decode them again next time
+			for obj, _ in containers:
+				self.objects.pop(obj.address, None)
+
+		return root
+
+IOKIT_DECODER: Optional[IOKitDecoder] = None
+
+def get_iokit_decoder() -> IOKitDecoder:
+	'''
+		Return the IOKit decoder of the current stop
+	'''
+	global IOKIT_DECODER
+
+	if IOKIT_DECODER == None or IOKIT_DECODER.stop_id != get_stop_id():
+		IOKIT_DECODER = IOKitDecoder()
+
+	return IOKIT_DECODER
+
+def iokit_decode(object_address: int) -> IOKitObject:
+	return get_iokit_decoder().decode(object_address)
+
+def iokit_print_object(iokit_object: IOKitObject, level: int, path: Set[int]):
+	iokit_type = iokit_object.class_name
+	value = iokit_object.value
+	if value == None:
+		print(f'{iokit_type or "<unknow>"}({hex(iokit_object.address)})', end='')
+		return
+
+	if iokit_object.address in path:
+		print(f'<cycle {iokit_type}({hex(iokit_object.address)})>', end='')
+		return
+
+	if iokit_type == 'OSDictionary':
+		path.add(iokit_object.address)
+		print(' '*level + '{')
+		for key, item in value.items():
+			print(' '*(level + 1) + key + ' : ', end='')
+			iokit_print_object(item, level + 1, path)
+			print('')
 		print(' '*level + '}', end='')
+		path.discard(iokit_object.address)
 
-	elif iokit_type == 'OSArray':
+	elif iokit_type in ('OSArray', 'OSOrderedSet', 'OSSet'):
+		path.add(iokit_object.address)
 		print(' '*level + '[')
-		array_count = iokit_object.get('count').int_value
-		array_ptr   = iokit_object.get('array').int_value
-
-		for _ in range(array_count):
-			value_addr = read_u64(array_ptr)
-			print(' '*(level + 1))
-			iokit_print(value_addr, level=level+1)
+		for item in value:
+			print(' '*(level + 1), end='')
+			iokit_print_object(item, level + 1, path)
 			print(',')
-			array_ptr += 8
+		print(' '*level + ']', end='')
+		path.discard(iokit_object.address)
+
+	elif iokit_type == 'OSSymbol':
+		print(value, end='')
+
+	elif iokit_type == 'OSString':
+		print(f'"{value}"', end='')
 
-	elif iokit_type == 'OSSet':
-		# unimplemented
-		print(f'OSSet({hex(object_address)})', end='')
-	
-	elif iokit_type == 'OSOrderedSet':
-		# unimplemented
-		print(f'OSOrderedSet({hex(object_address)})', end='')
-
-	elif iokit_type == 'OSString' or iokit_type == 'OSSymbol':
-		string_value = iokit_object.get('string').str_value
-		if iokit_type == 'OSSymbol':
-			print(string_value, end='')
-		else:
-			print(f'"{string_value}"', end='')
-	
-	elif iokit_type == 'OSNumber':
-		number_value = iokit_object.get('value').int_value
-		print(number_value, end='')
-	
 	elif iokit_type == 'OSData':
-		# unimplemented
-		print(f'OSData({hex(object_address)})', end='')
-	
+		print(f'<{value.hex()}>', end='')
+
 	elif iokit_type == 'OSBoolean':
-		boolean_value = iokit_object.get('value').int_value
-		if boolean_value:
-			print('true', end='')
-		else:
-			print('false', end='')
-	
-	if level == 0:
-		print("") # add newline
+		print('true' if value else 'false', end='')
+
+	else:
+		print(value, end='')
+
+def iokit_print(object_address : int):
+	iokit_object = iokit_decode(object_address)
+	if iokit_object.class_name not in IOKIT_OBJECTS:
+		print(f'[!] Unable to detect iokit object at address {hex(object_address)}')
+		return
 
+	print(f'({iokit_object.class_name} *){hex(object_address)} : ', end='')
+	iokit_print_object(iokit_object, 0, set())
+	print("") # add newline